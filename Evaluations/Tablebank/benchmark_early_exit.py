@@ -0,0 +1,118 @@
+"""
+Latency and accuracy of the cascade early exit (Table Structure Recognition/cascade_exit.py).
+
+The box-only model is evaluated once with all three cascade stages and once for every given exit score, with the
+per-table precision and recall of evaluation.py (see compare_precision.py). For every run the F1 score, the seconds
+per image and the share of pages which exited after each stage is printed. Every run is preceded by untimed warm-up
+inferences, such that the CUDA kernel selection and allocations of the first images don't count.
+
+python benchmark_early_exit.py -co cascade_mask_rcnn_hrnetv2p_w32_20e.py -c epoch_36.pth \
+    -a word_test.json -i tablebank_word/ --scores 0.9 0.95 0.98
+"""
+import argparse
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from mmdet.apis import init_detector
+
+from compare_precision import load_ground_truth, score_tables
+
+from cascade_exit import EarlyExit  # noqa: E402 (compare_precision adds Table Structure Recognition to the path)
+from detection_result import DetectionResult  # noqa: E402
+from detector import disable_masks, inference_detector_early_exit  # noqa: E402
+
+WARMUP_RUNS_DEFAULT: int = 3
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the early exit of the cascade.")
+    parser.add_argument("-c", "--checkpoint", help="Checkpoint of the model.", type=str, required=True)
+    parser.add_argument("-co", "--config", help="Config of the model.", type=str, required=True)
+    parser.add_argument("-a", "--annotations", help="TableBank test json, e.g. word_test.json.", type=str,
+                        required=True)
+    parser.add_argument("-i", "--images", help="Folder with the test images of the json.", type=str, required=True)
+    parser.add_argument("-d", "--device", help="Torch device the model is loaded onto.", type=str, default="cuda:0")
+    parser.add_argument("--scores", help="Exit scores (EarlyExit.min_score) to benchmark.", type=float, nargs="+",
+                        default=[0.9, 0.95, 0.98])
+    parser.add_argument("--shift", help="Maximum relative box shift (EarlyExit.max_shift).", type=float,
+                        default=EarlyExit.max_shift)
+    parser.add_argument("--limit", help="Evaluate only the first images of the json.", type=int, default=None)
+    parser.add_argument("--warmup", help="Untimed inferences before every run.", type=int,
+                        default=WARMUP_RUNS_DEFAULT)
+    return parser.parse_args()
+
+
+def warm_up(model, images: List[Tuple[str, List[List[float]]]], early_exit: Optional[EarlyExit], runs: int):
+    """
+    Runs the inference of the run on the first images without timing it.
+    """
+    warmup_images: List[np.ndarray] = []
+    for image_filepath, _ in images:
+        if len(warmup_images) == runs:
+            break
+        image = cv2.imread(image_filepath)
+        if image is not None:
+            warmup_images.append(image)
+    for index in range(runs if len(warmup_images) != 0 else 0):
+        inference_detector_early_exit(model, warmup_images[index % len(warmup_images)], early_exit)
+
+
+def evaluate(model, images: List[Tuple[str, List[List[float]]]], early_exit: Optional[EarlyExit]) -> Dict:
+    """
+    Returns: precision, recall, f1, seconds per image and the number of pages per exit stage
+    """
+    precisions: List[float] = []
+    recalls: List[float] = []
+    stages: Dict[int, int] = {}
+    seconds: float = 0
+    for image_filepath, ground_truth in images:
+        image = cv2.imread(image_filepath)
+        if image is None:
+            continue
+        start: float = time.perf_counter()
+        # without an early exit all stages run, on the same code path
+        result, stage = inference_detector_early_exit(model, image, early_exit)
+        seconds += time.perf_counter() - start
+        stages[stage] = stages.get(stage, 0) + 1
+        detections: DetectionResult = DetectionResult.from_mmdet(result)
+        table_precisions, table_recalls = score_tables(
+            np.concatenate([detections.bordered_tables(), detections.borderless_tables()]), ground_truth)
+        precisions.extend(table_precisions)
+        recalls.extend(table_recalls)
+    pages: int = max(1, sum(stages.values()))
+    precision: float = sum(precisions) / max(1, len(precisions))
+    recall: float = sum(recalls) / max(1, len(recalls))
+    f1: float = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1, "seconds_per_image": seconds / pages,
+            "stages": {stage: count / pages for stage, count in sorted(stages.items())}}
+
+
+def main(checkpoint_filepath: str, config_filepath: str, annotations_filepath: str, images_filepath: str,
+         device: str, exit_scores: List[float], max_shift: float, limit: Optional[int],
+         warmup_runs: int = WARMUP_RUNS_DEFAULT):
+    images: List[Tuple[str, List[List[float]]]] = load_ground_truth(annotations_filepath, images_filepath, limit)
+    model = init_detector(config_filepath, checkpoint_filepath, device=device)
+    disable_masks(model)
+    runs: Dict[str, Optional[EarlyExit]] = {"all stages": None}
+    for exit_score in exit_scores:
+        runs["exit >= " + str(exit_score)] = EarlyExit(min_score=exit_score, max_shift=max_shift)
+
+    reference: Optional[Dict] = None
+    print("{:<14} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8}  {}".format("", "precision", "recall", "f1", "f1 drop",
+                                                                         "s/image", "speedup", "exit stages"))
+    for name, early_exit in runs.items():
+        warm_up(model, images, early_exit, warmup_runs)
+        metric: Dict = evaluate(model, images, early_exit)
+        reference = reference or metric
+        print("{:<14} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.3f} {:>8.2f}  {}".format(
+            name, metric["precision"], metric["recall"], metric["f1"], reference["f1"] - metric["f1"],
+            metric["seconds_per_image"], reference["seconds_per_image"] / max(1e-9, metric["seconds_per_image"]),
+            ", ".join("{}: {:.0%}".format(stage, share) for stage, share in metric["stages"].items())))
+
+
+if __name__ == "__main__":
+    args: argparse.Namespace = parse_arguments()
+    main(args.checkpoint, args.config, args.annotations, args.images, args.device, args.scores, args.shift,
+         args.limit, args.warmup)
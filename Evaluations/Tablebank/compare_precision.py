@@ -0,0 +1,147 @@
+"""
+Accuracy gate for the inference precision profiles of Table Structure Recognition/precision.py.
+
+Every profile is evaluated on a TableBank test json (word_test.json, latex_test.json or any other COCO-style table
+annotation, e.g. ICDAR 2013 converted to COCO) with the per-table precision and recall of evaluation.py: every
+detected table is matched to the closest ground truth table and scored by the intersection area. Ground truth tables
+which aren't matched by any detection count with a recall of 0. The line correction of evaluation.py is left out, it
+doesn't depend on the precision of the model.
+
+python compare_precision.py -co cascade_mask_rcnn_hrnetv2p_w32_20e.py -c epoch_36.pth \
+    -a word_test.json -i tablebank_word/ -p fp32 int8 bf16
+
+The script exits with 1 if the F1 score of a profile drops more than --maxF1Drop below fp32.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from mmdet.apis import inference_detector, init_detector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Table Structure Recognition"))
+
+from detection_result import DetectionResult  # noqa: E402
+from precision import PRECISION_FP32, PRECISIONS, apply_precision  # noqa: E402
+
+MAX_F1_DROP_DEFAULT: float = 0.005
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare the accuracy of the precision profiles with fp32.")
+    parser.add_argument("-c", "--checkpoint", help="Checkpoint of the model.", type=str, required=True)
+    parser.add_argument("-co", "--config", help="Config of the model.", type=str, required=True)
+    parser.add_argument("-a", "--annotations", help="TableBank test json, e.g. word_test.json.", type=str,
+                        required=True)
+    parser.add_argument("-i", "--images", help="Folder with the test images of the json.", type=str, required=True)
+    parser.add_argument("-p", "--precisions", help="Profiles to compare with fp32.", nargs="+", choices=PRECISIONS,
+                        default=list(PRECISIONS))
+    parser.add_argument("--limit", help="Evaluate only the first images of the json.", type=int, default=None)
+    parser.add_argument("--maxF1Drop", help="Maximum F1 drop of a profile compared to fp32.", type=float,
+                        default=MAX_F1_DROP_DEFAULT)
+    return parser.parse_args()
+
+
+def load_ground_truth(annotations_filepath: str, images_filepath: str,
+                      limit: Optional[int] = None) -> List[Tuple[str, List[List[float]]]]:
+    """
+    Returns: every image with its ground truth tables [x1, y1, x2, y2]
+    """
+    with open(annotations_filepath) as file:
+        data: dict = json.load(file)
+    tables: Dict[int, List[List[float]]] = {}
+    for annotation in data['annotations']:
+        x, y, width, height = annotation['bbox']
+        tables.setdefault(annotation['image_id'], []).append([x, y, x + width, y + height])
+    images: List[dict] = data['images'][:limit]
+    return [(os.path.join(images_filepath, image['file_name']), tables.get(image['id'], [])) for image in images]
+
+
+def score_tables(detected: np.ndarray, ground_truth: List[List[float]]) -> Tuple[List[float], List[float]]:
+    """
+    Returns: the precision of every detected table and the recall of every detected table plus a recall of 0 for every
+    ground truth table which isn't the closest table of any detection, see bb_intersection_over_union of evaluation.py
+    """
+    if len(ground_truth) == 0:
+        return [0.0] * len(detected), [0.0] * len(detected)
+    precisions: List[float] = []
+    recalls: List[float] = []
+    matched: set = set()
+    for table in detected:
+        index: int = min(range(len(ground_truth)), key=lambda gt_index: np.linalg.norm(
+            (table[0] - ground_truth[gt_index][0], table[1] - ground_truth[gt_index][1])))
+        matched.add(index)
+        closest: List[float] = ground_truth[index]
+        intersection: float = max(0, min(table[2], closest[2]) - max(table[0], closest[0]) + 1) * \
+            max(0, min(table[3], closest[3]) - max(table[1], closest[1]) + 1)
+        detected_area: float = (table[2] - table[0] + 1) * (table[3] - table[1] + 1)
+        ground_truth_area: float = (closest[2] - closest[0] + 1) * (closest[3] - closest[1] + 1)
+        precisions.append(intersection / detected_area)
+        recalls.append(intersection / ground_truth_area)
+    # missed tables lower the recall, otherwise a profile which drops tables would pass the gate
+    recalls.extend(0.0 for index in range(len(ground_truth)) if index not in matched)
+    return precisions, recalls
+
+
+def evaluate(model, images: List[Tuple[str, List[List[float]]]]) -> Dict[str, float]:
+    """
+    Returns: precision averaged over the detected tables, recall averaged over the detected and missed tables, f1
+    and the seconds per image
+    """
+    precisions: List[float] = []
+    recalls: List[float] = []
+    seconds: float = 0
+    evaluated: int = 0
+    for image_filepath, ground_truth in images:
+        image = cv2.imread(image_filepath)
+        if image is None:
+            print("Couldn't decode image [" + image_filepath + "], skipped.")
+            continue
+        start: float = time.perf_counter()
+        result = inference_detector(model, image)
+        seconds += time.perf_counter() - start
+        evaluated += 1
+        detections: DetectionResult = DetectionResult.from_mmdet(result)
+        tables: np.ndarray = np.concatenate([detections.bordered_tables(), detections.borderless_tables()])
+        table_precisions, table_recalls = score_tables(tables, ground_truth)
+        precisions.extend(table_precisions)
+        recalls.extend(table_recalls)
+    precision: float = sum(precisions) / max(1, len(precisions))
+    recall: float = sum(recalls) / max(1, len(recalls))
+    f1: float = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1, "tables": len(precisions),
+            "seconds_per_image": seconds / max(1, evaluated)}
+
+
+def main(checkpoint_filepath: str, config_filepath: str, annotations_filepath: str, images_filepath: str,
+         precisions: List[str], limit: Optional[int], max_f1_drop: float) -> bool:
+    images: List[Tuple[str, List[List[float]]]] = load_ground_truth(annotations_filepath, images_filepath, limit)
+    metrics: Dict[str, Dict[str, float]] = {}
+    for precision in [PRECISION_FP32] + [precision for precision in precisions if precision != PRECISION_FP32]:
+        # every profile starts from a freshly loaded fp32 model, int8 converts the model in place
+        model = apply_precision(init_detector(config_filepath, checkpoint_filepath, device="cpu"), precision)
+        metrics[precision] = evaluate(model, images)
+        del model
+
+    reference: Dict[str, float] = metrics[PRECISION_FP32]
+    passed: bool = True
+    print("{:<6} {:>10} {:>10} {:>10} {:>10} {:>8} {:>12}".format("", "precision", "recall", "f1", "f1 drop",
+                                                                    "tables", "s/image"))
+    for precision, metric in metrics.items():
+        f1_drop: float = reference["f1"] - metric["f1"]
+        profile_passed: bool = f1_drop <= max_f1_drop
+        passed = passed and profile_passed
+        print("{:<6} {:>10.4f} {:>10.4f} {:>10.4f} {:>10.4f} {:>8} {:>12.3f} {}".format(
+            precision, metric["precision"], metric["recall"], metric["f1"], f1_drop, metric["tables"],
+            metric["seconds_per_image"], "" if profile_passed else "FAILED"))
+    return passed
+
+
+if __name__ == "__main__":
+    args: argparse.Namespace = parse_arguments()
+    sys.exit(0 if main(args.checkpoint, args.config, args.annotations, args.images, args.precisions, args.limit,
+                       args.maxF1Drop) else 1)
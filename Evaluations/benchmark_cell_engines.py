@@ -0,0 +1,148 @@
+"""
+Runtime and equivalence of the cell formation engines of extract_table (Functions/borderFunc.py CELL_ENGINES).
+
+Every engine runs its whole path from the image of a bordered table: the intersection engines (lattice, legacy) detect
+the lines with line_detection and intersect them, the raster engine computes the line mask and its connected
+components. The engines are compared on rendered regular grids, e.g. 50x20 rows and columns, and optionally on a folder
+of bordered table images:
+- lattice has to form the same cells in the same order as the original cell formation (legacy)
+- raster has to form a cell within RASTER_SNAP_DISTANCE of every legacy cell, its edges lie on the line centers instead
+  of the Hough segments
+On tables with column spans the engines differ: lattice keeps the spanning cell, legacy drops it together with the cell
+below it (see form_cells_lattice). Images with differences are listed.
+
+python benchmark_cell_engines.py --grids 10x5 50x20 100x40 -i bordered_tables/
+
+The script exits with 1 if an engine differs from legacy on a rendered grid.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Table Structure Recognition"))
+
+from Functions.borderFunc import CELL_ENGINE_LEGACY, CELL_ENGINE_RASTER, CELL_ENGINES, CELL_FORMATIONS, \
+    RASTER_SNAP_DISTANCE, form_cells_raster, intersection_points  # noqa: E402
+from Functions.line_detection import binarize, line_detection, line_mask  # noqa: E402
+
+# size of the rendered cells and the margin around the grid in pixels
+CELL_WIDTH: int = 80
+CELL_HEIGHT: int = 30
+MARGIN: int = 20
+LINE_THICKNESS: int = 2
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the cell formation engines of extract_table.")
+    parser.add_argument("--grids", help="Rendered grids as ROWSxCOLUMNS, e.g. 50x20.", type=parse_grid, nargs="*",
+                        default=[(10, 5), (50, 20), (100, 40)])
+    parser.add_argument("-i", "--images", help="Folder with images of bordered tables.", type=str, default=None)
+    parser.add_argument("-r", "--repeats", help="Runs of every engine per grid or image.", type=int, default=5)
+    return parser.parse_args()
+
+
+def parse_grid(value: str) -> Tuple[int, int]:
+    rows, _, columns = value.partition("x")
+    return int(rows), int(columns)
+
+
+def render_grid(rows: int, columns: int) -> np.ndarray:
+    """
+    Returns: white image with a regular black table grid
+    """
+    width: int = columns * CELL_WIDTH
+    height: int = rows * CELL_HEIGHT
+    image: np.ndarray = np.full((height + 2 * MARGIN, width + 2 * MARGIN, 3), 255, dtype=np.uint8)
+    for row in range(rows + 1):
+        y: int = MARGIN + row * CELL_HEIGHT
+        cv2.line(image, (MARGIN, y), (MARGIN + width, y), (0, 0, 0), LINE_THICKNESS)
+    for column in range(columns + 1):
+        x: int = MARGIN + column * CELL_WIDTH
+        cv2.line(image, (x, MARGIN), (x, MARGIN + height), (0, 0, 0), LINE_THICKNESS)
+    return image
+
+
+def engine_cells(engine: str, image: np.ndarray) -> List[List]:
+    """
+    Returns: the cells of extract_table(image, 1, engine=engine), without its error handling and output
+    """
+    if engine == CELL_ENGINE_RASTER:
+        return form_cells_raster(line_mask(binarize(image)))
+    hor, ver = line_detection(image)
+    if hor is None or ver is None:
+        return []
+    return CELL_FORMATIONS[engine](intersection_points(ver, hor))
+
+
+def matches_legacy(engine: str, cells: List[List], legacy: List[List]) -> bool:
+    if engine != CELL_ENGINE_RASTER:
+        return cells == legacy
+    if len(cells) != len(legacy):
+        return False
+    if len(cells) == 0:
+        return True
+    raster: np.ndarray = np.array(cells, dtype=np.int64)
+    return all(bool((np.abs(raster - np.array(cell, dtype=np.int64)).max(axis=1) <= RASTER_SNAP_DISTANCE).any())
+               for cell in legacy)
+
+
+def time_engines(image: np.ndarray, repeats: int) -> Tuple[Dict[str, float], Dict[str, List[List]]]:
+    """
+    Returns: the best seconds of every engine and its cells
+    """
+    seconds: Dict[str, float] = {}
+    cells: Dict[str, List[List]] = {}
+    for engine in CELL_ENGINES:
+        for _ in range(repeats):
+            start: float = time.perf_counter()
+            cells[engine] = engine_cells(engine, image)
+            seconds[engine] = min(seconds.get(engine, float("inf")), time.perf_counter() - start)
+    return seconds, cells
+
+
+def compare(name: str, image: np.ndarray, repeats: int) -> Tuple[Dict[str, float], Dict[str, bool]]:
+    """
+    Returns: the seconds of every engine and whether its cells match legacy, printed as one row
+    """
+    seconds, cells = time_engines(image, repeats)
+    matches: Dict[str, bool] = {engine: matches_legacy(engine, cells[engine], cells[CELL_ENGINE_LEGACY])
+                                for engine in CELL_ENGINES}
+    print("{:<24} {}".format(name, "  ".join(
+        "{}: {:>9.5f}s {:>6} cells {:<9}".format(engine, seconds[engine], len(cells[engine]),
+                                                  "" if matches[engine] else "DIFFERENT")
+        for engine in CELL_ENGINES)))
+    return seconds, matches
+
+
+def main(grids: List[Tuple[int, int]], images_filepath: Optional[str], repeats: int) -> bool:
+    equivalent: bool = True
+    for rows, columns in grids:
+        _, matches = compare("grid " + str(rows) + "x" + str(columns), render_grid(rows, columns), repeats)
+        equivalent = equivalent and all(matches.values())
+
+    if images_filepath is None:
+        return equivalent
+    total: Dict[str, float] = {engine: 0 for engine in CELL_ENGINES}
+    different: Dict[str, int] = {engine: 0 for engine in CELL_ENGINES}
+    for filename in sorted(os.listdir(images_filepath)):
+        image = cv2.imread(os.path.join(images_filepath, filename))
+        if image is None:
+            continue
+        seconds, matches = compare(filename[:24], image, repeats)
+        for engine in CELL_ENGINES:
+            total[engine] += seconds[engine]
+            different[engine] += not matches[engine]
+    print("\n" + "  ".join("{}: {:.4f}s, {} images different from legacy".format(engine, total[engine],
+                                                                                 different[engine])
+                           for engine in CELL_ENGINES))
+    return equivalent
+
+
+if __name__ == "__main__":
+    args: argparse.Namespace = parse_arguments()
+    sys.exit(0 if main(args.grids, args.images, args.repeats) else 1)
@@ -0,0 +1,206 @@
+"""
+Sweeps the test_cfg of the CascadeTabNet model and the test img_scale over a labelled set and reports the Pareto front
+of per-page latency against table and cell F1.
+
+The labelled set is a COCO json like Data Preparation/generateVOC2JSON.py writes it (categories 1 Table, 2 cell,
+3 borderless). Detections above the production threshold are matched greedily by score to the ground truth of their
+class with an IoU of at least --iou. Bordered and borderless tables count as tables.
+
+Every Pareto optimal configuration is written as json file of config overrides, which can be passed to
+create_shared_file_format.py --cfgOptions or TableRecognizer(cfg_options=...).
+
+python tune_test_cfg.py -co cascade_mask_rcnn_hrnetv2p_w32_20e.py -c epoch_36.pth -a test.json -i test_images/ \
+    -o tuned/ --nmsPre 1000 500 300 --maxNum 1000 300 100 --maxPerImg 100 50 --scoreThr 0.05 0.3 \
+    --imgScale 1333x800 1024x640
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from mmdet.apis import inference_detector, init_detector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Table Structure Recognition"))
+
+from detection_result import CLASS_BORDERED, CLASS_BORDERLESS, CLASS_CELL, DetectionResult  # noqa: E402
+from detector import apply_cfg_options, disable_masks  # noqa: E402
+
+IOU_THRESHOLD_DEFAULT: float = 0.5
+# index of MultiScaleFlipAug in the test pipeline of the configs
+IMG_SCALE_KEY: str = "data.test.pipeline.1.img_scale"
+
+TABLE: str = "table"
+CELL: str = "cell"
+# COCO category id of generateVOC2JSON.py -> kind of object
+CATEGORIES: Dict[int, str] = {CLASS_BORDERED + 1: TABLE, CLASS_CELL + 1: CELL, CLASS_BORDERLESS + 1: TABLE}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sweep the test_cfg for a latency/accuracy Pareto front.")
+    parser.add_argument("-c", "--checkpoint", help="Checkpoint of the model.", type=str, required=True)
+    parser.add_argument("-co", "--config", help="Config of the model.", type=str, required=True)
+    parser.add_argument("-a", "--annotations", help="COCO json of the labelled set.", type=str, required=True)
+    parser.add_argument("-i", "--images", help="Folder with the images of the json.", type=str, required=True)
+    parser.add_argument("-o", "--output", help="Folder the Pareto optimal overrides are written to.", type=str,
+                        required=True)
+    parser.add_argument("-d", "--device", help="Torch device the model is loaded onto.", type=str, default="cuda:0")
+    parser.add_argument("--nmsPre", help="Values of test_cfg.rpn.nms_pre.", type=int, nargs="+", default=[1000])
+    parser.add_argument("--maxNum", help="Values of test_cfg.rpn.max_num (and nms_post).", type=int, nargs="+",
+                        default=[1000])
+    parser.add_argument("--maxPerImg", help="Values of test_cfg.rcnn.max_per_img.", type=int, nargs="+",
+                        default=[100])
+    parser.add_argument("--scoreThr", help="Values of test_cfg.rcnn.score_thr.", type=float, nargs="+",
+                        default=[0.05])
+    parser.add_argument("--imgScale", help="Test image scales as WIDTHxHEIGHT, e.g. 1333x800.", type=parse_img_scale,
+                        nargs="+", default=[(1333, 800)])
+    parser.add_argument("--iou", help="Minimum IoU of a true positive.", type=float, default=IOU_THRESHOLD_DEFAULT)
+    parser.add_argument("--limit", help="Evaluate only the first images of the json.", type=int, default=None)
+    return parser.parse_args()
+
+
+def parse_img_scale(value: str) -> Tuple[int, int]:
+    width, _, height = value.partition("x")
+    return int(width), int(height)
+
+
+def load_labelled_set(annotations_filepath: str, images_filepath: str,
+                      limit: Optional[int] = None) -> List[Tuple[str, Dict[str, np.ndarray]]]:
+    """
+    Returns: every image with its ground truth boxes [x1, y1, x2, y2] per kind (table, cell)
+    """
+    with open(annotations_filepath) as file:
+        data: dict = json.load(file)
+    boxes: Dict[int, Dict[str, list]] = {}
+    for annotation in data['annotations']:
+        kind: Optional[str] = CATEGORIES.get(annotation['category_id'])
+        if kind is None:
+            continue
+        x, y, width, height = annotation['bbox']
+        boxes.setdefault(annotation['image_id'], {TABLE: [], CELL: []})[kind].append([x, y, x + width, y + height])
+    labelled: List[Tuple[str, Dict[str, np.ndarray]]] = []
+    for image in data['images'][:limit]:
+        image_boxes: Dict[str, list] = boxes.get(image['id'], {TABLE: [], CELL: []})
+        labelled.append((os.path.join(images_filepath, image['file_name']),
+                         {kind: np.array(kind_boxes, dtype=float).reshape(-1, 4)
+                          for kind, kind_boxes in image_boxes.items()}))
+    return labelled
+
+
+def iou_matrix(boxes: np.ndarray, other: np.ndarray) -> np.ndarray:
+    """
+    Returns: [N, M] intersection over union of all pairs of boxes
+    """
+    top_left: np.ndarray = np.maximum(boxes[:, None, :2], other[None, :, :2])
+    bottom_right: np.ndarray = np.minimum(boxes[:, None, 2:], other[None, :, 2:])
+    intersection: np.ndarray = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    areas: np.ndarray = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    other_areas: np.ndarray = np.prod(other[:, 2:] - other[:, :2], axis=1)
+    return intersection / np.maximum(areas[:, None] + other_areas[None, :] - intersection, 1e-9)
+
+
+def count_matches(detected: np.ndarray, scores: np.ndarray, ground_truth: np.ndarray, iou_threshold: float) -> int:
+    """
+    Returns: number of true positives, every ground truth box is matched at most once, highest scores first
+    """
+    if len(detected) == 0 or len(ground_truth) == 0:
+        return 0
+    ious: np.ndarray = iou_matrix(detected[np.argsort(-scores, kind="stable")], ground_truth)
+    matched: np.ndarray = np.zeros(len(ground_truth), dtype=bool)
+    true_positives: int = 0
+    for row in ious:
+        row = np.where(matched, 0, row)
+        best: int = int(row.argmax())
+        if row[best] >= iou_threshold:
+            matched[best] = True
+            true_positives += 1
+    return true_positives
+
+
+def f1_score(true_positives: int, detected: int, ground_truth: int) -> float:
+    if detected + ground_truth == 0:
+        return 1.0
+    return 2 * true_positives / (detected + ground_truth)
+
+
+def evaluate(model, labelled: List[Tuple[str, Dict[str, np.ndarray]]], iou_threshold: float) -> Dict[str, float]:
+    """
+    Returns: seconds per page and the F1 score of tables and cells
+    """
+    counts: Dict[str, List[int]] = {TABLE: [0, 0, 0], CELL: [0, 0, 0]}
+    seconds: float = 0
+    pages: int = 0
+    for image_filepath, ground_truth in labelled:
+        image = cv2.imread(image_filepath)
+        if image is None:
+            continue
+        start: float = time.perf_counter()
+        result = inference_detector(model, image)
+        seconds += time.perf_counter() - start
+        pages += 1
+        detections: DetectionResult = DetectionResult.from_mmdet(result)
+        masks: Dict[str, np.ndarray] = {TABLE: detections.mask(CLASS_BORDERED) | detections.mask(CLASS_BORDERLESS),
+                                        CELL: detections.mask(CLASS_CELL)}
+        for kind, mask in masks.items():
+            counts[kind][0] += count_matches(detections.boxes[mask], detections.scores[mask], ground_truth[kind],
+                                             iou_threshold)
+            counts[kind][1] += int(np.count_nonzero(mask))
+            counts[kind][2] += len(ground_truth[kind])
+    return {"seconds_per_page": seconds / max(1, pages), "table_f1": f1_score(*counts[TABLE]),
+            "cell_f1": f1_score(*counts[CELL])}
+
+
+def pareto_front(runs: List[Tuple[Dict[str, Any], Dict[str, float]]]) -> List[Tuple[Dict[str, Any], Dict[str, float]]]:
+    """
+    Returns: the runs no other run beats in latency, table F1 and cell F1 at the same time
+    """
+    def dominates(metric: Dict[str, float], other: Dict[str, float]) -> bool:
+        better_or_equal: bool = metric["seconds_per_page"] <= other["seconds_per_page"] and \
+            metric["table_f1"] >= other["table_f1"] and metric["cell_f1"] >= other["cell_f1"]
+        return better_or_equal and metric != other
+
+    return [run for run in runs if not any(dominates(other[1], run[1]) for other in runs)]
+
+
+def main(checkpoint_filepath: str, config_filepath: str, annotations_filepath: str, images_filepath: str,
+         output_filepath: str, device: str, grid: Dict[str, list], iou_threshold: float, limit: Optional[int]):
+    labelled: List[Tuple[str, Dict[str, np.ndarray]]] = load_labelled_set(annotations_filepath, images_filepath,
+                                                                          limit)
+    model = init_detector(config_filepath, checkpoint_filepath, device=device)
+    # production runs box-only, the masks would only distort the latency
+    disable_masks(model)
+
+    runs: List[Tuple[Dict[str, Any], Dict[str, float]]] = []
+    for values in itertools.product(*grid.values()):
+        options: Dict[str, Any] = dict(zip(grid.keys(), values))
+        # nms_post caps the proposals of every level after the nms, it follows max_num
+        options["test_cfg.rpn.nms_post"] = options["test_cfg.rpn.max_num"]
+        apply_cfg_options(model, options)
+        metric: Dict[str, float] = evaluate(model, labelled, iou_threshold)
+        print(json.dumps(options), "->", json.dumps(metric))
+        runs.append((options, metric))
+
+    os.makedirs(output_filepath, exist_ok=True)
+    front: List[Tuple[Dict[str, Any], Dict[str, float]]] = sorted(pareto_front(runs),
+                                                                   key=lambda run: run[1]["seconds_per_page"])
+    print("\nPareto front:")
+    print("{:>10} {:>10} {:>10}  {}".format("s/page", "table f1", "cell f1", "overrides"))
+    for number, (options, metric) in enumerate(front):
+        filepath: str = os.path.join(output_filepath, "test_cfg_" + str(number) + ".json")
+        with open(filepath, "w") as file:
+            json.dump({key: list(value) if isinstance(value, tuple) else value for key, value in options.items()},
+                      file, indent=4)
+        print("{:>10.3f} {:>10.4f} {:>10.4f}  {}".format(metric["seconds_per_page"], metric["table_f1"],
+                                                         metric["cell_f1"], filepath))
+
+
+if __name__ == "__main__":
+    args: argparse.Namespace = parse_arguments()
+    main(args.checkpoint, args.config, args.annotations, args.images, args.output, args.device,
+         {"test_cfg.rpn.nms_pre": args.nmsPre, "test_cfg.rpn.max_num": args.maxNum,
+          "test_cfg.rcnn.max_per_img": args.maxPerImg, "test_cfg.rcnn.score_thr": args.scoreThr,
+          IMG_SCALE_KEY: args.imgScale}, args.iou, args.limit)
@@ -1,6 +1,6 @@
 import cv2
 import numpy as np
-from Functions.borderFunc import extract_table
+from Functions.borderFunc import CELL_ENGINE_LEGACY, extract_table
 from lxml import etree
 
 
@@ -31,7 +31,7 @@ def extract_text_bless(img):
     return return_arr
 
 
-def borderless(table, image, res_cells):
+def borderless(table, image, res_cells, engine: str = CELL_ENGINE_LEGACY):
     """
     Input : Roi of Table , Orignal Image, Cells Detected
     Output : Returns XML element which has contains bounding box of textchunks
@@ -39,6 +39,7 @@ def borderless(table, image, res_cells):
         table:
         image:
         res_cells:
+        engine: cell formation of extract_table, see Functions.borderFunc.CELL_ENGINES
 
     Returns:
 
@@ -214,7 +215,7 @@ def borderless(table, image, res_cells):
     #   cv2.line(im2,(r,table[1]),(r,table[3]),(0,255,0),1)
     # for c in col:
     #   cv2.line(im2,(c,table[1]),(c,table[3]),(0,255,0),1)
-    final = extract_table(image[table[1]:table[3], table[0]:table[2]], 0, (y_lines, x_lines))
+    final = extract_table(image[table[1]:table[3], table[0]:table[2]], 0, (y_lines, x_lines), engine)
 
     cellBoxes = []
     img4 = image.copy()
@@ -1,7 +1,23 @@
 import cv2
-from Functions.line_detection import line_detection
+import numpy as np
+from bisect import bisect_right
+from Functions.line_detection import binarize, line_detection, line_mask
 from loguru import logger
-from typing import Tuple, List, Optional
+from typing import Callable, Dict, Tuple, List, Optional
+
+# cell formation engines of extract_table, see form_cells_lattice for the differences
+CELL_ENGINE_LATTICE: str = "lattice"
+# the original cell formation of CascadeTabNet, the default
+CELL_ENGINE_LEGACY: str = "legacy"
+# connected components of the line mask, only for bordered tables
+CELL_ENGINE_RASTER: str = "raster"
+
+# edges of raster cells closer than this are snapped to one table line, like the tolerances of line_intersection
+RASTER_SNAP_DISTANCE: int = 8
+# components narrower or lower than this are gaps between double lines or noise, not cells
+RASTER_MIN_CELL_SIZE: int = 8
+# components which cover less of their bounding box are the ring between the table box and the outer table border
+RASTER_MIN_FILL: float = 0.8
 
 
 def line_intersection(x1, y1, x2, y2, x3, y3, x4, y4) -> Tuple[int, int]:
@@ -26,13 +42,44 @@ def line_intersection(x1, y1, x2, y2, x3, y3, x4, y4) -> Tuple[int, int]:
         return x1, y3
 
 
-def extract_table(table_body, __line__, lines=None) -> List[List]:
+def line_intersection_grid(lines_ver, lines_hor) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    line_intersection of every vertical with every horizontal line at once, with the same tolerances.
+    Args:
+        lines_ver: vertical lines [x1, y1, x2, y2]
+        lines_hor: horizontal lines [x3, y3, x4, y4]
+
+    Returns: intersection points [vertical, horizontal, (x, y)] and the mask [vertical, horizontal] of the pairs which
+    intersect. The point of a pair is only valid where the mask is set.
+    """
+    ver: np.ndarray = np.asarray(lines_ver, dtype=np.int64).reshape(-1, 4)
+    hor: np.ndarray = np.asarray(lines_hor, dtype=np.int64).reshape(-1, 4)
+    x1: np.ndarray = ver[:, 0, None]
+    y_min: np.ndarray = np.minimum(ver[:, 1], ver[:, 3])[:, None]
+    y_max: np.ndarray = np.maximum(ver[:, 1], ver[:, 3])[:, None]
+    x3, y3, x4 = hor[None, :, 0], hor[None, :, 1], hor[None, :, 2]
+    mask: np.ndarray = (x1 >= x3 - 5) & (x1 <= x4 + 5) & (y3 + 8 >= y_min) & (y3 <= y_max + 5)
+    points: np.ndarray = np.stack(np.broadcast_arrays(x1, y3), axis=2)
+    return points, mask
+
+
+def intersection_points(lines_ver, lines_hor) -> List[List[List]]:
+    """
+    Returns: intersection points [x, y] of every vertical line, in the order of the horizontal lines
+    """
+    intersections, intersects = line_intersection_grid(lines_ver, lines_hor)
+    return [[point for point, intersection in zip(row_points, row_mask) if intersection]
+            for row_points, row_mask in zip(intersections.tolist(), intersects.tolist())]
+
+
+def extract_table(table_body, __line__, lines=None, engine: str = CELL_ENGINE_LEGACY) -> List[List]:
     """
     Main extraction function
     Args:
         table_body: numpy image representation
         __line__: Decision parameter whether table is bordered or borderless. 0=borderless, 1=bordered
-        lines: lines for borderless table
+        lines: lines for borderless table, or the precomputed lines of a bordered table, e.g. of line_detection_roi
+        engine: cell formation, one of CELL_ENGINES. The raster engine ignores lines.
 
     Returns: Array of cells with structure:
     List[List[cell_coord_1_x, cell_coord2_y, ..., cell_coord_4_x, cell_coord_4_y]]
@@ -41,8 +88,12 @@ def extract_table(table_body, __line__, lines=None) -> List[List]:
     Returns the Cells Bounding boxes in a cell-bounding box manner.
     The bounding box is around the cell, NOT the cell content!
     """
+    if __line__ == 1 and engine == CELL_ENGINE_RASTER:
+        logger.debug("Forming the cells from the line mask.")
+        return form_cells_raster(line_mask(binarize(table_body)))
+
     # Deciding variable
-    if __line__ == 1:
+    if __line__ == 1 and lines is None:
         # Check if table image is  bordered or borderless
         logger.debug("Extracting bordered lines.")
         temp_lines_hor, temp_lines_ver = line_detection(table_body)
@@ -55,20 +106,9 @@ def extract_table(table_body, __line__, lines=None) -> List[List]:
         raise RuntimeError("Cant detect bordered table without lines.")
 
     # List of all Rows, each row with List of Columns, each Column with List of points
-    points: List[List[List]] = []
     print("[Table status] : Processing table with lines")
     logger.debug("[Table status] : Processing table with lines")
-
-    # Remove same lines detected closer
-    for x1, y1, x2, y2 in temp_lines_ver:
-        point: List[List] = []
-        for x3, y3, x4, y4 in temp_lines_hor:
-            try:
-                x, y = line_intersection(x1, y1, x2, y2, x3, y3, x4, y4)
-                point.append([x, y])
-            except:
-                continue
-        points.append(point)
+    points: List[List[List]] = intersection_points(temp_lines_ver, temp_lines_hor)
 
     # Visualization of the detected points
     # table = table_body.copy()
@@ -78,6 +118,70 @@ def extract_table(table_body, __line__, lines=None) -> List[List]:
     # cv2.imshow("intersection",table)
     # cv2.waitKey(0)
 
+    # the raster engine needs the drawn lines of a bordered table, borderless tables are formed like by default
+    cell_bboxes: List[List] = CELL_FORMATIONS.get(engine, form_cells_legacy)(points)
+
+    # Visualizing the cells
+    # table = table_body.copy()
+    # count = 1
+    # for i in cell_bboxes:
+    #     cv2.rectangle(table_body, (i[0], i[1]), (i[6], i[7]), (int(i[7]%255),0,int(i[0]%255)), 2)
+    # #     count+=1
+    # cv2.imshow("cells",table_body)
+    # cv2.waitKey(0)
+
+    return cell_bboxes
+
+
+# extract_table(cv2.imread("E:\\KSK\\KSK ML\\KSK PAPERS\\TabXNet\\For Git\\images\\table.PNG"),1,lines=None)
+
+
+def form_cells_lattice(points: List[List[List]]) -> List[List]:
+    """
+    Cell formation on the lattice of the intersection points.
+    Every pair of consecutive intersections of a vertical line is the left edge of a cell. The right edge lies on the
+    next vertical line which intersects both horizontal lines. The candidates are looked up by the y coordinate of the
+    top edge instead of scanning all open cells: the cost per cell is a bisect plus the vertical lines which intersect
+    the top but not the bottom horizontal line, i.e. the columns a cell spans. On grids without spans this is
+    O(n log n) in the number of intersections, wide column spans add the spanned lines.
+
+    On regular grids, row spans and grids with a missing outer border the cells are the same as of form_cells_legacy
+    and in the same order. Cells which span columns differ: the lattice forms the spanning cell, while
+    form_cells_legacy drops it together with the cells below it in the same column.
+    Args:
+        points: intersection points [x, y] of every vertical line, from top to bottom
+
+    Returns: cells [x1, y1, x2, y2, x3, y3, x4, y4] like extract_table returns them
+    """
+    # y coordinates of the intersections of every vertical line
+    line_ys: List[set] = [{point[1] for point in row} for row in points]
+    # y coordinate of a horizontal line -> indexes of the vertical lines intersecting it, ascending
+    lines_at: Dict[int, List[int]] = {}
+    for index, ys in enumerate(line_ys):
+        for y in ys:
+            lines_at.setdefault(y, []).append(index)
+
+    cell_bboxes: List[List] = []
+    for index, row in enumerate(points):
+        for (x, top), (_, bottom) in zip(row, row[1:]):
+            candidates: List[int] = lines_at[top]
+            for position in range(bisect_right(candidates, index), len(candidates)):
+                right: int = candidates[position]
+                if bottom in line_ys[right]:
+                    right_x = points[right][0][0]
+                    cell_bboxes.append([x, top, x, bottom, right_x, top, right_x, bottom])
+                    break
+    return cell_bboxes
+
+
+def form_cells_legacy(points: List[List[List]]) -> List[List]:
+    """
+    Original cell formation, every segment between two intersections of a vertical line scans the cache of open cells.
+    Args:
+        points: intersection points [x, y] of every vertical line, from top to bottom
+
+    Returns: cells [x1, y1, x2, y2, x3, y3, x4, y4] like extract_table returns them
+    """
     cell_bboxes: List[List] = []
     # each list elements looks like this: [cell_coord_1_x, cell_coord2_y, ..., cell_coord_4_x, cell_coord_4_y]
     cache: List[List] = []
@@ -156,19 +260,70 @@ def extract_table(table_body, __line__, lines=None) -> List[List]:
             logger.debug("Creating cache with current constructed cache with length: " + str(len(next_cache)))
             cache = next_cache
 
-    # Visualizing the cells
-    # table = table_body.copy()
-    # count = 1
-    # for i in cell_bboxes:
-    #     cv2.rectangle(table_body, (i[0], i[1]), (i[6], i[7]), (int(i[7]%255),0,int(i[0]%255)), 2)
-    # #     count+=1
-    # cv2.imshow("cells",table_body)
-    # cv2.waitKey(0)
-
     return cell_bboxes
 
 
-# extract_table(cv2.imread("E:\\KSK\\KSK ML\\KSK PAPERS\\TabXNet\\For Git\\images\\table.PNG"),1,lines=None)
+CELL_FORMATIONS: Dict[str, Callable[[List[List[List]]], List[List]]] = {CELL_ENGINE_LATTICE: form_cells_lattice,
+                                                                       CELL_ENGINE_LEGACY: form_cells_legacy}
+CELL_ENGINES: Tuple[str, ...] = tuple(CELL_FORMATIONS) + (CELL_ENGINE_RASTER,)
+
+
+def form_cells_raster(mask, offset: Tuple[int, int] = (0, 0),
+                      frame: Optional[Tuple[int, int, int, int]] = None) -> List[List]:
+    """
+    Cell formation from the connected components of the complement of the line mask. Neither the Hough segments nor
+    their intersections are needed, the runtime depends on the table area instead of the number of lines.
+    The mask is closed with the table box before the labelling, such that a table without an outer frame keeps its edge
+    cells, they end at the table box. The intersection engines drop these cells. Components which touch the border of
+    the mask lie outside of the table box, the ring between the box and the outer frame of a framed table doesn't
+    fill its bounding box (RASTER_MIN_FILL), both are dropped. The edges of the cells are snapped to the table lines,
+    neighbouring cells share their coordinates like the cells of the lattice.
+    Args:
+        mask: line_mask of the table, the lines are white
+        offset: page coordinates (x, y) of the top left corner of the mask
+        frame: table box (x1, y1, x2, y2) in mask coordinates, defaults to the border of the mask
+
+    Returns: cells [x1, y1, x2, y2, x3, y3, x4, y4] like extract_table returns them, from left to right and top to
+    bottom
+    """
+    height, width = mask.shape[:2]
+    x1, y1, x2, y2 = frame or (0, 0, width - 1, height - 1)
+    closed = mask.copy()
+    cv2.rectangle(closed, (max(0, x1), max(0, y1)), (min(width - 1, x2), min(height - 1, y2)), 255, 1)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(closed), connectivity=4)
+    boxes: List[Tuple[int, int, int, int]] = []
+    # label 0 are the line pixels themselves
+    for x, y, w, h, area in stats[1:].tolist():
+        if x == 0 or y == 0 or x + w == width or y + h == height:
+            continue
+        if area < RASTER_MIN_FILL * w * h:
+            continue
+        if w < RASTER_MIN_CELL_SIZE or h < RASTER_MIN_CELL_SIZE:
+            continue
+        # the edges of a cell lie on the adjacent line pixels
+        boxes.append((x - 1, y - 1, x + w, y + h))
+
+    snapped_x: Dict[int, int] = _snap([box[0] for box in boxes] + [box[2] for box in boxes])
+    snapped_y: Dict[int, int] = _snap([box[1] for box in boxes] + [box[3] for box in boxes])
+    cell_bboxes: List[List] = []
+    for x1, y1, x2, y2 in boxes:
+        left, top = snapped_x[x1] + offset[0], snapped_y[y1] + offset[1]
+        right, bottom = snapped_x[x2] + offset[0], snapped_y[y2] + offset[1]
+        cell_bboxes.append([left, top, left, bottom, right, top, right, bottom])
+    return sorted(cell_bboxes, key=lambda cell: (cell[0], cell[1]))
+
+
+def _snap(values: List[int]) -> Dict[int, int]:
+    """
+    Returns: every value mapped onto the mean of its group, values closer than RASTER_SNAP_DISTANCE form a group
+    """
+    groups: List[List[int]] = []
+    for value in sorted(set(values)):
+        if groups and value - groups[-1][-1] <= RASTER_SNAP_DISTANCE:
+            groups[-1].append(value)
+        else:
+            groups.append([value])
+    return {value: int(round(sum(group) / len(group))) for group in groups for value in group}
 
 
 def _find_x(X, x):
@@ -6,6 +6,9 @@ from loguru import logger
 # Output : hor,ver
 from typing import Optional, List, Tuple
 
+# margin around the table box which is searched for lines as well, the detected box doesn't always contain the border
+LINE_ROI_PADDING: int = 15
+
 
 def line_detection(image) -> Tuple[Optional[List[List[int]]], Optional[List[List[int]]]]:
     """
@@ -14,10 +17,25 @@ def line_detection(image) -> Tuple[Optional[List[List[int]]], Optional[List[List
 
     Returns: horizontal and vertical lines
     """
+    return binary_line_detection(binarize(image))
+
+
+def binarize(image):
+    """
+    Returns: inverted adaptive threshold of the image, the lines are white
+    """
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, 1)
-    bw = cv2.bitwise_not(bw)
+    return cv2.bitwise_not(bw)
+
+
+def binary_line_detection(bw) -> Tuple[Optional[List[List[int]]], Optional[List[List[int]]]]:
+    """
+    Args:
+        bw: image binarized with binarize
 
+    Returns: horizontal and vertical lines
+    """
     # To visualize image after thresholding
     # cv2.imshow("bw",bw)
     # cv2.waitKey(0)
@@ -41,15 +59,139 @@ def line_detection(image) -> Tuple[Optional[List[List[int]]], Optional[List[List
     return hor, ver
 
 
-def extract_vertical_lines(vertical) -> Optional[List[List[int]]]:
-    # [vertical lines]
+def line_detection_roi(image, table, padding: int = LINE_ROI_PADDING) \
+        -> Tuple[Optional[List[List[int]]], Optional[List[List[int]]]]:
+    """
+    line_detection on the table box instead of the whole page, the cost scales with the table area.
+    Args:
+        image: numpy image of the page
+        table: table coordinates [x1, y1, x2, y2] in the page
+        padding: margin around the table box in pixels
+
+    Returns: horizontal and vertical lines in page coordinates
+    """
+    x1, y1, x2, y2 = _padded_box(image.shape, table, padding)
+    hor, ver = line_detection(image[y1:y2, x1:x2])
+    if hor is None or ver is None:
+        return None, None
+    return _shift_lines(hor, x1, y1), _shift_lines(ver, x1, y1)
+
+
+class PageLines:
+    """
+    Line detection shared by all bordered tables of a page. The page is binarized and its lines are detected once on
+    the box around all tables, every table selects the lines within its own box.
+    """
+    __image: np.ndarray
+    __box: Tuple[int, int, int, int]
+    __padding: int
+    __binary: Optional[np.ndarray] = None
+    __line_mask: Optional[np.ndarray] = None
+    __lines: Optional[Tuple[Optional[List[List[int]]], Optional[List[List[int]]]]] = None
+
+    def __init__(self, image, tables, padding: int = LINE_ROI_PADDING):
+        """
+        Args:
+            image: numpy image of the page
+            tables: coordinates [x1, y1, x2, y2] of all bordered tables of the page
+            padding: margin around every table box in pixels
+        """
+        self.__image = image
+        self.__padding = padding
+        boxes: List[Tuple[int, int, int, int]] = [_padded_box(image.shape, table, padding) for table in tables]
+        self.__box = (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                      max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+    @property
+    def binary(self) -> np.ndarray:
+        """
+        Returns: binarize of the box around all tables
+        """
+        if self.__binary is None:
+            x1, y1, x2, y2 = self.__box
+            self.__binary = binarize(self.__image[y1:y2, x1:x2])
+        return self.__binary
+
+    def line_mask(self, table) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        Args:
+            table: table coordinates [x1, y1, x2, y2] in the page, one of the tables of the page
+
+        Returns: line_mask of the box of the table and the page coordinates (x, y) of its top left corner
+        """
+        if self.__line_mask is None:
+            self.__line_mask = line_mask(self.binary)
+        x1, y1, x2, y2 = _padded_box(self.__image.shape, table, self.__padding)
+        return self.__line_mask[y1 - self.__box[1]:y2 - self.__box[1], x1 - self.__box[0]:x2 - self.__box[0]], (x1, y1)
+
+    def lines(self, table) -> Tuple[Optional[List[List[int]]], Optional[List[List[int]]]]:
+        """
+        Args:
+            table: table coordinates [x1, y1, x2, y2] in the page, one of the tables of the page
+
+        Returns: horizontal and vertical lines within the box of the table, clipped to it, in page coordinates
+        """
+        if self.__lines is None:
+            hor, ver = binary_line_detection(self.binary)
+            if hor is None or ver is None:
+                self.__lines = None, None
+            else:
+                self.__lines = _shift_lines(hor, self.__box[0], self.__box[1]), \
+                               _shift_lines(ver, self.__box[0], self.__box[1])
+        hor, ver = self.__lines
+        if hor is None or ver is None:
+            return None, None
+        x1, y1, x2, y2 = _padded_box(self.__image.shape, table, self.__padding)
+        return [[max(line[0], x1), line[1], min(line[2], x2), line[3]] for line in hor
+                if y1 <= line[1] <= y2 and line[0] <= x2 and line[2] >= x1], \
+               [[line[0], max(line[1], y1), line[2], min(line[3], y2)] for line in ver
+                if x1 <= line[0] <= x2 and min(line[1], line[3]) <= y2 and max(line[1], line[3]) >= y1]
+
+
+def _padded_box(shape, table, padding: int) -> Tuple[int, int, int, int]:
+    height, width = shape[:2]
+    return max(0, int(table[0]) - padding), max(0, int(table[1]) - padding), \
+        min(width, int(table[2]) + padding), min(height, int(table[3]) + padding)
+
+
+def _shift_lines(lines: List[List[int]], x: int, y: int) -> List[List[int]]:
+    return [[line[0] + x, line[1] + y, line[2] + x, line[3] + y] for line in lines]
+
+
+def line_mask(bw):
+    """
+    Args:
+        bw: image binarized with binarize
+
+    Returns: mask of the horizontal and vertical lines, like they are passed to HoughLinesP
+    """
+    return cv2.bitwise_or(horizontal_line_mask(bw), vertical_line_mask(bw))
+
+
+def vertical_line_mask(vertical):
     # Create structure element for extracting vertical lines through morphology operations
     vertical_structure = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 15))
     # Apply morphology operations
     vertical = cv2.erode(vertical, vertical_structure)
     vertical = cv2.dilate(vertical, vertical_structure)
     vertical = cv2.dilate(vertical, (1, 1), iterations=8)
-    vertical = cv2.erode(vertical, (1, 1), iterations=7)
+    return cv2.erode(vertical, (1, 1), iterations=7)
+
+
+def horizontal_line_mask(horizontal):
+    # Create structure element for extracting horizontal lines through morphology operations
+    horizontal_structure = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 1))
+
+    # Apply morphology operations
+    horizontal = cv2.erode(horizontal, horizontal_structure)
+    horizontal = cv2.dilate(horizontal, horizontal_structure)
+    horizontal = cv2.dilate(horizontal, (1, 1), iterations=5)
+    return cv2.erode(horizontal, (1, 1), iterations=5)
+
+
+def extract_vertical_lines(vertical) -> Optional[List[List[int]]]:
+    # [vertical lines]
+    vertical = vertical_line_mask(vertical)
 
     # Preprocessing Vertical Lines
     # cv2.imshow("vertical",vertical)
@@ -108,14 +250,7 @@ def extract_vertical_lines(vertical) -> Optional[List[List[int]]]:
 
 
 def extract_horizontal_lines(horizontal) -> Optional[List[List[int]]]:
-    # Create structure element for extracting horizontal lines through morphology operations
-    horizontal_structure = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 1))
-
-    # Apply morphology operations
-    horizontal = cv2.erode(horizontal, horizontal_structure)
-    horizontal = cv2.dilate(horizontal, horizontal_structure)
-    horizontal = cv2.dilate(horizontal, (1, 1), iterations=5)
-    horizontal = cv2.erode(horizontal, (1, 1), iterations=5)
+    horizontal = horizontal_line_mask(horizontal)
 
     # Uncomment to visualize highlighted Horizontal lines
     # cv2.imshow("horizontal",horizontal)
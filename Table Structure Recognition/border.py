@@ -1,21 +1,24 @@
 import cv2
 import lxml.etree as etree
-from typing import List
+from typing import List, Optional, Tuple
 
-from pytesseract import pytesseract
 from shapely import geometry
 from shapely.geometry import Polygon
 
-from Functions.borderFunc import extract_table, extract_text_bounding_box, span
-from docrecjson.elements import Document, Cell
+from Functions.borderFunc import CELL_ENGINE_LEGACY, CELL_ENGINE_RASTER, extract_table, extract_text_bounding_box, \
+    form_cells_raster, span
+from Functions.line_detection import LINE_ROI_PADDING, PageLines, line_detection_roi
+from docrecjson.elements import Document
+from table_layout import CellLayout, TableLayout, add_table_layout, recognize_text
 
 
 # Input : table coordinates [x1,y1,x2,y2]
 # Output : XML Structure for ICDAR 19 single table
-def border(table, image):
-    image_np = image  # [table[1]-10:table[3]+10,table[0]-10:table[2]+10]
+def border(table, image, padding: int = LINE_ROI_PADDING, page_lines: Optional[PageLines] = None,
+           engine: str = CELL_ENGINE_LEGACY):
     imag = image.copy()
-    final = extract_table(image_np, 1)
+    # the lines are detected on the table box only, in page coordinates
+    final = _table_cells(table, image, padding, page_lines, engine)
     if final is None:
         return None
     x = []
@@ -70,20 +73,42 @@ def border(table, image):
     return table_xml
 
 
-def handle_bordered_table(table: list, image, document: Document) -> Document:
+def handle_bordered_table(table: list, image, document: Document, padding: int = LINE_ROI_PADDING,
+                          page_lines: Optional[PageLines] = None, engine: str = CELL_ENGINE_LEGACY) -> Document:
     """
     Args:
         table: table coordinates representation
         image: image files, read with cv2.imread
         document: shared-file-document to add the table to.
+        padding: margin around the table in which its lines are detected
+        page_lines: lines of the page shared by all its bordered tables, replaces padding
+        engine: cell formation of extract_table, see Functions.borderFunc.CELL_ENGINES
 
     Returns: document with added Table
     """
-    image_np = image  # [table[1]-10:table[3]+10,table[0]-10:table[2]+10]
+    layout: TableLayout = extract_bordered_table_layout(table, image, padding, page_lines, engine)
+    recognize_text(layout, image)
+    return add_table_layout(document, layout)
+
+
+def extract_bordered_table_layout(table: list, image, padding: int = LINE_ROI_PADDING,
+                                  page_lines: Optional[PageLines] = None,
+                                  engine: str = CELL_ENGINE_LEGACY) -> TableLayout:
+    """
+    Recognizes the structure of a bordered table without its text.
+    Args:
+        table: table coordinates representation
+        image: image files, read with cv2.imread
+        padding: margin around the table in which its lines are detected
+        page_lines: lines of the page shared by all its bordered tables, replaces padding
+        engine: cell formation of extract_table, see Functions.borderFunc.CELL_ENGINES
+
+    Returns: layout of the table, the text of the cells is not recognized yet
+    """
     image_copy = image.copy()
-    # Contains the detected cell coordinates
+    # Contains the detected cell coordinates in page coordinates, the lines are only detected on the table box
     # [cell_coord_1_x, cell_coord_1_y, ..., cell_coord_4_x, cell_coord_4_y], [...]
-    final: List[List] = extract_table(image_np, 1)
+    final: List[List] = _table_cells(table, image, padding, page_lines, engine)
     if final is None:
         raise RuntimeError(
             "Couldn't extract table from document with table detected in it. Returned None. Please review.")
@@ -102,7 +127,7 @@ def handle_bordered_table(table: list, image, document: Document) -> Document:
     x.sort()
     y.sort()
 
-    cells: List[Cell] = []
+    cells: List[CellLayout] = []
     cv2.rectangle(image_copy, (table[0], table[1]), (table[2], table[3]), (0, 255, 0), 2)
     for cell_bbox in final:
         if cell_bbox[0] > table[0] - 5 and cell_bbox[1] > table[1] - 5 and cell_bbox[2] < table[2] + 5 \
@@ -132,22 +157,28 @@ def handle_bordered_table(table: list, image, document: Document) -> Document:
             cell_polygon: Polygon = Polygon([p.x, p.y] for p in cell_points)
             # [upper_left_x, upper_left_y, lower_right_x, lower_right_y]
             bounds: list = [int(x) for x in cell_polygon.bounds]  # there is no float pixel value
-            # todo add pytesseract preprocessing?
-            # https://github.com/NanoNets/ocr-with-tesseract/blob/master/tesseract-tutorial.ipynb
-            # [y1:y2, x1:x2]
-            cv2_roi = image[bounds[1]:bounds[3], bounds[0]: bounds[2]]
-
-            text: str = pytesseract.image_to_string(cv2_roi)
 
-            cells.append(
-                document.add_cell([(int(point.x), int(point.y)) for point in text_cell_points], start_row, end_row,
-                                  start_col, end_col, source='prediction', text=text))
+            cells.append(CellLayout([(int(point.x), int(point.y)) for point in text_cell_points], start_row, end_row,
+                                    start_col, end_col, text_region=(bounds[0], bounds[1], bounds[2], bounds[3])))
 
-    table = document.add_table([(table[0], table[1]), (table[0], table[2]), (table[2], table[3]), (table[2], table[1])],
-                               cells)
-    casctabnet_metadata: dict = {"CascadeTabNet Border": {"bordered": "True", "borderless": "False"}}
-    document.add_content_metadata(casctabnet_metadata, group_ref=table, parent_ref=table.oid)
     # to visualize the detected text areas
     # cv2.imshow("detected cells",image_copy)
     # cv2.waitKey(0)
-    return document
+    return TableLayout([(table[0], table[1]), (table[0], table[2]), (table[2], table[3]), (table[2], table[1])],
+                       bordered=True, cells=cells)
+
+
+def _table_cells(table, image, padding: int, page_lines: Optional[PageLines], engine: str) -> List[List]:
+    if engine == CELL_ENGINE_RASTER:
+        # the line mask is cut from the mask of the page, like the lines
+        mask, offset = (page_lines or PageLines(image, [table], padding)).line_mask(table)
+        frame: Tuple[int, int, int, int] = (int(table[0]) - offset[0], int(table[1]) - offset[1],
+                                            int(table[2]) - offset[0], int(table[3]) - offset[1])
+        return form_cells_raster(mask, offset, frame)
+    return extract_table(image, 1, _table_lines(table, image, padding, page_lines), engine)
+
+
+def _table_lines(table, image, padding: int, page_lines: Optional[PageLines]):
+    if page_lines is not None:
+        return page_lines.lines(table)
+    return line_detection_roi(image, table, padding)
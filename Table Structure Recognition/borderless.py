@@ -2,11 +2,10 @@ import cv2
 import numpy as np
 from typing import List
 
-import pytesseract
+from Functions.borderFunc import CELL_ENGINE_LEGACY, extract_table
 
-from Functions.borderFunc import extract_table
-
-from docrecjson.elements import Document, Cell
+from docrecjson.elements import Document
+from table_layout import CellLayout, TableLayout, add_table_layout, recognize_text
 
 
 # Input : roi of one cell
@@ -36,16 +35,35 @@ def extract_text_bless(img):
     return return_arr
 
 
-def handle_borderless_table(table: list, image, resolved_cells: list, document: Document) -> Document:
+def handle_borderless_table(table: list, image, resolved_cells: list, document: Document,
+                            engine: str = CELL_ENGINE_LEGACY) -> Document:
     """
     Args:
         table: coordinates of the table [top_left_x, top_left_y, bottom_right_x, bottom_right_y]
         image:
         resolved_cells: all found cells with bbox coordinates equal to table
         document:
+        engine: cell formation of extract_table, see Functions.borderFunc.CELL_ENGINES
 
     Returns: document with annotated table
     """
+    layout: TableLayout = extract_borderless_table_layout(table, image, resolved_cells, engine)
+    recognize_text(layout, image)
+    return add_table_layout(document, layout)
+
+
+def extract_borderless_table_layout(table: list, image, resolved_cells: list,
+                                    engine: str = CELL_ENGINE_LEGACY) -> TableLayout:
+    """
+    Recognizes the structure of a borderless table without its text.
+    Args:
+        table: coordinates of the table [top_left_x, top_left_y, bottom_right_x, bottom_right_y]
+        image:
+        resolved_cells: all found cells with bbox coordinates equal to table
+        engine: cell formation of extract_table, see Functions.borderFunc.CELL_ENGINES
+
+    Returns: layout of the table, the text of the cells is not recognized yet
+    """
     cells = []
     x_lines = []
     y_lines = []
@@ -209,7 +227,7 @@ def handle_borderless_table(table: list, image, resolved_cells: list, document:
     #   cv2.line(im2,(r,table[1]),(r,table[3]),(0,255,0),1)
     # for c in col:
     #   cv2.line(im2,(c,table[1]),(c,table[3]),(0,255,0),1)
-    text_chunk = extract_table(image[table[1]:table[3], table[0]:table[2]], 0, (y_lines, x_lines))
+    text_chunk = extract_table(image[table[1]:table[3], table[0]:table[2]], 0, (y_lines, x_lines), engine)
 
     cell_boxes = []
     img4 = image.copy()
@@ -375,7 +393,7 @@ def handle_borderless_table(table: list, image, resolved_cells: list, document:
         else:
             return r - 1
 
-    cells: List[Cell] = []
+    cells: List[CellLayout] = []
     text_chunk: List[List]  # describes a list of related text cells e.g. one row
     for text_chunk in text_chunks:
         cell_bbox: List[int]  # [top_left_x, top_left_y, bottom_right_x, bottom_right_y, ???]
@@ -383,21 +401,11 @@ def handle_borderless_table(table: list, image, resolved_cells: list, document:
             end_col, end_row, start_col, start_row = colend(cell_bbox[2]), rowend(cell_bbox[3]), colstart(
                 cell_bbox[0]), rowstart(cell_bbox[1])
 
-            # todo add pyteseract preprocessing?
-            # https://github.com/NanoNets/ocr-with-tesseract/blob/master/tesseract-tutorial.ipynb
-            cv2_roi = image[cell_bbox[1]:cell_bbox[3], cell_bbox[0]: cell_bbox[2]]
-            text: str = pytesseract.image_to_string(cv2_roi)
-
-            cells.append(document.add_cell([(cell_bbox[0], cell_bbox[1]),
-                                            (cell_bbox[0], cell_bbox[3]),
-                                            (cell_bbox[2], cell_bbox[3]),
-                                            (cell_bbox[2], cell_bbox[1])], start_row, end_row, start_col, end_col,
-                                           text=text,
-                                           source='prediction'))
-
-    table = document.add_table([(table[0], table[1]), (table[0], table[3]), (table[2], table[3]), (table[2], table[1])],
-                               cells, source='prediction')
-    casctabnet_metadata: dict = {"CascadeTabNet Border": {"bordered": "False", "borderless": "True"}}
-    document.add_content_metadata(casctabnet_metadata, group_ref=table, parent_ref=table.oid)
+            cells.append(CellLayout([(cell_bbox[0], cell_bbox[1]),
+                                     (cell_bbox[0], cell_bbox[3]),
+                                     (cell_bbox[2], cell_bbox[3]),
+                                     (cell_bbox[2], cell_bbox[1])], start_row, end_row, start_col, end_col,
+                                    text_region=(cell_bbox[0], cell_bbox[1], cell_bbox[2], cell_bbox[3])))
 
-    return document
+    return TableLayout([(table[0], table[1]), (table[0], table[3]), (table[2], table[3]), (table[2], table[1])],
+                       bordered=False, cells=cells)
@@ -0,0 +1,81 @@
+"""
+Confidence-gated early exit for the three stage cascade of CascadeTabNet.
+
+Every stage of the cascade refines the boxes of the previous stage and its scores are averaged with the scores of the
+previous stages. On clean pages the first stages are already confident: every proposal is either clearly background or
+clearly a table or cell, and the regression of the stage hardly moves the boxes anymore. In this case the remaining
+stages are skipped and the detections are computed from the stages run so far, like the full cascade does it after its
+last stage.
+
+simple_test_early_exit mirrors the box part of CascadeRCNN.simple_test of mmdetection 1.x and is only used for models
+in the box-only mode (see detector.disable_masks).
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+from mmdet.core import bbox2result, bbox2roi
+
+
+@dataclass
+class EarlyExit:
+    # every proposal which could become a detection needs at least this score
+    min_score: float = 0.95
+    # proposals scored below are background, proposals between ambiguous_score and min_score prevent the exit
+    ambiguous_score: float = 0.3
+    # maximum movement of a box edge by the regression of the stage, relative to the box width or height
+    max_shift: float = 0.01
+    # first stage (one based) after which the cascade may exit
+    min_stage: int = 1
+
+
+def simple_test_early_exit(model, img: torch.Tensor, img_meta: List[dict], early_exit: Optional[EarlyExit],
+                           rescale: bool = True) -> Tuple[list, int]:
+    """
+    Args:
+        model: box-only model built with init_detector
+        img: normalized image tensor [1, C, H, W]
+        img_meta: image meta of the image
+        early_exit: exit criteria, None runs all stages
+        rescale: scale the boxes back to the original image size
+    Returns: bbox_result like model.simple_test returns it and the one based stage the cascade exited after
+    """
+    x: tuple = model.extract_feat(img)
+    proposal_list: list = model.simple_test_rpn(x, img_meta, model.test_cfg.rpn)
+    rois: torch.Tensor = bbox2roi(proposal_list)
+    ms_scores: List[torch.Tensor] = []
+    for stage in range(model.num_stages):
+        bbox_roi_extractor = model.bbox_roi_extractor[stage]
+        bbox_head = model.bbox_head[stage]
+        bbox_feats: torch.Tensor = bbox_roi_extractor(x[:len(bbox_roi_extractor.featmap_strides)], rois)
+        if model.with_shared_head:
+            bbox_feats = model.shared_head(bbox_feats)
+        cls_score, bbox_pred = bbox_head(bbox_feats)
+        ms_scores.append(cls_score)
+        if stage == model.num_stages - 1:
+            break
+        refined_rois: torch.Tensor = bbox_head.regress_by_class(rois, cls_score.argmax(dim=1), bbox_pred, img_meta[0])
+        if early_exit is not None and stage + 1 >= early_exit.min_stage and \
+                _confident(sum(ms_scores) / len(ms_scores), rois, refined_rois, early_exit):
+            break
+        rois = refined_rois
+
+    det_bboxes, det_labels = bbox_head.get_det_bboxes(rois, sum(ms_scores) / len(ms_scores), bbox_pred,
+                                                      img_meta[0]['img_shape'], img_meta[0]['scale_factor'],
+                                                      rescale=rescale, cfg=model.test_cfg.rcnn)
+    return bbox2result(det_bboxes, det_labels, bbox_head.num_classes), len(ms_scores)
+
+
+def _confident(cls_score: torch.Tensor, rois: torch.Tensor, refined_rois: torch.Tensor,
+               early_exit: EarlyExit) -> bool:
+    # the background is the first class in mmdetection 1.x
+    scores: torch.Tensor = F.softmax(cls_score, dim=1)[:, 1:].max(dim=1)[0]
+    candidates: torch.Tensor = scores > early_exit.ambiguous_score
+    if not bool(candidates.any()):
+        return True
+    if bool((scores[candidates] < early_exit.min_score).any()):
+        return False
+    sizes: torch.Tensor = (rois[candidates, 3:5] - rois[candidates, 1:3]).clamp(min=1).repeat(1, 2)
+    shifts: torch.Tensor = (refined_rois[candidates, 1:] - rois[candidates, 1:]).abs() / sizes
+    return bool((shifts <= early_exit.max_shift).all())
@@ -4,22 +4,28 @@ import json
 import os
 import shutil
 import sys
-import time
-from typing import List, Tuple
+import threading
+from queue import Empty, Queue
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import cv2
-
-from border import handle_bordered_table
-from borderless import handle_borderless_table
-
-from PIL import Image
 from loguru import logger
-from mmdet.apis import inference_detector, init_detector
-from pdf2image import convert_from_path
 
-from shared_file_format.database.db import Connection
-from docrecjson.commontypes import Point
-from docrecjson.elements import Document, PolygonRegion, Cell
+from Functions.borderFunc import CELL_ENGINE_LEGACY, CELL_ENGINES
+from cascade_exit import EarlyExit
+from dedup import DuplicateFilter, LEDGER_FILEPATH_DEFAULT, ResultLedger, file_hash, model_key
+from detection_result import CLASS_NAMES, parse_class_values
+from detector import BUCKET_WINDOW_BATCHES
+from ingest import FolderWatcher, POLL_INTERVAL_DEFAULT
+from input_scale import InputScaler
+from page_source import DETECTION_DPI_DEFAULT, PDF_DPI_DEFAULT, RENDER_WORKERS_DEFAULT, page_count
+from pipeline import QUEUE_SIZE_DEFAULT, Stage, StagedPipeline
+from precision import PRECISION_FP32, PRECISIONS
+from recognizer import FileResult, Page, TableRecognizer, finish_document, new_document
+from table_layout import TableLayout, TableRegion
+from text_layer import TextLayer
+from worker_pool import WorkerPool
+from shared_file_format.database.db import BufferedWriter, Connection, FLUSH_INTERVAL_DEFAULT, FLUSH_SIZE_DEFAULT
+from docrecjson.elements import Document
 
 # remove the default loguru logger
 logger.remove()
@@ -30,240 +36,12 @@ logger.add("failures.log", level='ERROR', rotation="10 MB")
 
 __db = Connection()
 
-THRESHOLD_VALUE_CELL: float = 0.85
-
-
-def process_image(image_path: str, config_fname: str, checkpoint_file: str) -> Document:
-    """
-    from inference_detector documentation:
-        If imgs is a str, a generator will be returned, otherwise return the
-        detection results directly.
-    -> this version should return a generator
-    """
-    model = init_detector(config_fname, checkpoint_file)
-    result = inference_detector(model, image_path)
-
-    # bordered_tables and borderless_tables contains the coordinates of each detected table in array form
-    # (0, 0) is at the top left
-    # [top-left-x, top-left-y, bottom-right-x, bottom-right-y]
-    bordered_tables: list = extract_border(result)
-    borderless_tables: list = extract_borderless(result)
-    result_cells_detection: list = extract_cell(result)
-
-    image: Image = Image.open(image_path)
-    logger.info("Create json for [{}]", image_path)
-    doc: Document = Document.empty(filename=os.path.basename(image_path),
-                                   original_image_size=(image.width, image.height))
-    doc.new_revision(independent_revision=True, name="CascadeTabNet")
-    doc.set_source_for_adding("prediction")
-    doc.add_creator("CascadeTabNet", "1.0")
-
-    if len(bordered_tables) != 0:
-        _handle_bordered_tables(document=doc, image_path=image_path, bordered_tables=bordered_tables)
-    elif len(borderless_tables) != 0:
-        _handle_borderless_tables(document=doc, image_path=image_path, borderless_tables=borderless_tables,
-                                  detected_cells=result_cells_detection)
-    elif len(bordered_tables) == 0 and len(borderless_tables) == 0:
-        # todo this handling is only advised if it can be ensured that there is definitely a table in the file
-        # ! and only a table, no text etc.
-        # This shall be either removed for other use cases or replaced by a previous table detection step
-        # e.g. another previous model detected a table on this file, but cascadetabnet did not
-        # -> handle this file as there was a table detected.
-        _handle_no_table_detected(document=doc, detected_cells=result_cells_detection)
-        logger.warning("Executing table structure extraction without detected table.")
-
-    logger.debug("Created document from shared_file_format: \n{}", str(doc.to_json()))
-    logger.info("Finished shared_file_format creation on: \n{}", image_path)
-    logger.info("Waiting for new files...")
-
-    return doc
-
-
-def _handle_bordered_tables(document: Document, image_path: str, bordered_tables: list) -> Document:
-    for table in bordered_tables:
-        document = handle_bordered_table(table, cv2.imread(image_path), document)
-
-    return document
-
-
-def _handle_borderless_tables(document: Document, image_path: str, borderless_tables: list,
-                              detected_cells: list) -> Document:
-    for table in borderless_tables:
-        document = handle_borderless_table(table, cv2.imread(image_path), detected_cells, document)
+# seconds to wait for new files before checking the worker pool or the pipeline for completed files
+POOL_POLL_TIMEOUT: float = 0.5
 
-    return document
-
-
-def _handle_no_table_detected(document: Document, detected_cells: list):
-    result_cells_bounding_boxes: List[List[Point]] = create_bounding_boxes(detected_cells)
-
-    cells: List[Cell] = []
-    for cell in result_cells_bounding_boxes:
-        # the cell array has a weird format which produces conflicts with other applications in downstream tasks
-        # they produce a cross-like shape for detection
-        # this is the reason the cell list is reordered properly
-        cell_ordered: list = [cell[0], cell[2], cell[1], cell[3]]
-        cell: Cell = document.add_cell(cell_ordered, source='prediction')
-        cells.append(cell)
-
-    if len(cells) != 0:
-        table = document.add_table(get_table_coordinates_from_cells(cells), cells, source="prediction")
-        casctabnet_metadata: dict = {"CascadeTabNet Border": {"bordered": "False", "borderless": "False"}}
-        document.add_content_metadata(casctabnet_metadata, group_ref=table, parent_ref=table.oid)
-
-    return document
-
-
-def get_table_coordinates_from_cells(cells: List[Cell]) -> list:
-    """
-    Computes the cell bounding box based on the already extracted cells.
-    It just needs to compute the lower left coordinate, as well as the upper right coordinate.
-    The remaining coordinates can be computed with _span_polygon
-    :param cells: all cells in the tables. The cell's bounding box can be accessed via cell.bounding_box.
-                  The single coordinates are in the order as they are returned by _span_polygon.
-                  This is because _span_polygon was already used for the cell bounding box creation.
-    :return: all four rectangle coordinates of the table bounding box
-    """
-    all_x_values = []
-    all_y_values = []
-
-    for cell in cells:
-        for point in cell.bounding_box.polygon:
-            all_x_values.append(point[0])
-            all_y_values.append(point[1])
-
-    # lower left coordinate = min x coordinate + max y coordinate
-    # upper right coordinate = max x coordinate + min y coordinate
-    max_x = max(all_x_values)
-    min_x = min(all_x_values)
-    max_y = max(all_y_values)
-    min_y = min(all_y_values)
-
-    return _span_polygon((min_x, max_y), (max_x, min_y))
-
-
-def _span_polygon(point1: Tuple, point2: Tuple) -> list:
-    """
-    The sci tsr polygon bounding boxes do not have the necessary coordinate structure for the shared_file_format.
-    The coordinates are simply the lower left of the bbox and the upper right of the bbox.
-    But this is sufficient to construct the right square coordinates.
-    It's important that the coordinates are in the right order because the shared_file_format assumes that the last
-    coordinates are connected.
-    :param point1:  lower left coordinate
-    :param point2: upper right coordinate
-    :return: a list of four coordinates. with index:
-        0 = lower left
-        1 = lower right
-        2 = upper right
-        3 = upper left
-    """
-    # written not in a single statement for readability
-    # noinspection PyListCreation
-    polygon_points: list = []
-
-    polygon_points.append(point1)
-    # point2.x, point1.y = lower right
-    polygon_points.append((point2[0], point1[1]))
-    polygon_points.append(point2)
-    # point1.x, point2.y = upper left
-    polygon_points.append((point1[0], point2[1]))
-
-    return polygon_points
-
-
-def create_bounding_boxes(cells: list) -> List[List[Point]]:
-    bounding_box_cells: list = []
-    for cell in cells:
-        bounding_box_cells.append(handle_bounding_box_cell(cell))
-    return bounding_box_cells
-
-
-def handle_bounding_box_cell(cell: list) -> List[Point]:
-    if len(cell) != 5:
-        raise ValueError("The cell array didn't fulfill the expected length. Please check whether [" + str(
-            cell) + "] matches the expected requirements.")
-    return create_square((cell[0], cell[1]), (cell[2], cell[3]))
-
-
-def create_square(top_left: Point, bottom_right: Point) -> List[Point]:
-    """
-    Args:
-        top_left: top left Point
-        bottom_right: bottom right Point
-    Returns: a new Point list with top_right and bottom left computed such that a bounding box can be computed.
-    """
-    top_left_x, top_left_y = top_left
-    bottom_right_x, bottom_right_y = bottom_right
-    box_width = bottom_right_x - top_left_x
-    top_right = (top_left_x + box_width, top_left_y)
-    bottom_left = (bottom_right_x - box_width, bottom_right_y)
-    box_cornerstones: list = [top_left, bottom_right, top_right, bottom_left]
-    return box_cornerstones
-
-
-def extract_border(result) -> list:
-    # for border
-    res_border: list = []
-    for r in result[0][0]:
-        if r[4] > THRESHOLD_VALUE_CELL:
-            res_border.append(r[:4].astype(int))
-    return res_border
-
-
-def extract_borderless(result) -> list:
-    """
-    extracts borderless masks from result
-    Args:
-        result:
-    Returns: a list of the borderless tables. Each array describes a borderless table bounding box.
-    the two coordinates in the array are the top right and bottom left coordinates of the bounding box.
-    """
-    result_borderless = []
-    for r in result[0][2]:
-        if r[4] > THRESHOLD_VALUE_CELL:
-            # slices the threshold value of
-            result_borderless.append(r[:4].astype(int))
-    return result_borderless
-
-
-def extract_cell(result) -> list:
-    """
-    Args:
-        result: inference_detector result
-    Returns: the array of detected cells. Each array describes a cell bounding box.
-    The arrays consist normally of five elements
-    1. top left x coordinate
-    2. top left y coordinate
-    3. bottom right x coordinate
-    4. bottom right y coordinate
-    5. threshold value
-    """
-    result_cell = []
-    # for cells
-    for r in result[0][1]:
-        if r[4] > THRESHOLD_VALUE_CELL:
-            # to be able to append the threshold as integer value
-            r[4] = r[4] * 100
-            result_cell.append(r.astype(int))
-    return result_cell
-
-
-def convert_file(filepath: str) -> str:
-    """
-    Args:
-        filepath: file to check and convert if necessary
-    Returns: image file if pdf was specified
-    """
-    filename, file_extension = os.path.splitext(os.path.basename(filepath))
-    dir: str = os.path.dirname(filepath)
-    if ".pdf" in file_extension:
-        pages = convert_from_path(filepath, 500)
-        for page in pages:
-            page.save(dir + "/" + filename + ".png", "PNG")
-        os.remove(filepath)
-        return dir + "/" + filename + ".png"
-    else:
-        return filepath
+# threads per stage of the staged pipeline, the detection always runs in a single thread because it owns the model.
+# The decode threads render pages concurrently, the bounded queue in front of the detection caps the rendered pages.
+STAGE_WORKERS_DEFAULT: Dict[str, int] = {"decode": RENDER_WORKERS_DEFAULT, "structure": 2, "ocr": 4, "persist": 2}
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -287,10 +65,137 @@ def parse_arguments() -> argparse.Namespace:
                         help="Specify a folder to save the extracted json Files into. "
                              "Leave empty, if you don't want to save any shared_file_format json files",
                         type=str, default="")
+    parser.add_argument("--polling",
+                        help="Poll the extraction folder instead of using inotify, e.g. for network file systems.",
+                        action="store_true")
+    parser.add_argument("--pollInterval", help="Seconds between two scans of the extraction folder when polling.",
+                        type=float, default=POLL_INTERVAL_DEFAULT)
+    parser.add_argument("-w", "--workers",
+                        help="Maximum number of worker processes. Each worker holds its own model. "
+                             "The pool is scaled between --minWorkers and this value based on the backlog.",
+                        type=int, default=1)
+    parser.add_argument("--minWorkers", help="Number of worker processes which are kept alive without backlog.",
+                        type=int, default=1)
+    parser.add_argument("--threadsPerWorker",
+                        help="torch/OpenCV threads per worker. Defaults to an equal share of the cores.",
+                        type=int, default=None)
+    parser.add_argument("-b", "--batchSize",
+                        help="Pages per detector forward pass. Defaults to imgs_per_gpu of the config.",
+                        type=int, default=None)
+    parser.add_argument("-p", "--pipeline",
+                        help="Run decoding, detection, structure recognition, OCR and persistence as separate stages "
+                             "connected by bounded queues, such that they overlap.",
+                        action="store_true")
+    parser.add_argument("--stageWorkers",
+                        help="Threads per pipeline stage, e.g. 'decode=1,structure=2,ocr=4,persist=2'. "
+                             "Stages which are not specified use their default.",
+                        type=parse_stage_workers, default={})
+    parser.add_argument("--queueSize", help="Number of pages which may wait in front of each pipeline stage.",
+                        type=int, default=QUEUE_SIZE_DEFAULT)
+    parser.add_argument("--mongoFlushSize", help="Number of buffered documents which are inserted together.",
+                        type=int, default=FLUSH_SIZE_DEFAULT)
+    parser.add_argument("--mongoFlushInterval", help="Maximum seconds a document is buffered before it is inserted.",
+                        type=float, default=FLUSH_INTERVAL_DEFAULT)
+    parser.add_argument("--ledger",
+                        help="SQLite file recording the recognized documents by content hash and model. Files with "
+                             "already recognized content reuse the stored document. Leave empty to disable.",
+                        type=str, default=LEDGER_FILEPATH_DEFAULT)
+    parser.add_argument("--dpi", help="Resolution pdf pages are rendered with.", type=int, default=PDF_DPI_DEFAULT)
+    parser.add_argument("--detectionDpi",
+                        help="Enables the two-resolution mode: pdf pages are rendered with this resolution for the "
+                             "detection and only the detected tables with --dpi. JPEGs are decoded reduced for the "
+                             "detection, TIFFs and other raster images stay at full resolution. e.g. "
+                             + str(DETECTION_DPI_DEFAULT),
+                        type=int, default=None)
+    parser.add_argument("--renderWorkers",
+                        help="Pages which are rendered concurrently ahead of the detection. "
+                             "The staged pipeline uses the decode threads of --stageWorkers instead.",
+                        type=int, default=RENDER_WORKERS_DEFAULT)
+    parser.add_argument("--forceOcr",
+                        help="OCR every cell, even if the pdf has a text layer the cell text could be taken from.",
+                        action="store_true")
+    parser.add_argument("--classThresholds",
+                        help="Minimum detection score per class, e.g. bordered=0.9,cell=0.8. Classes: " + ", ".join(
+                            CLASS_NAMES) + ". Classes which are not given use 0.85.",
+                        type=parse_class_thresholds, default={})
+    parser.add_argument("--topK",
+                        help="Maximum number of detections per class, e.g. cell=500. "
+                             "Only the detections with the highest scores are kept.",
+                        type=parse_top_k, default={})
+    parser.add_argument("--device", help="Torch device the model is loaded onto, e.g. cpu.", type=str,
+                        default="cuda:0")
+    parser.add_argument("--onnx",
+                        help="Backbone and neck exported with export_onnx.py. They are run with ONNX Runtime, "
+                             "e.g. together with --device cpu on nodes without GPU.",
+                        type=str, default=None)
+    parser.add_argument("--precision",
+                        help="Inference precision profile on the cpu. int8 quantizes the cascade bbox heads, bf16 runs "
+                             "the backbone and neck with bf16 autocast. See Evaluations/Tablebank/compare_precision.py "
+                             "for their accuracy.",
+                        choices=PRECISIONS, default=PRECISION_FP32)
+    parser.add_argument("--earlyExit",
+                        help="Skip the remaining cascade stages on pages where every possible detection scores at "
+                             "least --earlyExitScore and the boxes move less than --earlyExitShift.",
+                        action="store_true")
+    parser.add_argument("--earlyExitScore", help="Minimum score of every possible detection for the early exit.",
+                        type=float, default=EarlyExit.min_score)
+    parser.add_argument("--earlyExitShift",
+                        help="Maximum movement of a box edge by a stage for the early exit, relative to the box size.",
+                        type=float, default=EarlyExit.max_shift)
+    parser.add_argument("--cellPass",
+                        help="Detect the cells of borderless tables a second time on the table crops, where small "
+                             "cells aren't shrunk by the resize of the whole page.",
+                        action="store_true")
+    parser.add_argument("--cfgOptions",
+                        help="Json file with overrides of the model config, e.g. a Pareto optimal test_cfg written by "
+                             "Evaluations/tune_test_cfg.py.",
+                        type=str, default=None)
+    parser.add_argument("--adaptiveScale",
+                        help="Detect sparse pages at a smaller and dense pages at a larger input scale, estimated from "
+                             "the ink coverage and the ruling lines of every page.",
+                        action="store_true")
+    parser.add_argument("--cellEngine",
+                        help="Cell formation of the tables. legacy is the original cache scanning of CascadeTabNet, "
+                             "lattice looks the cells up by their coordinates and keeps cells which span columns, "
+                             "raster takes the connected components of the line mask of bordered tables instead of "
+                             "the line intersections. See Evaluations/benchmark_cell_engines.py.",
+                        choices=CELL_ENGINES, default=CELL_ENGINE_LEGACY)
 
     return parser.parse_args()
 
 
+def parse_stage_workers(value: str) -> Dict[str, int]:
+    stage_workers: Dict[str, int] = {}
+    for assignment in value.split(","):
+        name, _, workers = assignment.partition("=")
+        if name.strip() not in STAGE_WORKERS_DEFAULT:
+            raise argparse.ArgumentTypeError("Unknown pipeline stage [" + name + "], expected one of " + str(
+                list(STAGE_WORKERS_DEFAULT)) + ".")
+        stage_workers[name.strip()] = int(workers)
+    return stage_workers
+
+
+def load_cfg_options(filepath: Optional[str]) -> Optional[Dict[str, Any]]:
+    if filepath is None:
+        return None
+    with open(filepath) as file:
+        return json.load(file)
+
+
+def parse_class_thresholds(value: str) -> Dict[int, float]:
+    try:
+        return parse_class_values(value, float)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+def parse_top_k(value: str) -> Dict[int, int]:
+    try:
+        return parse_class_values(value, int)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
 def handle_duplicate_files(filepath: str, new_folder_location: str):
     """
     handles duplicate files + adds e.g. filenameXYZ(1).jpg counter behind it.
@@ -322,32 +227,518 @@ def move_to_folder(filepath: str, new_folder_location: str):
 
 
 def save_as_json(shared_file_document: Document, filepath: str):
+    save_dict_as_json(shared_file_document.to_dict(), filepath)
+
+
+def save_dict_as_json(shared_file_dict: dict, filepath: str):
     with open(filepath + ".json", 'w') as json_file:
-        json.dump(shared_file_document.to_dict(), json_file)
+        json.dump(shared_file_dict, json_file)
         logger.info("Saved json file: " + filepath + ".json")
 
 
-def main(checkpoint_filepath: str, config_filepath: str, extraction_filepath: str, extraction_detected_filepath: str,
-         extraction_json_filepath: str):
-    logger.info("Waiting for new files...")
+def handle_file(filepath: str, recognizer: TableRecognizer, writer: BufferedWriter, ledger: Optional[ResultLedger],
+                extraction_detected_filepath: str, extraction_json_filepath: str):
+    """
+    Runs the table recognition for a single incoming file and persists the result. Returns once the document is
+    written to the database (or dropped by the writer) and the file is moved.
+    Args:
+        filepath: file from the extraction folder
+        recognizer: recognizer holding the warm model
+        writer: buffered writer of the database collection
+        ledger: records the document for the content of the file, None if deduplication is disabled
+        extraction_detected_filepath: folder to move the file to afterwards
+        extraction_json_filepath: folder to save the shared_file_format json into
+    """
+    settled: Queue = Queue()
+    pending: List[str] = handle_files([filepath], recognizer, writer, ledger, extraction_detected_filepath,
+                                      extraction_json_filepath, settled.put)
+    # the document may already be taken by the background thread of the writer, flush only writes the rest
+    writer.flush()
+    for _ in pending:
+        settled.get()
+
+
+def handle_files(filepaths: List[str], recognizer: TableRecognizer, writer: BufferedWriter,
+                 ledger: Optional[ResultLedger], extraction_detected_filepath: str, extraction_json_filepath: str,
+                 on_settled: Optional[Callable[[str], None]] = None) -> List[str]:
+    """
+    Runs the table recognition for several incoming files with batched detection and persists the results.
+    Multi-page files are streamed page by page and result in a single document. A file which fails is logged and
+    left in the extraction folder, the other files are persisted nevertheless.
+    Args:
+        filepaths: files from the extraction folder
+        recognizer: recognizer holding the warm model
+        writer: buffered writer of the database collection
+        ledger: records the documents for the content of the files, None if deduplication is disabled
+        extraction_detected_filepath: folder to move the files to afterwards
+        extraction_json_filepath: folder to save the shared_file_format json files into
+        on_settled: see persist_document
+    Returns: the files whose documents were handed to the writer, on_settled is called for each of them later
+    """
+    for filepath in filepaths:
+        logger.info("Received file: [{}]", filepath)
+    results: List[FileResult] = recognizer.process_files(filepaths)
+    pending: List[str] = []
+    for filepath, result in zip(filepaths, results):
+        if isinstance(result, Exception):
+            logger.error("Couldn't recognize [{}], it isn't persisted: {}", filepath, result)
+            continue
+        persist_document(result, filepath, writer, ledger, extraction_detected_filepath, extraction_json_filepath,
+                         on_settled)
+        pending.append(filepath)
+    return pending
+
+
+def persist_document(document: Document, filepath: str, writer: BufferedWriter, ledger: Optional[ResultLedger],
+                     extraction_detected_filepath: str, extraction_json_filepath: str,
+                     on_settled: Optional[Callable[[str], None]] = None):
+    """
+    Buffers the document for insertion into the database. Once the writer wrote it, the ledger records the document,
+    the file is moved out of the way and the json file is saved. If the writer drops the document, the file stays in
+    the extraction folder and its claim is released by finish_files, such that it is recognized again.
+    Args:
+        document: document created for the file
+        filepath: original file from the extraction folder
+        writer: buffered writer of the database collection, the insert happens in the background
+        ledger: records the document for the content of the file, None if deduplication is disabled
+        extraction_detected_filepath: folder to move the file to
+        extraction_json_filepath: folder to save the shared_file_format json into
+        on_settled: called with filepath by the thread of the writer once the file is persisted or the write failed.
+            The file must not be passed to finish_files before.
+    """
+    # separate dict, the writer adds the _id to its dict in the background
+    stored: dict = document.to_dict()
+
+    def written(success: bool):
+        try:
+            if not success:
+                logger.error("The document of [{}] wasn't written to the database, the file is left for another "
+                             "try.", filepath)
+                return
+            if ledger is not None:
+                ledger.complete(filepath, stored)
+            move_to_folder(filepath, extraction_detected_filepath)
+
+            # extract pure filename from this path
+            filename_without_extension = os.path.basename(filepath).rsplit('.', maxsplit=1)[0]
+            save_as_json(document, os.path.join(extraction_json_filepath, filename_without_extension))
+        except OSError:
+            logger.exception("Couldn't persist [{}]", filepath)
+        finally:
+            if on_settled is not None:
+                on_settled(filepath)
+
+    writer.insert(document.to_dict(), written)
+
+
+class FileJob:
+    """
+    State of a single incoming file while its pages pass the stages of the pipeline.
+    The pages are recognized independently, the last settled page persists the document of the whole file.
+    """
+    filepath: str
+    page_count: int
+    # (height, width) of the first page
+    page_shape: Optional[Tuple[int, int]]
+    # layouts per zero based page index
+    layouts: Dict[int, List[TableLayout]]
+    # text layer of a pdf, None if the pages are OCRed
+    text_layer: Optional[TextLayer]
+    failed: bool
+    # the document was handed to the writer, the file is finished by the write callback instead of its return
+    persisted: bool
+    __unsettled: int
+    __returned: int
+
+    def __init__(self, filepath: str, page_count: int, text_layer: Optional[TextLayer] = None):
+        self.filepath = filepath
+        self.page_count = page_count
+        self.text_layer = text_layer
+        self.page_shape = None
+        self.layouts = {}
+        self.failed = False
+        self.persisted = False
+        self.__unsettled = page_count
+        self.__returned = 0
+        self.__lock = threading.Lock()
+
+    def settle(self, failed: bool = False) -> bool:
+        """
+        Marks a page as processed, successfully or not.
+        Returns: True for the last page of the file
+        """
+        with self.__lock:
+            self.failed = self.failed or failed
+            self.__unsettled -= 1
+            return self.__unsettled == 0
+
+    def returned(self) -> bool:
+        """
+        Marks a page as having left the pipeline. Only called by the thread which drains the pipeline.
+        Returns: True if all pages of the file left the pipeline
+        """
+        self.__returned += 1
+        return self.__returned == self.page_count
+
+
+class PageJob:
+    """
+    State of a single page while it passes the stages of the pipeline.
+    """
+    file: FileJob
+    index: int
+    image: Optional[Page]
+    result: Any
+    regions: List[TableRegion]
+    layouts: List[TableLayout]
+
+    def __init__(self, file: FileJob, index: int):
+        self.file = file
+        self.index = index
+        self.image = None
+        self.result = None
+        self.regions = []
+        self.layouts = []
+
+    def __str__(self) -> str:
+        return self.file.filepath + " (page " + str(self.index + 1) + ")"
+
+
+def build_pipeline(recognizer: TableRecognizer, writer: BufferedWriter, ledger: Optional[ResultLedger],
+                   extraction_detected_filepath: str, extraction_json_filepath: str, stage_workers: Dict[str, int],
+                   queue_size: int = QUEUE_SIZE_DEFAULT,
+                   on_settled: Optional[Callable[[str], None]] = None) -> StagedPipeline:
+    """
+    Splits the handling of a page into the stages decode, detect, structure, ocr and persist.
+    Every page is rendered once, the decoded image is shared by the detection, the structure recognition and the OCR.
+    In the two-resolution mode the structure stage loads the table regions at full resolution for the OCR.
+    Args:
+        recognizer: recognizer holding the warm model, used by the single detection thread. In the two-pass mode the
+            structure threads run the second pass on the model as well, the recognizer serializes the inferences.
+        writer: buffered writer of the database collection, shared by the persist threads
+        ledger: records the documents for the content of the files, None if deduplication is disabled
+        extraction_detected_filepath: folder to move the files to afterwards
+        extraction_json_filepath: folder to save the shared_file_format json files into
+        stage_workers: threads per stage, missing stages use STAGE_WORKERS_DEFAULT
+        queue_size: number of pages which may wait in front of each stage
+        on_settled: called for every file whose document was handed to the writer, see persist_document
+    """
+    workers: Dict[str, int] = dict(STAGE_WORKERS_DEFAULT, **stage_workers)
+
+    def settle_on_failure(function: Callable[[PageJob], None]) -> Callable[[PageJob], None]:
+        def run(job: PageJob):
+            try:
+                function(job)
+            except Exception:
+                if job.file.settle(failed=True):
+                    logger.error("Couldn't recognize [{}], it isn't persisted.", job.file.filepath)
+                raise
+
+        return run
+
+    def decode(job: PageJob):
+        job.image = recognizer.load_page(job.file.filepath, job.index)
+        if job.index == 0:
+            job.file.page_shape = job.image.shape[:2]
+
+    def detect(job: PageJob):
+        job.result = recognizer.detect(job.image)
+
+    def structure(job: PageJob):
+        job.regions = recognizer.recognize_regions(job.image, job.result, job.index + 1)
+
+    def ocr(job: PageJob):
+        job.layouts = recognizer.recognize_page_text(job.regions, job.file.text_layer, job.index)
+        # the decoded page and regions are not needed anymore, release them before the job waits for persistence
+        job.image = None
+        job.regions = []
+
+    def persist(job: PageJob):
+        job.file.layouts[job.index] = job.layouts
+        if not job.file.settle():
+            return
+        if job.file.failed:
+            logger.error("Couldn't recognize [{}], it isn't persisted.", job.file.filepath)
+            return
+        filename: str = os.path.basename(job.file.filepath)
+        layouts: List[TableLayout] = [layout for index in range(job.file.page_count)
+                                      for layout in job.file.layouts[index]]
+        document: Document = finish_document(new_document(filename, job.file.page_shape), layouts, filename)
+        persist_document(document, job.file.filepath, writer, ledger, extraction_detected_filepath,
+                         extraction_json_filepath, on_settled)
+        job.file.persisted = True
+
+    return StagedPipeline([Stage("decode", settle_on_failure(decode), workers["decode"], queue_size),
+                           Stage("detect", settle_on_failure(detect), 1, queue_size),
+                           Stage("structure", settle_on_failure(structure), workers["structure"], queue_size),
+                           Stage("ocr", settle_on_failure(ocr), workers["ocr"], queue_size),
+                           Stage("persist", persist, workers["persist"], queue_size)])
+
+
+def persist_duplicates(duplicates: List[Tuple[str, dict]], watcher: FolderWatcher, extraction_detected_filepath: str,
+                       extraction_json_filepath: str):
+    """
+    Handles files whose content was already recognized: the stored document is saved as json for the file and the
+    file is moved out of the way. The document is not inserted into the database again.
+    Args:
+        duplicates: files with the stored document of their content
+        watcher: watcher the files came from
+        extraction_detected_filepath: folder to move the files to
+        extraction_json_filepath: folder to save the shared_file_format json files into
+    """
+    for filepath, document in duplicates:
+        logger.info("Skipped recognition of [{}], its content was already recognized.", filepath)
+        try:
+            move_to_folder(filepath, extraction_detected_filepath)
+            filename_without_extension = os.path.basename(filepath).rsplit('.', maxsplit=1)[0]
+            save_dict_as_json(document, os.path.join(extraction_json_filepath, filename_without_extension))
+        except OSError:
+            logger.exception("Couldn't persist duplicate [{}]", filepath)
+        finally:
+            watcher.done(filepath)
+
+
+def admit_files(filepaths: List[str], duplicate_filter: Optional[DuplicateFilter], watcher: FolderWatcher,
+                extraction_detected_filepath: str, extraction_json_filepath: str) -> List[str]:
+    """
+    Returns: the new files which have to be recognized, duplicates of already recognized files are handled right away
+    """
+    if duplicate_filter is None:
+        return filepaths
+    to_process, duplicates = duplicate_filter.admit(filepaths)
+    persist_duplicates(duplicates, watcher, extraction_detected_filepath, extraction_json_filepath)
+    return to_process
+
+
+def finish_files(filepaths: List[str], duplicate_filter: Optional[DuplicateFilter], watcher: FolderWatcher,
+                 extraction_detected_filepath: str, extraction_json_filepath: str) -> List[str]:
+    """
+    Releases the recognized files from the watcher and resolves the files which waited for their content.
+    Returns: files which have to be recognized because the recognition of their content failed
+    """
+    for filepath in filepaths:
+        watcher.done(filepath)
+    if duplicate_filter is None:
+        return []
+    to_process, duplicates = duplicate_filter.finished(filepaths)
+    persist_duplicates(duplicates, watcher, extraction_detected_filepath, extraction_json_filepath)
+    return to_process
+
+
+def submit_file(pipeline: StagedPipeline, recognizer: TableRecognizer, filepath: str) -> bool:
+    """
+    Submits every page of the file to the pipeline. Submitting blocks while the pipeline is saturated.
+    Returns: False if the pages of the file couldn't be determined
+    """
+    logger.info("Received file: [{}]", filepath)
+    try:
+        count: int = page_count(filepath)
+    except Exception:
+        logger.exception("Couldn't read the pages of [{}]", filepath)
+        return False
+    if count == 0:
+        logger.error("[{}] doesn't contain any page.", filepath)
+        return False
+    # the text layer is read by the first ocr thread which needs it
+    file_job: FileJob = FileJob(filepath, count, recognizer.text_layer(filepath))
+    for index in range(count):
+        pipeline.submit(PageJob(file_job, index))
+    return True
+
+
+def run_pipeline(watcher: FolderWatcher, pipeline: StagedPipeline, recognizer: TableRecognizer,
+                 duplicate_filter: Optional[DuplicateFilter], extraction_detected_filepath: str,
+                 extraction_json_filepath: str, settled: Queue):
+    """
+    Submits the pages of every new file of the watcher to the pipeline.
+    Args:
+        settled: files whose documents were written or dropped by the writer, filled by the on_settled of the pipeline
+    """
+    retries: List[str] = []
+    while True:
+        finished: List[str] = []
+        for filepath in retries + admit_files(watcher.poll(POOL_POLL_TIMEOUT), duplicate_filter, watcher,
+                                              extraction_detected_filepath, extraction_json_filepath):
+            if not submit_file(pipeline, recognizer, filepath):
+                finished.append(filepath)
+        for job in pipeline.completed():
+            if job.file.returned() and not job.file.persisted:
+                finished.append(job.file.filepath)
+        finished += drain(settled)
+        retries = finish_files(finished, duplicate_filter, watcher, extraction_detected_filepath,
+                               extraction_json_filepath)
+
+
+def drain(settled: Queue) -> List[str]:
+    """
+    Returns: the files which were put into the queue so far
+    """
+    filepaths: List[str] = []
     try:
         while True:
-            for filename in os.listdir(extraction_filepath):
-                filepath = extraction_filepath + "/" + filename
-                logger.info("Received image: [{}]", filepath)
-                image_path: str = convert_file(filepath)
-                extracted_image: Document = process_image(image_path, config_filepath, checkpoint_filepath)
-                __db.get_collection().insert_one(extracted_image.to_dict())
-                move_to_folder(image_path, extraction_detected_filepath)
-
-                # extract pure filename from this path
-                filename_without_extension = filename.rsplit('.', maxsplit=1)[0]
-                save_as_json(extracted_image, os.path.join(extraction_json_filepath, filename_without_extension))
-            time.sleep(2)
+            filepaths.append(settled.get_nowait())
+    except Empty:
+        return filepaths
+
+
+def _init_worker(config_filepath: str, checkpoint_filepath: str, extraction_detected_filepath: str,
+                 extraction_json_filepath: str, recognizer_options: Dict[str, Any], flush_size: int,
+                 flush_interval: float, ledger_filepath: str, ledger_model_key: str) -> tuple:
+    """
+    Executed once in every worker process of the pool: loads the model and opens the database writer of this worker.
+    """
+    ledger: Optional[ResultLedger] = ResultLedger(ledger_filepath, ledger_model_key) if ledger_filepath else None
+    return (TableRecognizer(config_filepath, checkpoint_filepath, **recognizer_options),
+            __db.get_writer(flush_size=flush_size, flush_interval=flush_interval), ledger,
+            extraction_detected_filepath, extraction_json_filepath)
+
+
+def _handle_file_in_worker(state: tuple, filepath: str):
+    recognizer, writer, ledger, extraction_detected_filepath, extraction_json_filepath = state
+    handle_file(filepath, recognizer, writer, ledger, extraction_detected_filepath, extraction_json_filepath)
+
+
+def _close_worker(state: tuple):
+    # writes the documents which are still buffered and stops the render threads
+    state[1].close()
+    state[0].close()
+
+
+def run_worker_pool(watcher: FolderWatcher, pool: WorkerPool, duplicate_filter: Optional[DuplicateFilter],
+                    extraction_detected_filepath: str, extraction_json_filepath: str):
+    """
+    Submits every new file of the watcher to the pool and scales the pool along the backlog.
+    """
+    retries: List[str] = []
+    while True:
+        for filepath in retries + admit_files(watcher.poll(POOL_POLL_TIMEOUT), duplicate_filter, watcher,
+                                              extraction_detected_filepath, extraction_json_filepath):
+            pool.submit(filepath)
+        retries = finish_files(pool.completed(), duplicate_filter, watcher, extraction_detected_filepath,
+                               extraction_json_filepath)
+        pool.autoscale()
+
+
+def main(checkpoint_filepath: str, config_filepath: str, extraction_filepath: str, extraction_detected_filepath: str,
+         extraction_json_filepath: str, use_inotify: bool = True, poll_interval: float = POLL_INTERVAL_DEFAULT,
+         workers: int = 1, min_workers: int = 1, threads_per_worker: Optional[int] = None,
+         batch_size: Optional[int] = None, staged_pipeline: bool = False,
+         stage_workers: Optional[Dict[str, int]] = None, queue_size: int = QUEUE_SIZE_DEFAULT,
+         flush_size: int = FLUSH_SIZE_DEFAULT, flush_interval: float = FLUSH_INTERVAL_DEFAULT,
+         ledger_filepath: str = LEDGER_FILEPATH_DEFAULT, dpi: int = PDF_DPI_DEFAULT,
+         detection_dpi: Optional[int] = None, render_workers: int = RENDER_WORKERS_DEFAULT,
+         use_text_layer: bool = True, class_thresholds: Optional[Dict[int, float]] = None,
+         top_k: Optional[Dict[int, int]] = None, device: str = "cuda:0", onnx_filepath: Optional[str] = None,
+         precision: str = PRECISION_FP32, early_exit: Optional[EarlyExit] = None, cell_pass: bool = False,
+         cfg_options: Optional[Dict[str, Any]] = None, input_scaler: Optional[InputScaler] = None,
+         cell_engine: str = CELL_ENGINE_LEGACY):
+    if staged_pipeline and workers > 1:
+        raise ValueError("The staged pipeline runs in a single process and can't be combined with multiple workers.")
+    recognizer_options: Dict[str, Any] = dict(batch_size=batch_size, dpi=dpi, detection_dpi=detection_dpi,
+                                              render_workers=render_workers, use_text_layer=use_text_layer,
+                                              class_thresholds=class_thresholds, top_k=top_k, device=device,
+                                              onnx_filepath=onnx_filepath, precision=precision,
+                                              early_exit=early_exit, cell_pass=cell_pass, cfg_options=cfg_options,
+                                              input_scaler=input_scaler, cell_engine=cell_engine)
+    ledger: Optional[ResultLedger] = None
+    duplicate_filter: Optional[DuplicateFilter] = None
+    if ledger_filepath:
+        ledger = ResultLedger(ledger_filepath, model_key(checkpoint_filepath, config_filepath, str(dpi),
+                                                        str(detection_dpi), str(use_text_layer),
+                                                        str(sorted((class_thresholds or {}).items())),
+                                                        str(sorted((top_k or {}).items())), precision,
+                                                        str(early_exit), str(cell_pass),
+                                                        json.dumps(cfg_options or {}, sort_keys=True),
+                                                        str(input_scaler), cell_engine,
+                                                        # the exported backbone replaces the one of the checkpoint
+                                                        file_hash(onnx_filepath) if onnx_filepath else ""))
+        # this process owns the ledger, claims which are still pending stem from an aborted run
+        ledger.release_pending()
+        duplicate_filter = DuplicateFilter(ledger)
+    try:
+        with FolderWatcher(extraction_filepath, poll_interval, use_inotify) as watcher:
+            if workers > 1:
+                # every worker process opens its own pooled client and writer
+                pool: WorkerPool = WorkerPool(_init_worker, _handle_file_in_worker,
+                                              (config_filepath, checkpoint_filepath, extraction_detected_filepath,
+                                               extraction_json_filepath, recognizer_options, flush_size,
+                                               flush_interval, ledger_filepath,
+                                               ledger.model_key if ledger is not None else ""),
+                                              max_workers=workers, min_workers=min_workers,
+                                              threads_per_worker=threads_per_worker, finalizer=_close_worker)
+                logger.info("Waiting for new files...")
+                try:
+                    run_worker_pool(watcher, pool, duplicate_filter, extraction_detected_filepath,
+                                    extraction_json_filepath)
+                finally:
+                    pool.shutdown()
+                return
+
+            with __db.get_writer(flush_size=flush_size, flush_interval=flush_interval) as writer:
+                # the model is loaded once, every file only pays for inference and structure recognition.
+                # The recognizer is closed on the way out, which stops its render threads.
+                with TableRecognizer(config_filepath, checkpoint_filepath, **recognizer_options) as recognizer:
+                    # files whose documents were written (or dropped) by the writer, they are finished afterwards
+                    settled: Queue = Queue()
+                    if staged_pipeline:
+                        pipeline: StagedPipeline = build_pipeline(recognizer, writer, ledger,
+                                                                  extraction_detected_filepath,
+                                                                  extraction_json_filepath, stage_workers or {},
+                                                                  queue_size, settled.put)
+                        logger.info("Waiting for new files...")
+                        try:
+                            run_pipeline(watcher, pipeline, recognizer, duplicate_filter, extraction_detected_filepath,
+                                         extraction_json_filepath, settled)
+                        finally:
+                            pipeline.shutdown()
+                        return
+
+                    # the backlog is handed to the detector in chunks, such that the pages can be bucketed by
+                    # aspect ratio
+                    chunk_size: int = recognizer.batch_size * BUCKET_WINDOW_BATCHES
+                    logger.info("Waiting for new files...")
+                    retries: List[str] = []
+                    unsettled: int = 0
+                    while True:
+                        # files which wait for their write are finished soon, even if no new file arrives
+                        timeout: float = 0 if retries else (POOL_POLL_TIMEOUT if unsettled else poll_interval)
+                        filepaths: List[str] = retries + admit_files(watcher.poll(timeout), duplicate_filter,
+                                                                     watcher, extraction_detected_filepath,
+                                                                     extraction_json_filepath)
+                        retries = []
+                        for start in range(0, len(filepaths), chunk_size):
+                            chunk: List[str] = filepaths[start:start + chunk_size]
+                            pending: List[str] = []
+                            try:
+                                pending = handle_files(chunk, recognizer, writer, ledger,
+                                                       extraction_detected_filepath, extraction_json_filepath,
+                                                       settled.put)
+                            except Exception:
+                                # the daemon keeps on running, the files are released like failed files
+                                logger.exception("Couldn't handle the files {}", chunk)
+                            finally:
+                                unsettled += len(pending)
+                                retries += finish_files([filepath for filepath in chunk if filepath not in pending],
+                                                        duplicate_filter, watcher, extraction_detected_filepath,
+                                                        extraction_json_filepath)
+                        written: List[str] = drain(settled)
+                        unsettled -= len(written)
+                        retries += finish_files(written, duplicate_filter, watcher, extraction_detected_filepath,
+                                                extraction_json_filepath)
+                        if len(filepaths) != 0:
+                            logger.info("Waiting for new files...")
     except KeyboardInterrupt:
         exit(0)
 
 
 if __name__ == "__main__":
     args: argparse.Namespace = parse_arguments()
-    main(args.checkpoint, args.config, args.extraction, args.extractionDetected, args.extractionJson)
+    main(args.checkpoint, args.config, args.extraction, args.extractionDetected, args.extractionJson,
+         not args.polling, args.pollInterval, args.workers, args.minWorkers, args.threadsPerWorker,
+         args.batchSize, args.pipeline, args.stageWorkers, args.queueSize, args.mongoFlushSize,
+         args.mongoFlushInterval, args.ledger, args.dpi, args.detectionDpi,
+         args.renderWorkers, not args.forceOcr, args.classThresholds, args.topK,
+         args.device, args.onnx, args.precision,
+         EarlyExit(min_score=args.earlyExitScore, max_shift=args.earlyExitShift) if args.earlyExit else None,
+         args.cellPass, load_cfg_options(args.cfgOptions), InputScaler() if args.adaptiveScale else None,
+         args.cellEngine)
@@ -0,0 +1,207 @@
+"""
+Deduplication of incoming files by their content.
+
+Recognized documents are recorded in a SQLite ledger, keyed by the sha256 of the file content and a key of the model
+(checkpoint and config). A file whose content was already recognized with the same model skips the recognition and
+reuses the stored document. Files with the same content which arrive while the first one is still processed are
+coalesced: they wait for the result of the first one instead of being recognized again.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+LEDGER_FILEPATH_DEFAULT: str = "ledger.sqlite"
+
+HASH_CHUNK_SIZE: int = 1 << 20
+
+STATUS_PENDING: str = "pending"
+STATUS_DONE: str = "done"
+
+
+def file_hash(filepath: str) -> str:
+    """
+    Returns: sha256 hex digest of the file content
+    """
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def model_key(checkpoint_filepath: str, config_filepath: str, *settings: str) -> str:
+    """
+    Args:
+        checkpoint_filepath: checkpoint of the model
+        config_filepath: config of the model
+        settings: further settings which change the result, e.g. the pdf render resolution
+    Returns: key of the model, changes whenever the checkpoint, the config or a setting changes
+    """
+    return hashlib.sha256(
+        "|".join([file_hash(checkpoint_filepath), file_hash(config_filepath)] + list(settings)).encode()).hexdigest()
+
+
+class ResultLedger:
+    """
+    On-disk record of the recognized documents of a single model.
+    Every call opens its own sqlite connection, such that the ledger can be shared by threads and worker processes.
+    """
+    __filepath: str
+    __model_key: str
+
+    def __init__(self, filepath: str, key: str):
+        """
+        Args:
+            filepath: sqlite database file, created if it doesn't exist
+            key: model key from model_key()
+        """
+        self.__filepath = filepath
+        self.__model_key = key
+        with closing(self.__connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS results ("
+                               "content_hash TEXT NOT NULL, "
+                               "model_key TEXT NOT NULL, "
+                               "status TEXT NOT NULL, "
+                               "filepath TEXT NOT NULL, "
+                               "document TEXT, "
+                               "updated REAL NOT NULL, "
+                               "PRIMARY KEY (content_hash, model_key))")
+            connection.execute("CREATE INDEX IF NOT EXISTS results_filepath ON results (filepath, model_key)")
+
+    @property
+    def filepath(self) -> str:
+        return self.__filepath
+
+    @property
+    def model_key(self) -> str:
+        return self.__model_key
+
+    def claim(self, content_hash: str, filepath: str) -> bool:
+        """
+        Marks the content as being recognized from filepath.
+        Returns: True if the caller has to recognize the file, False if the content is already claimed or recognized
+        """
+        with closing(self.__connect()) as connection, connection:
+            cursor = connection.execute("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, NULL, ?)",
+                                        (content_hash, self.__model_key, STATUS_PENDING, filepath, time.time()))
+            return cursor.rowcount == 1
+
+    def lookup(self, content_hash: str) -> Optional[dict]:
+        """
+        Returns: the stored document (Document.to_dict()) of the content, None if it isn't recognized yet
+        """
+        with closing(self.__connect()) as connection:
+            row = connection.execute("SELECT document FROM results WHERE content_hash = ? AND model_key = ? "
+                                     "AND status = ?", (content_hash, self.__model_key, STATUS_DONE)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def complete(self, filepath: str, document: dict):
+        """
+        Stores the document of the claim made for filepath. Does nothing if the file wasn't claimed.
+        """
+        with closing(self.__connect()) as connection, connection:
+            connection.execute("UPDATE results SET status = ?, document = ?, updated = ? "
+                               "WHERE filepath = ? AND model_key = ? AND status = ?",
+                               (STATUS_DONE, json.dumps(document), time.time(), filepath, self.__model_key,
+                                STATUS_PENDING))
+
+    def release(self, content_hash: str):
+        """
+        Drops an unfinished claim, e.g. because the recognition failed.
+        """
+        with closing(self.__connect()) as connection, connection:
+            connection.execute("DELETE FROM results WHERE content_hash = ? AND model_key = ? AND status = ?",
+                               (content_hash, self.__model_key, STATUS_PENDING))
+
+    def release_pending(self):
+        """
+        Drops all unfinished claims of the model, e.g. from a crashed run.
+        """
+        with closing(self.__connect()) as connection, connection:
+            cursor = connection.execute("DELETE FROM results WHERE model_key = ? AND status = ?",
+                                        (self.__model_key, STATUS_PENDING))
+            if cursor.rowcount > 0:
+                logger.info("Released {} unfinished claims of a previous run.", cursor.rowcount)
+
+    def __connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.__filepath, timeout=30)
+
+
+class DuplicateFilter:
+    """
+    Coalesces incoming files by content. Used by the process which owns the folder watcher:
+    only the first file of a content is recognized, later files with the same content wait for its result.
+    """
+    __ledger: ResultLedger
+    # content hash of every claimed file which is currently recognized
+    __claims: Dict[str, str]
+    # files which wait for the claimed file of their content
+    __waiting: Dict[str, List[str]]
+
+    def __init__(self, ledger: ResultLedger):
+        self.__ledger = ledger
+        self.__claims = {}
+        self.__waiting = {}
+
+    def admit(self, filepaths: List[str]) -> Tuple[List[str], List[Tuple[str, dict]]]:
+        """
+        Args:
+            filepaths: new files
+        Returns: the files which have to be recognized and the duplicates (file, stored document) which are resolved
+        """
+        to_process: List[str] = []
+        duplicates: List[Tuple[str, dict]] = []
+        for filepath in filepaths:
+            try:
+                content_hash: str = file_hash(filepath)
+            except OSError as error:
+                logger.warning("Couldn't hash [{}]: {}", filepath, error)
+                to_process.append(filepath)
+                continue
+            self.__admit(filepath, content_hash, to_process, duplicates)
+        return to_process, duplicates
+
+    def finished(self, filepaths: List[str]) -> Tuple[List[str], List[Tuple[str, dict]]]:
+        """
+        Args:
+            filepaths: files which left the recognition, successfully or not
+        Returns: the files which have to be recognized instead of a failed file and the duplicates which are resolved
+        """
+        to_process: List[str] = []
+        duplicates: List[Tuple[str, dict]] = []
+        for filepath in filepaths:
+            content_hash: Optional[str] = self.__claims.pop(filepath, None)
+            if content_hash is None:
+                continue
+            waiting: List[str] = self.__waiting.pop(content_hash)
+            document: Optional[dict] = self.__ledger.lookup(content_hash)
+            if document is not None:
+                duplicates.extend((waiting_filepath, document) for waiting_filepath in waiting)
+                continue
+            # the recognition failed, the next file with this content gets its own try
+            self.__ledger.release(content_hash)
+            for waiting_filepath in waiting:
+                self.__admit(waiting_filepath, content_hash, to_process, duplicates)
+        return to_process, duplicates
+
+    def __admit(self, filepath: str, content_hash: str, to_process: List[str], duplicates: List[Tuple[str, dict]]):
+        if content_hash in self.__waiting:
+            self.__waiting[content_hash].append(filepath)
+            return
+        document: Optional[dict] = self.__ledger.lookup(content_hash)
+        if document is not None:
+            duplicates.append((filepath, document))
+        elif self.__ledger.claim(content_hash, filepath):
+            self.__claims[filepath] = content_hash
+            self.__waiting[content_hash] = []
+            to_process.append(filepath)
+        else:
+            # claimed by another process sharing the ledger, recognizing it again is the safe choice
+            logger.warning("Content of [{}] is claimed by another process, recognizing it anyway.", filepath)
+            to_process.append(filepath)
@@ -0,0 +1,121 @@
+"""
+Structured access to the output of the CascadeTabNet detector.
+
+inference_detector returns one [N, 5] array per class ([x1, y1, x2, y2, score]). DetectionResult concatenates them
+once into contiguous arrays of boxes, scores and labels. Tables and cells are selected with a single boolean mask per
+query, with per-class thresholds and an optional top-k. The detector output is never modified.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+CLASS_BORDERED: int = 0
+CLASS_CELL: int = 1
+CLASS_BORDERLESS: int = 2
+
+CLASS_NAMES: Dict[str, int] = {"bordered": CLASS_BORDERED, "cell": CLASS_CELL, "borderless": CLASS_BORDERLESS}
+
+THRESHOLD_DEFAULT: float = 0.85
+
+
+class DetectionResult:
+    """
+    Detections of a single page.
+    Coordinates: (0, 0) is at the top left, every box is [top-left-x, top-left-y, bottom-right-x, bottom-right-y].
+    """
+    boxes: np.ndarray
+    scores: np.ndarray
+    labels: np.ndarray
+    __thresholds: Dict[int, float]
+    __top_k: Dict[int, int]
+
+    def __init__(self, boxes: np.ndarray, scores: np.ndarray, labels: np.ndarray,
+                 thresholds: Optional[Dict[int, float]] = None, top_k: Optional[Dict[int, int]] = None):
+        """
+        Args:
+            boxes: [N, 4] float boxes
+            scores: [N] detection scores
+            labels: [N] class of every detection, see CLASS_*
+            thresholds: minimum score per class (exclusive), classes without entry use THRESHOLD_DEFAULT
+            top_k: maximum number of detections per class, classes without entry are not limited
+        """
+        self.boxes = boxes
+        self.scores = scores
+        self.labels = labels
+        self.__thresholds = thresholds or {}
+        self.__top_k = top_k or {}
+
+    @classmethod
+    def from_mmdet(cls, result, thresholds: Optional[Dict[int, float]] = None,
+                   top_k: Optional[Dict[int, int]] = None) -> 'DetectionResult':
+        """
+        Args:
+            result: inference_detector result, (bbox_result, segm_result) or only bbox_result
+            thresholds: minimum score per class
+            top_k: maximum number of detections per class
+        """
+        bbox_result: list = result[0] if isinstance(result, tuple) else result
+        if sum(len(class_boxes) for class_boxes in bbox_result) == 0:
+            detections: np.ndarray = np.zeros((0, 5), dtype=np.float32)
+        else:
+            detections = np.concatenate(bbox_result)
+        labels: np.ndarray = np.repeat(np.arange(len(bbox_result)), [len(class_boxes) for class_boxes in bbox_result])
+        return cls(detections[:, :4], detections[:, 4], labels, thresholds, top_k)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def threshold(self, label: int) -> float:
+        return self.__thresholds.get(label, THRESHOLD_DEFAULT)
+
+    def mask(self, label: int) -> np.ndarray:
+        """
+        Returns: boolean mask of the detections of the class above its threshold, limited to its top-k
+        """
+        mask: np.ndarray = (self.labels == label) & (self.scores > self.threshold(label))
+        top_k: Optional[int] = self.__top_k.get(label)
+        if top_k is not None and np.count_nonzero(mask) > top_k:
+            indexes: np.ndarray = np.flatnonzero(mask)
+            dropped: np.ndarray = indexes[np.argsort(-self.scores[indexes], kind="stable")[top_k:]]
+            mask[dropped] = False
+        return mask
+
+    def select(self, label: int) -> np.ndarray:
+        """
+        Returns: [M, 4] integer boxes of the selected detections of the class, in detection order
+        """
+        return self.boxes[self.mask(label)].astype(int)
+
+    def bordered_tables(self) -> np.ndarray:
+        return self.select(CLASS_BORDERED)
+
+    def borderless_tables(self) -> np.ndarray:
+        return self.select(CLASS_BORDERLESS)
+
+    def cells(self) -> np.ndarray:
+        """
+        Returns: [M, 5] integer cells, the fifth column is the score in percent
+        """
+        mask: np.ndarray = self.mask(CLASS_CELL)
+        return np.column_stack([self.boxes[mask], self.scores[mask] * 100]).astype(int)
+
+    def scaled(self, scale: float) -> 'DetectionResult':
+        """
+        Returns: the detections with all boxes scaled, e.g. from detection resolution to full resolution
+        """
+        if scale == 1:
+            return self
+        return DetectionResult(self.boxes * scale, self.scores, self.labels, self.__thresholds, self.__top_k)
+
+
+def parse_class_values(value: str, value_type=float) -> Dict[int, float]:
+    """
+    Parses per-class values like 'bordered=0.9,cell=0.8' for the command line.
+    """
+    values: Dict[int, float] = {}
+    for assignment in value.split(","):
+        name, _, class_value = assignment.partition("=")
+        if name.strip() not in CLASS_NAMES:
+            raise ValueError("Unknown class [" + name + "], expected one of " + str(list(CLASS_NAMES)) + ".")
+        values[CLASS_NAMES[name.strip()]] = value_type(class_value)
+    return values
@@ -0,0 +1,210 @@
+"""
+Batched inference for the CascadeTabNet detector.
+
+mmdetection only offers inference_detector for a single image. The functions in here run the test pipeline for a list
+of pages, group them by aspect ratio such that the padding inside a batch stays minimal and run the backbone and neck
+on the whole batch. The cascade heads of mmdetection 1.x only support a single image per call (they read
+img_meta[0]), so they are executed per page on the batched features.
+
+In the box-only mode the mask branch is removed from the model. The mask RoI extractor, the four convolutions of the
+FCNMaskHead on every cascade stage and the pasting of the masks to full image size are skipped, only the boxes are
+computed. The trained weights are unchanged and the boxes are the same as with masks.
+Box-only models can exit the cascade early on confident pages, see cascade_exit.
+"""
+import copy
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from mmdet.apis.inference import LoadImage
+from mmdet.datasets.pipelines import Compose
+
+from cascade_exit import EarlyExit, simple_test_early_exit
+
+# number of batches from which the pages are bucketed by aspect ratio, bounds the memory of the prepared tensors
+BUCKET_WINDOW_BATCHES: int = 8
+
+ImageInput = Union[str, np.ndarray]
+
+
+def build_test_pipeline(model, img_scale: Optional[Tuple[int, int]] = None) -> Compose:
+    """
+    Args:
+        model: model built with init_detector
+        img_scale: scale of MultiScaleFlipAug instead of the scale of the config, see input_scale
+    Returns: the test pipeline of the model config, which accepts file paths as well as decoded images
+    """
+    transforms: list = model.cfg.data.test.pipeline[1:]
+    if img_scale is not None:
+        transforms = copy.deepcopy(transforms)
+        for transform in transforms:
+            if transform['type'] == 'MultiScaleFlipAug':
+                transform['img_scale'] = tuple(img_scale)
+    return Compose([LoadImage()] + transforms)
+
+
+def prepare_image(pipeline: Compose, image: ImageInput) -> Tuple[torch.Tensor, dict]:
+    """
+    Args:
+        pipeline: test pipeline from build_test_pipeline
+        image: file path or decoded image
+    Returns: the normalized and padded image tensor [C, H, W] together with its image meta
+    """
+    data: dict = pipeline(dict(img=image))
+    # MultiScaleFlipAug returns one entry per augmentation, the test config only uses a single scale without flip
+    return data['img'][0], data['img_meta'][0].data
+
+
+def bucket_by_aspect_ratio(shapes: Sequence[Tuple[int, int]], batch_size: int,
+                           groups: Optional[Sequence] = None) -> List[List[int]]:
+    """
+    Args:
+        shapes: (height, width) of every page
+        batch_size: maximum number of pages per batch
+        groups: sortable group of every page, e.g. its img_scale. Pages of a group are batched together.
+    Returns: batches of page indexes. Pages with a similar aspect ratio share a batch.
+    """
+    order: List[int] = sorted(range(len(shapes)), key=lambda index: (
+        groups[index] if groups is not None else 0, shapes[index][0] / shapes[index][1]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def collate_padded(tensors: List[torch.Tensor]) -> torch.Tensor:
+    """
+    Stacks image tensors [C, H, W] of different sizes into a single batch [N, C, H_max, W_max].
+    The images are placed at the top left, like the Pad transform of the pipeline does.
+    """
+    height: int = max(tensor.shape[1] for tensor in tensors)
+    width: int = max(tensor.shape[2] for tensor in tensors)
+    batch: torch.Tensor = tensors[0].new_zeros((len(tensors), tensors[0].shape[0], height, width))
+    for index, tensor in enumerate(tensors):
+        batch[index, :, :tensor.shape[1], :tensor.shape[2]] = tensor
+    return batch
+
+
+def apply_cfg_options(model, options: Dict[str, Any]):
+    """
+    Overrides entries of the model config, e.g. the output of Evaluations/tune_test_cfg.py:
+    {"test_cfg.rpn.nms_pre": 500, "data.test.pipeline.1.img_scale": [1024, 640]}
+    The heads read test_cfg and build_test_pipeline reads the test pipeline on every inference.
+    Args:
+        model: model built with init_detector
+        options: dotted config keys, list entries are addressed by their index.
+            Lists of numbers are set as tuples, like img_scale is given in the configs.
+    """
+    for key, value in options.items():
+        if isinstance(value, list) and all(isinstance(entry, (int, float)) for entry in value):
+            value = tuple(value)
+        configs: list = [model.cfg]
+        if key.startswith("test_cfg.") and model.test_cfg is not model.cfg.test_cfg:
+            configs.append(model)
+        for config in configs:
+            *path, name = key.split(".")
+            node = config
+            for part in path:
+                node = node[int(part)] if isinstance(node, list) else getattr(node, part)
+            if isinstance(node, list):
+                node[int(name)] = value
+            else:
+                setattr(node, name, value)
+
+
+def disable_masks(model):
+    """
+    Switches the model to box-only inference, the mask head and its RoI extractor are released.
+    simple_test returns only bbox_result afterwards, see normalize_result.
+    """
+    # with_mask of mmdetection checks for a mask_head which is not None
+    model.mask_head = None
+    model.mask_roi_extractor = None
+
+
+def normalize_result(result) -> tuple:
+    """
+    Returns: the result as (bbox_result, segm_result), segm_result is None for results of the box-only mode.
+    Every result can be accessed with result[0][class] like a result with masks.
+    """
+    return result if isinstance(result, tuple) else (result, None)
+
+
+@contextmanager
+def precomputed_features(model, features: tuple):
+    """
+    Lets the model use already computed features instead of running the backbone and neck again.
+    """
+    # e.g. the ONNX Runtime backend replaces extract_feat as well, it has to be restored afterwards
+    previous = model.__dict__.get("extract_feat")
+    model.extract_feat = lambda img: features
+    try:
+        yield
+    finally:
+        if previous is None:
+            del model.extract_feat
+        else:
+            model.extract_feat = previous
+
+
+def inference_detector_early_exit(model, image: ImageInput, early_exit: Optional[EarlyExit]) -> Tuple[tuple, int]:
+    """
+    Counterpart of mmdet.apis.inference_detector with early exit, for box-only models. None runs all stages.
+    Returns: the detection result and the one based stage the cascade exited after
+    """
+    img, img_meta = prepare_image(build_test_pipeline(model), image)
+    with torch.no_grad():
+        bbox_result, stage = simple_test_early_exit(model, img.unsqueeze(0).to(next(model.parameters()).device),
+                                                    [img_meta], early_exit)
+    return normalize_result(bbox_result), stage
+
+
+def inference_detector_batch(model, images: Sequence[ImageInput], batch_size: Optional[int] = None,
+                             early_exit: Optional[EarlyExit] = None,
+                             exit_stages: Optional[List[int]] = None,
+                             img_scales: Optional[Sequence[Tuple[int, int]]] = None) -> List:
+    """
+    Batched counterpart of mmdet.apis.inference_detector.
+    Args:
+        model: model built with init_detector
+        images: file paths or decoded images
+        batch_size: pages per forward pass, defaults to imgs_per_gpu of the model config
+        early_exit: exit the cascade early on confident pages, only for box-only models
+        exit_stages: filled with the one based stage the cascade exited after for every image, if given
+        img_scales: img_scale of every image, see input_scale. Defaults to the scale of the config.
+    Returns: the detection result of every image, in the order of images.
+    Every result has the same structure as the result of inference_detector (result[0][class]).
+    """
+    if batch_size is None:
+        batch_size = model.cfg.data.get('imgs_per_gpu', 1)
+    pipelines: Dict[Optional[Tuple[int, int]], Compose] = {}
+    if img_scales is None:
+        img_scales = [None] * len(images)
+    for img_scale in set(img_scales):
+        pipelines[img_scale] = build_test_pipeline(model, img_scale)
+    device = next(model.parameters()).device
+    window: int = batch_size * BUCKET_WINDOW_BATCHES
+
+    results: List = [None] * len(images)
+    stages: List[int] = [getattr(model, 'num_stages', 1)] * len(images)
+    for window_start in range(0, len(images), window):
+        window_scales: Sequence[Optional[Tuple[int, int]]] = img_scales[window_start:window_start + window]
+        prepared: List[Tuple[torch.Tensor, dict]] = [prepare_image(pipelines[img_scale], image) for image, img_scale
+                                                     in zip(images[window_start:window_start + window], window_scales)]
+        shapes: List[Tuple[int, int]] = [meta['pad_shape'][:2] for _, meta in prepared]
+        groups: List[Tuple[int, int]] = [img_scale or (0, 0) for img_scale in window_scales]
+        for batch_indexes in bucket_by_aspect_ratio(shapes, batch_size, groups):
+            img: torch.Tensor = collate_padded([prepared[index][0] for index in batch_indexes]).to(device)
+            with torch.no_grad():
+                features: tuple = model.extract_feat(img)
+                for position, index in enumerate(batch_indexes):
+                    image_features: tuple = tuple(level[position:position + 1] for level in features)
+                    with precomputed_features(model, image_features):
+                        if early_exit is None:
+                            results[window_start + index] = normalize_result(
+                                model.simple_test(img[position:position + 1], [prepared[index][1]], rescale=True))
+                            continue
+                        bbox_result, stages[window_start + index] = simple_test_early_exit(
+                            model, img[position:position + 1], [prepared[index][1]], early_exit)
+                        results[window_start + index] = normalize_result(bbox_result)
+    if exit_stages is not None:
+        exit_stages[:] = stages
+    return results
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Exports the backbone and neck of a CascadeTabNet checkpoint to ONNX and checks the parity of the ONNX Runtime backend
+against PyTorch.
+
+python export_onnx.py -co Config/cascade_mask_rcnn_hrnetv2p_w32_20e.py -c epoch_36.pth -o epoch_36.onnx \
+    --verify page1.png page2.png
+"""
+import argparse
+import sys
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+import torch
+from loguru import logger
+from mmdet.apis import inference_detector, init_detector
+
+from detection_result import DetectionResult
+from detector import build_test_pipeline, prepare_image
+from onnx_backend import EXPORT_SHAPE_DEFAULT, OPSET_VERSION, OnnxFeatures, export_features, use_torch_features
+
+# maximum absolute difference of the feature maps
+FEATURE_TOLERANCE_DEFAULT: float = 1e-3
+# maximum absolute difference of the coordinates of matching boxes, in pixels of the original image
+BOX_TOLERANCE_DEFAULT: float = 1.0
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export the CascadeTabNet backbone and neck to ONNX.")
+    parser.add_argument("-c", "--checkpoint", help="Checkpoint of the model, e.g. epoch_36.pth", type=str,
+                        required=True)
+    parser.add_argument("-co", "--config", help="Config of the model, e.g. cascade_mask_rcnn_hrnetv2p_w32_20e.py",
+                        type=str, required=True)
+    parser.add_argument("-o", "--output", help="File the onnx graph is written to.", type=str, required=True)
+    parser.add_argument("--height", help="Height of the dummy input the graph is traced with.", type=int,
+                        default=EXPORT_SHAPE_DEFAULT[0])
+    parser.add_argument("--width", help="Width of the dummy input the graph is traced with.", type=int,
+                        default=EXPORT_SHAPE_DEFAULT[1])
+    parser.add_argument("--opset", help="ONNX opset version.", type=int, default=OPSET_VERSION)
+    parser.add_argument("--verify", help="Images the ONNX Runtime backend is compared with PyTorch on.", nargs="*",
+                        default=[])
+    parser.add_argument("--featureTolerance", help="Maximum absolute difference of the feature maps.", type=float,
+                        default=FEATURE_TOLERANCE_DEFAULT)
+    parser.add_argument("--boxTolerance", help="Maximum absolute difference of the detected boxes in pixels.",
+                        type=float, default=BOX_TOLERANCE_DEFAULT)
+    return parser.parse_args()
+
+
+def compare_features(model, onnx_features: OnnxFeatures, image: np.ndarray) -> float:
+    """
+    Returns: the maximum absolute difference between the PyTorch and the ONNX Runtime features of the image
+    """
+    img, _ = prepare_image(build_test_pipeline(model), image)
+    img = img.unsqueeze(0).to(next(model.parameters()).device)
+    with torch.no_grad():
+        expected: tuple = model.extract_feat(img)
+    actual: tuple = onnx_features(img)
+    return max(float((level_expected - level_actual).abs().max()) for level_expected, level_actual in
+               zip(expected, actual))
+
+
+def compare_results(expected, actual) -> Tuple[bool, float]:
+    """
+    Returns: whether both results have the same number of detections per class (before any threshold) and the maximum
+    absolute difference of the boxes and scores
+    """
+    expected_detections: DetectionResult = DetectionResult.from_mmdet(expected)
+    actual_detections: DetectionResult = DetectionResult.from_mmdet(actual)
+    if not np.array_equal(expected_detections.labels, actual_detections.labels):
+        return False, float("inf")
+    if len(expected_detections) == 0:
+        return True, 0.0
+    return True, float(max(np.abs(expected_detections.boxes - actual_detections.boxes).max(),
+                           np.abs(expected_detections.scores - actual_detections.scores).max()))
+
+
+def verify(model, onnx_filepath: str, image_filepaths: List[str], feature_tolerance: float,
+           box_tolerance: float) -> bool:
+    """
+    Runs the full detector with the PyTorch and the ONNX Runtime features on every image.
+    Returns: True if all images are within the tolerances
+    """
+    onnx_features: OnnxFeatures = OnnxFeatures(onnx_filepath)
+    passed: bool = True
+    for image_filepath in image_filepaths:
+        image: np.ndarray = cv2.imread(image_filepath)
+        if image is None:
+            logger.error("Couldn't decode image [{}]", image_filepath)
+            passed = False
+            continue
+        feature_difference: float = compare_features(model, onnx_features, image)
+        expected = inference_detector(model, image)
+        # same as use_onnx_features, without opening another session for every image
+        model.extract_feat = onnx_features
+        try:
+            actual = inference_detector(model, image)
+        finally:
+            use_torch_features(model)
+        same_detections, box_difference = compare_results(expected, actual)
+        image_passed: bool = same_detections and feature_difference <= feature_tolerance and \
+            box_difference <= box_tolerance
+        logger.info("[{}] features: max difference {:.2e}, detections: {}, max box/score difference {:.2e} -> {}",
+                    image_filepath, feature_difference, "same" if same_detections else "different", box_difference,
+                    "passed" if image_passed else "FAILED")
+        passed = passed and image_passed
+    return passed
+
+
+def main(checkpoint_filepath: str, config_filepath: str, output_filepath: str, shape: Tuple[int, int],
+         opset_version: int, verify_filepaths: List[str], feature_tolerance: float, box_tolerance: float) -> bool:
+    # the exported graph is run on the CPU, the parity is checked against PyTorch on the CPU as well
+    model = init_detector(config_filepath, checkpoint_filepath, device="cpu")
+    output_names: List[str] = export_features(model, output_filepath, shape, opset_version)
+    logger.info("Exported [{}] to [{}] with outputs {}", checkpoint_filepath, output_filepath, output_names)
+    if len(verify_filepaths) == 0:
+        return True
+    return verify(model, output_filepath, verify_filepaths, feature_tolerance, box_tolerance)
+
+
+if __name__ == "__main__":
+    args: argparse.Namespace = parse_arguments()
+    sys.exit(0 if main(args.checkpoint, args.config, args.output, (args.height, args.width), args.opset, args.verify,
+                       args.featureTolerance, args.boxTolerance) else 1)
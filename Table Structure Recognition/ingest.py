@@ -0,0 +1,161 @@
+"""
+Ingest source for the extraction folder.
+
+New files are reported through inotify as soon as they are fully written (closed after writing or moved into the
+folder). If inotify is not available, the folder is polled instead and a file is only reported once its size did not
+change between two polls.
+"""
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # inotify is only available on linux
+    INotify = None
+    flags = None
+
+POLL_INTERVAL_DEFAULT: float = 2.0
+
+
+class FolderWatcher:
+    """
+    Yields the files of a folder in arrival order.
+    The files which are already present when the watcher is started are drained first (ordered by modification time).
+    A yielded file stays in flight until done() is called for it. It is never yielded twice while being in flight.
+    """
+    __folder: str
+    __poll_interval: float
+    __ready: Deque[str]
+    __queued: Set[str]
+    __in_flight: Set[str]
+    __pending_sizes: Dict[str, Tuple[int, float]]
+
+    def __init__(self, folder: str, poll_interval: float = POLL_INTERVAL_DEFAULT, use_inotify: bool = True):
+        """
+        Args:
+            folder: folder to monitor for new incoming files
+            poll_interval: seconds between two scans of the folder if inotify is not used
+            use_inotify: set to False to force the polling fallback, e.g. for network file systems
+        """
+        self.__folder = folder
+        self.__poll_interval = poll_interval
+        self.__ready = deque()
+        self.__queued = set()
+        self.__in_flight = set()
+        self.__pending_sizes = {}
+        self.__inotify = None
+
+        if use_inotify and INotify is not None:
+            self.__inotify = INotify()
+            self.__inotify.add_watch(folder, flags.CLOSE_WRITE | flags.MOVED_TO)
+            logger.info("Watching [{}] with inotify.", folder)
+        else:
+            logger.info("Polling [{}] every {} seconds.", folder, poll_interval)
+        self.__enqueue_backlog()
+
+    def __enter__(self) -> 'FolderWatcher':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            for filepath in self.poll(self.__poll_interval):
+                yield filepath
+
+    @property
+    def backlog(self) -> int:
+        """
+        Returns: number of files which have arrived but were not handed out yet
+        """
+        return len(self.__ready)
+
+    def poll(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Args:
+            timeout: seconds to wait for new files if there are none ready. None blocks until a file arrives
+                     (polling fallback: waits a single poll interval).
+        Returns: the files which are ready for processing, in arrival order. They are marked as in flight.
+        """
+        if len(self.__ready) == 0:
+            if self.__inotify is not None:
+                self.__read_events(timeout)
+            else:
+                self.__scan()
+                if len(self.__ready) == 0:
+                    time.sleep(self.__poll_interval if timeout is None else min(timeout, self.__poll_interval))
+
+        ready: List[str] = []
+        while len(self.__ready) != 0:
+            filepath: str = self.__ready.popleft()
+            self.__queued.discard(filepath)
+            # files may vanish after their event was emitted, e.g. intermediate files of the pdf conversion
+            if not os.path.isfile(filepath):
+                continue
+            self.__in_flight.add(filepath)
+            ready.append(filepath)
+        return ready
+
+    def done(self, filepath: str):
+        """
+        Marks a file as finished. A new file with the same name will be reported again.
+        """
+        self.__in_flight.discard(filepath)
+
+    def close(self):
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
+
+    def __enqueue(self, filepath: str):
+        if filepath in self.__queued or filepath in self.__in_flight:
+            return
+        self.__queued.add(filepath)
+        self.__ready.append(filepath)
+
+    def __list_files(self) -> List[os.DirEntry]:
+        with os.scandir(self.__folder) as entries:
+            return [entry for entry in entries if entry.is_file()]
+
+    def __enqueue_backlog(self):
+        entries: List[os.DirEntry] = sorted(self.__list_files(), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            self.__enqueue(entry.path)
+        if len(entries) != 0:
+            logger.info("Found {} files in the backlog of [{}].", len(entries), self.__folder)
+
+    def __read_events(self, timeout: Optional[float]):
+        timeout_ms: Optional[int] = None if timeout is None else int(timeout * 1000)
+        for event in self.__inotify.read(timeout=timeout_ms):
+            if event.mask & flags.Q_OVERFLOW:
+                # the kernel dropped events -> the folder content is the only reliable source
+                logger.warning("inotify event queue overflowed, rescanning [{}].", self.__folder)
+                self.__enqueue_backlog()
+                continue
+            if event.mask & flags.ISDIR or not event.name:
+                continue
+            self.__enqueue(os.path.join(self.__folder, event.name))
+
+    def __scan(self):
+        """
+        Polling fallback: a file is ready as soon as its size and modification time are unchanged since the last scan.
+        """
+        pending_sizes: Dict[str, Tuple[int, float]] = {}
+        arrived: List[Tuple[float, str]] = []
+        for entry in self.__list_files():
+            if entry.path in self.__queued or entry.path in self.__in_flight:
+                continue
+            stat = entry.stat()
+            current: Tuple[int, float] = (stat.st_size, stat.st_mtime)
+            if self.__pending_sizes.get(entry.path) == current:
+                arrived.append((stat.st_mtime, entry.path))
+            else:
+                pending_sizes[entry.path] = current
+        self.__pending_sizes = pending_sizes
+        for _, filepath in sorted(arrived):
+            self.__enqueue(filepath)
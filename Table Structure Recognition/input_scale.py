@@ -0,0 +1,87 @@
+"""
+Content-adaptive input scale of the detector.
+
+The test pipeline resizes every page to img_scale (1333, 800), a sparse letter with a single table as well as a dense
+spreadsheet printout. A cheap pre-pass on a thumbnail of the page estimates its density from the ink coverage and the
+number of ruling lines. Sparse pages are detected at a smaller scale, which is faster, dense pages at a larger scale,
+which keeps small cells detectable.
+"""
+from dataclasses import dataclass
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# long side of the thumbnail the density is estimated on
+THUMBNAIL_LONG_SIDE: int = 512
+# minimum length of a ruling line, relative to the thumbnail width or height
+MIN_LINE_LENGTH: float = 0.1
+
+
+@dataclass(frozen=True)
+class PageDensity:
+    # share of dark pixels of the page
+    ink: float
+    # number of horizontal and vertical ruling lines
+    lines: int
+
+
+@dataclass(frozen=True)
+class InputScaler:
+    """
+    Picks the img_scale of the test pipeline for every page.
+    A page is sparse if its ink and its lines are below the sparse limits and dense if one of them reaches the dense
+    limit. All other pages keep the default scale.
+    """
+    sparse_scale: Tuple[int, int] = (1024, 640)
+    default_scale: Tuple[int, int] = (1333, 800)
+    dense_scale: Tuple[int, int] = (1600, 960)
+    sparse_ink: float = 0.04
+    dense_ink: float = 0.12
+    sparse_lines: int = 8
+    dense_lines: int = 40
+
+    def img_scale(self, image: np.ndarray) -> Tuple[int, int]:
+        """
+        Args:
+            image: decoded BGR page
+        Returns: img_scale for the test pipeline
+        """
+        density: PageDensity = estimate_density(image)
+        if density.ink >= self.dense_ink or density.lines >= self.dense_lines:
+            return self.dense_scale
+        if density.ink < self.sparse_ink and density.lines < self.sparse_lines:
+            return self.sparse_scale
+        return self.default_scale
+
+
+def native_scale(image: np.ndarray) -> Tuple[int, int]:
+    """
+    Returns: img_scale for the test pipeline which keeps the image at its own resolution, Resize scales the long side
+    to the first and the short side to the second value
+    """
+    height, width = image.shape[:2]
+    return max(height, width), min(height, width)
+
+
+def estimate_density(image: np.ndarray) -> PageDensity:
+    """
+    Estimates the density of the page on a thumbnail, independent of the resolution of the page.
+    """
+    factor: float = THUMBNAIL_LONG_SIDE / max(image.shape[:2])
+    thumbnail: np.ndarray = image
+    if factor < 1:
+        thumbnail = cv2.resize(image, (max(1, int(image.shape[1] * factor)), max(1, int(image.shape[0] * factor))),
+                               interpolation=cv2.INTER_AREA)
+    gray: np.ndarray = thumbnail if thumbnail.ndim == 2 else cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    height, width = ink.shape
+    # a rough line count: an opening of the Otsu ink with line kernels of MIN_LINE_LENGTH of the thumbnail.
+    # Cheaper than the adaptive threshold, dilation and Hough transform of Functions/line_detection.py.
+    horizontal: np.ndarray = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(
+        cv2.MORPH_RECT, (max(2, int(width * MIN_LINE_LENGTH)), 1)))
+    vertical: np.ndarray = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(
+        cv2.MORPH_RECT, (1, max(2, int(height * MIN_LINE_LENGTH)))))
+    # connectedComponents counts the background as well
+    lines: int = cv2.connectedComponents(horizontal)[0] - 1 + cv2.connectedComponents(vertical)[0] - 1
+    return PageDensity(float(np.count_nonzero(ink)) / ink.size, lines)
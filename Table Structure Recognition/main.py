@@ -8,7 +8,11 @@ from mmdet.apis import inference_detector, init_detector
 from pdf2image import convert_from_path
 
 from Functions.blessFunc import borderless
+from Functions.borderFunc import CELL_ENGINE_LEGACY
+from Functions.line_detection import PageLines
 from border import border
+from detection_result import DetectionResult
+from detector import BUCKET_WINDOW_BATCHES, disable_masks, inference_detector_batch
 
 SCRIPTS_LOCATION: str = "/home/makn/workspace-uni/CascadeTabNetTests"
 CASCADE_TAB_NET_REPO_LOCATION: str = SCRIPTS_LOCATION + "/CascadeTabNet"
@@ -20,15 +24,21 @@ xmlPath = '/home/makn/Downloads/sample-xml/'
 
 config_fname = CASCADE_TAB_NET_REPO_LOCATION + "/Config/cascade_mask_rcnn_hrnetv2p_w32_20e.py"
 checkpoint_file = SCRIPTS_LOCATION + "/epoch_36.pth"
+# cell formation of bordered and borderless tables, see Functions.borderFunc.CELL_ENGINES
+CELL_ENGINE: str = CELL_ENGINE_LEGACY
 
 model = init_detector(config_fname, checkpoint_file)
+# only the boxes of the detections are used, the mask branch is skipped
+disable_masks(model)
 
 
-def process_image(image_path: str):
+def process_image(image_path: str, image=None, result=None):
     """
 
     Args:
         image_path:
+        image: image_path decoded with cv2.imread, it is decoded here if not given
+        result: already computed inference_detector result for this image, e.g. from inference_detector_batch
 
     Returns:
 
@@ -39,22 +49,25 @@ def process_image(image_path: str):
         detection results directly.
     -> this version should return a generator
     """
-    result = inference_detector(model, image_path)
-    # result border?!?
-    result_border: list = extract_border(result)
-    # result borderless ?!?
-    result_borderless: list = extract_borderless(result)
-    # result cell ?!?
-    res_cell: list = extract_cell(result)
+    if image is None:
+        image = cv2.imread(image_path)
+    if result is None:
+        result = inference_detector(model, image)
+    detections: DetectionResult = DetectionResult.from_mmdet(result)
+    # [top-left-x, top-left-y, bottom-right-x, bottom-right-y] of every table above the threshold
+    result_border = detections.bordered_tables()
+    result_borderless = detections.borderless_tables()
+    # cells with their score in percent as fifth element
+    res_cell = detections.cells()
     root: etree.Element = etree.Element("document")
 
     # if border tables detected
     if len(result_border) != 0:
-        root = handle_border(root, result_border, image_path)
+        root = handle_border(root, result_border, image)
 
     if len(result_borderless) != 0:
         if len(res_cell) != 0:
-            root = handle_borderless_with_cells(result_borderless, root, res_cell, image_path)
+            root = handle_borderless_with_cells(result_borderless, root, res_cell, image)
 
     write_to_file(image_path, root)
 
@@ -66,67 +79,26 @@ def write_to_file(image_path: str, root: etree.Element):
     myfile.close()
 
 
-def handle_border(root: etree.Element, result_border: list, image_path: str) -> etree.Element:
-    # call border script for each table in image
+def handle_border(root: etree.Element, result_border: list, image) -> etree.Element:
+    if len(result_border) == 0:
+        return root
+    # call border script for each table in image, the lines of the page are detected once for all tables
+    page_lines: PageLines = PageLines(image, result_border)
     for res in result_border:
         try:
-            root.append(border(res, cv2.imread(image_path)))
+            root.append(border(res, image, page_lines=page_lines, engine=CELL_ENGINE))
         except:
             pass
     return root
 
 
 def handle_borderless_with_cells(result_borderless: list, root: etree.Element, res_cell: list,
-                                 image_path: str) -> etree.Element:
+                                 image) -> etree.Element:
     for no, result in enumerate(result_borderless):
-        root.append(borderless(result, cv2.imread(image_path), res_cell))
+        root.append(borderless(result, image, res_cell, CELL_ENGINE))
     return root
 
 
-def extract_border(result) -> list:
-    # for border
-    res_border: list = []
-    for r in result[0][0]:
-        if r[4] > .85:
-            res_border.append(r[:4].astype(int))
-    return res_border
-
-
-def extract_borderless(result) -> list:
-    """
-    extracts borderless masks from result
-    Args:
-        result:
-
-    Returns: a list of the borderless tables. Each array describes a borderless table bounding box.
-    the two coordinates in the array are the top right and bottom left coordinates of the bounding box.
-    """
-    result_borderless = []
-    for r in result[0][2]:
-        if r[4] > .85:
-            # slices the threshold value of
-            result_borderless.append(r[:4].astype(int))
-    return result_borderless
-
-
-def extract_cell(result) -> list:
-    """
-
-    Args:
-        result: inference_detector result
-
-    Returns: the array of detected cells. Each array describes a cell bounding box.
-    the two coordinates of the array are the top right and bottom left coordinates of the bounding box.
-    """
-    result_cell = []
-    # for cells
-    for r in result[0][1]:
-        if r[4] > .85:
-            r[4] = r[4] * 100
-            result_cell.append(r.astype(int))
-    return result_cell
-
-
 def convert_file(filepath: str) -> str:
     filename, file_extension = os.path.splitext(os.path.basename(filepath))
     if ".pdf" in file_extension:
@@ -142,9 +114,15 @@ def convert_file(filepath: str) -> str:
 def main():
     # List of images in the image_path
     imgs = glob.glob(IMAGE_PATH)
-    for image_path in imgs:
-        image_path = convert_file(image_path)
-        process_image(image_path)
+    image_paths = [convert_file(image_path) for image_path in imgs]
+    # detection runs batched, pages with a similar aspect ratio share a batch
+    chunk_size = model.cfg.data.get('imgs_per_gpu', 1) * BUCKET_WINDOW_BATCHES
+    for start in range(0, len(image_paths), chunk_size):
+        chunk = image_paths[start:start + chunk_size]
+        # every image is decoded once and shared by the detection and the table handlers
+        images = [cv2.imread(image_path) for image_path in chunk]
+        for image_path, image, result in zip(chunk, images, inference_detector_batch(model, images)):
+            process_image(image_path, image, result)
 
 
 if __name__ == "__main__":
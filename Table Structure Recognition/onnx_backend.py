@@ -0,0 +1,97 @@
+"""
+ONNX Runtime backend for the backbone and neck of the CascadeTabNet detector.
+
+The HRNet backbone and its HRFPN neck are exported to ONNX (see export_onnx.py) and run with ONNX Runtime on the CPU.
+The cascade heads of mmdetection 1.x use custom RoIAlign and NMS ops which can't be exported with torch 1.4, they keep
+running in PyTorch on the features ONNX Runtime computed. The backbone and neck make up most of the CPU inference
+time, and the heads still produce the usual result structure (result[0][class]). inference_detector and
+inference_detector_batch can therefore be used unchanged.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+import onnxruntime
+import torch
+
+INPUT_NAME: str = "img"
+OUTPUT_NAME_PREFIX: str = "feature"
+OPSET_VERSION: int = 11
+# (height, width) of the dummy input, a page scaled to img_scale (1333, 800) and padded to size_divisor 32
+EXPORT_SHAPE_DEFAULT: Tuple[int, int] = (1344, 960)
+
+
+class FeatureExtractor(torch.nn.Module):
+    """
+    The backbone and neck of a detector as separate module, mirrors TwoStageDetector.extract_feat.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.backbone = model.backbone
+        self.neck = model.neck
+
+    def forward(self, img: torch.Tensor) -> tuple:
+        return tuple(self.neck(self.backbone(img)))
+
+
+def export_features(model, onnx_filepath: str, shape: Tuple[int, int] = EXPORT_SHAPE_DEFAULT,
+                    opset_version: int = OPSET_VERSION) -> List[str]:
+    """
+    Exports the backbone and neck of the model with dynamic batch size, height and width.
+    Args:
+        model: model built with init_detector
+        onnx_filepath: file the graph is written to
+        shape: (height, width) of the dummy input the graph is traced with
+        opset_version: onnx opset
+    Returns: names of the feature outputs, one per level of the neck
+    """
+    extractor: FeatureExtractor = FeatureExtractor(model).eval()
+    dummy: torch.Tensor = torch.zeros((1, 3) + tuple(shape), device=next(model.parameters()).device)
+    with torch.no_grad():
+        levels: int = len(extractor(dummy))
+    output_names: List[str] = [OUTPUT_NAME_PREFIX + str(level) for level in range(levels)]
+    dynamic_axes: dict = {name: {0: "batch", 2: name + "_height", 3: name + "_width"} for name in output_names}
+    dynamic_axes[INPUT_NAME] = {0: "batch", 2: "height", 3: "width"}
+    torch.onnx.export(extractor, dummy, onnx_filepath, input_names=[INPUT_NAME], output_names=output_names,
+                      dynamic_axes=dynamic_axes, opset_version=opset_version, do_constant_folding=True)
+    return output_names
+
+
+class OnnxFeatures:
+    """
+    Drop-in replacement for model.extract_feat which runs the exported backbone and neck with ONNX Runtime.
+    """
+    __session: onnxruntime.InferenceSession
+    __input_name: str
+
+    def __init__(self, onnx_filepath: str, threads: Optional[int] = None):
+        """
+        Args:
+            onnx_filepath: graph written by export_features
+            threads: intra-op threads of ONNX Runtime, defaults to the number of cores
+        """
+        options: onnxruntime.SessionOptions = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads is not None:
+            options.intra_op_num_threads = threads
+        self.__session = onnxruntime.InferenceSession(onnx_filepath, options, providers=["CPUExecutionProvider"])
+        self.__input_name = self.__session.get_inputs()[0].name
+
+    def __call__(self, img: torch.Tensor) -> tuple:
+        outputs: List[np.ndarray] = self.__session.run(None, {self.__input_name: img.detach().cpu().numpy()})
+        return tuple(torch.from_numpy(output).to(img.device) for output in outputs)
+
+
+def use_onnx_features(model, onnx_filepath: str, threads: Optional[int] = None):
+    """
+    Lets the model compute its features with ONNX Runtime. The heads keep running in PyTorch.
+    """
+    model.extract_feat = OnnxFeatures(onnx_filepath, threads)
+
+
+def use_torch_features(model):
+    """
+    Reverts use_onnx_features.
+    """
+    if isinstance(model.__dict__.get("extract_feat"), OnnxFeatures):
+        del model.extract_feat
@@ -0,0 +1,262 @@
+"""
+Lazy access to the pages of an incoming file.
+
+PDFs are rendered one page at a time (first_page/last_page of pdf2image) and multi-page TIFFs are decoded frame by
+frame, such that only the pages which are currently processed are held in memory, independent of the document length.
+Every page is returned as BGR ndarray like cv2.imread returns it.
+
+For the two-resolution processing a page is only decoded at detection resolution (RegionPage). The regions of the
+detected tables are rendered or decoded at full resolution afterwards, the rest of the page never is. This only pays off
+for formats which can be decoded at a lower resolution directly: PDFs are rendered at the lower dpi and libjpeg scales
+the DCT while decoding a JPEG. TIFFs and the other raster images would be decoded at full resolution for the
+detection and again for the regions, they stay in single-resolution mode (see has_region_pages).
+
+The RenderPool renders several pages concurrently (poppler and the decoders run outside of the GIL) and hands them out
+in order, while the number of rendered but not yet consumed pages stays bounded.
+"""
+import os
+import subprocess
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+PDF_DPI_DEFAULT: int = 500
+# an A4 page at 100 dpi is about 827x1169 pixels, close to the img_scale (1333, 800) of the test pipeline
+DETECTION_DPI_DEFAULT: int = 100
+# raster images are decoded with the largest reduction which keeps at least this long side for the detection
+DETECTION_LONG_SIDE: int = 1333
+
+IMREAD_REDUCTIONS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+RENDER_WORKERS_DEFAULT: int = 2
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+PDF_EXTENSIONS = (".pdf",)
+TIFF_EXTENSIONS = (".tif", ".tiff")
+# raster images which cv2 decodes reduced (IMREAD_REDUCED_*) without decoding the full resolution first
+REDUCED_DECODE_EXTENSIONS = (".jpg", ".jpeg", ".jpe")
+
+
+def _extension(filepath: str) -> str:
+    return os.path.splitext(filepath)[1].lower()
+
+
+def is_pdf(filepath: str) -> bool:
+    return _extension(filepath) in PDF_EXTENSIONS
+
+
+def is_tiff(filepath: str) -> bool:
+    return _extension(filepath) in TIFF_EXTENSIONS
+
+
+def has_region_pages(filepath: str) -> bool:
+    """
+    Returns: True if the pages of the file can be loaded with load_region_page, i.e. decoded at detection resolution
+        without decoding them at full resolution
+    """
+    return _extension(filepath) in PDF_EXTENSIONS + REDUCED_DECODE_EXTENSIONS
+
+
+def page_count(filepath: str) -> int:
+    """
+    Returns: number of pages of the file, 1 for single images
+    """
+    extension: str = _extension(filepath)
+    if extension in PDF_EXTENSIONS:
+        return int(pdfinfo_from_path(filepath)["Pages"])
+    if extension in TIFF_EXTENSIONS:
+        with Image.open(filepath) as image:
+            return getattr(image, "n_frames", 1)
+    return 1
+
+
+def load_page(filepath: str, index: int, dpi: int = PDF_DPI_DEFAULT) -> np.ndarray:
+    """
+    Args:
+        filepath: pdf, tiff or any other image cv2 can read
+        index: zero based page index
+        dpi: resolution pdf pages are rendered with
+    Returns: the decoded page
+    """
+    extension: str = _extension(filepath)
+    if extension in PDF_EXTENSIONS:
+        pages: list = convert_from_path(filepath, dpi, first_page=index + 1, last_page=index + 1)
+        if len(pages) == 0:
+            raise ValueError("Couldn't render page " + str(index + 1) + " of [" + filepath + "].")
+        return _to_bgr(pages[0])
+    if extension in TIFF_EXTENSIONS:
+        with Image.open(filepath) as image:
+            image.seek(index)
+            return _to_bgr(image)
+    if index != 0:
+        raise IndexError("[" + filepath + "] only has a single page.")
+    image_np = cv2.imread(filepath)
+    if image_np is None:
+        raise ValueError("Couldn't decode image [" + filepath + "].")
+    return image_np
+
+
+def iter_pages(filepath: str, dpi: int = PDF_DPI_DEFAULT) -> Iterator[np.ndarray]:
+    """
+    Yields the pages of the file one after another, the next page is only rendered when it is requested.
+    """
+    if _extension(filepath) in TIFF_EXTENSIONS:
+        # seeking to a frame walks through all previous frames, keep the file open instead
+        with Image.open(filepath) as image:
+            for frame in ImageSequence.Iterator(image):
+                yield _to_bgr(frame)
+        return
+    for index in range(page_count(filepath)):
+        yield load_page(filepath, index, dpi)
+
+
+def _to_bgr(image: Image.Image) -> np.ndarray:
+    return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+class RegionPage:
+    """
+    A page decoded at detection resolution. Regions of the page are loaded at full resolution on demand.
+    """
+    filepath: str
+    index: int
+    dpi: int
+    # the page at detection resolution
+    image: np.ndarray
+    # full resolution pixels per detection resolution pixel
+    scale: float
+    __shape: Tuple[int, int]
+
+    def __init__(self, filepath: str, index: int, dpi: int, image: np.ndarray, scale: float):
+        self.filepath = filepath
+        self.index = index
+        self.dpi = dpi
+        self.image = image
+        self.scale = scale
+        self.__shape = (int(round(image.shape[0] * scale)), int(round(image.shape[1] * scale)))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """
+        Returns: (height, width) of the page at full resolution
+        """
+        return self.__shape
+
+    def load_regions(self, boxes: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+        """
+        Args:
+            boxes: [top_left_x, top_left_y, bottom_right_x, bottom_right_y] in full resolution page coordinates
+        Returns: the regions at full resolution
+        """
+        if len(boxes) == 0:
+            return []
+        if _extension(self.filepath) in PDF_EXTENSIONS:
+            return [_render_pdf_region(self.filepath, self.index, self.dpi, box) for box in boxes]
+        # raster images can't be decoded partially, the full page is only held while the regions are copied
+        page: np.ndarray = load_page(self.filepath, self.index)
+        return [page[box[1]:box[3], box[0]:box[2]].copy() for box in boxes]
+
+
+def load_region_page(filepath: str, index: int, dpi: int = PDF_DPI_DEFAULT,
+                     detection_dpi: int = DETECTION_DPI_DEFAULT) -> RegionPage:
+    """
+    Args:
+        filepath: pdf or jpeg, see has_region_pages
+        index: zero based page index
+        dpi: full resolution pdf pages are rendered with
+        detection_dpi: resolution pdf pages are rendered with for the detection.
+            JPEGs are decoded reduced by a power of two instead, see DETECTION_LONG_SIDE.
+    Returns: the page at detection resolution
+    """
+    if not has_region_pages(filepath):
+        raise ValueError("[" + filepath + "] can't be decoded at detection resolution, load it with load_page.")
+    if _extension(filepath) in PDF_EXTENSIONS:
+        return RegionPage(filepath, index, dpi, load_page(filepath, index, detection_dpi), dpi / detection_dpi)
+    if index != 0:
+        raise IndexError("[" + filepath + "] only has a single page.")
+    with Image.open(filepath) as header:
+        width, height = header.size
+    reduction: int = _reduction(width, height)
+    flags: int = dict(IMREAD_REDUCTIONS).get(reduction, cv2.IMREAD_COLOR)
+    image: np.ndarray = cv2.imread(filepath, flags)
+    if image is None:
+        raise ValueError("Couldn't decode image [" + filepath + "].")
+    return RegionPage(filepath, index, dpi, image, width / image.shape[1])
+
+
+def _reduction(width: int, height: int) -> int:
+    for reduction, _ in IMREAD_REDUCTIONS:
+        if max(width, height) // reduction >= DETECTION_LONG_SIDE:
+            return reduction
+    return 1
+
+
+def _render_pdf_region(filepath: str, index: int, dpi: int, box: Tuple[int, int, int, int]) -> np.ndarray:
+    # pdftoppm crops while rendering, without an output root it writes the single page to stdout
+    command: List[str] = ["pdftoppm", "-f", str(index + 1), "-l", str(index + 1), "-r", str(dpi),
+                          "-x", str(box[0]), "-y", str(box[1]), "-W", str(box[2] - box[0]), "-H", str(box[3] - box[1]),
+                          "-png", filepath]
+    output: bytes = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout
+    region = cv2.imdecode(np.frombuffer(output, np.uint8), cv2.IMREAD_COLOR)
+    if region is None:
+        raise ValueError(
+            "Couldn't render region " + str(box) + " of page " + str(index + 1) + " of [" + filepath + "].")
+    return region
+
+
+class RenderPool:
+    """
+    Renders pages concurrently and hands them out in order.
+    At most max_pending pages are rendered (or being rendered) ahead of the consumer.
+    """
+    __workers: int
+    __max_pending: int
+
+    def __init__(self, workers: int = RENDER_WORKERS_DEFAULT, max_pending: Optional[int] = None):
+        """
+        Args:
+            workers: number of concurrent renders
+            max_pending: rendered but not consumed pages, defaults to twice the workers
+        """
+        if workers < 1:
+            raise ValueError("The render pool needs at least one worker, got " + str(workers) + ".")
+        self.__workers = workers
+        self.__max_pending = max(1, max_pending or 2 * workers)
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+
+    @property
+    def workers(self) -> int:
+        return self.__workers
+
+    @property
+    def max_pending(self) -> int:
+        return self.__max_pending
+
+    def map(self, function: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """
+        Like map(function, items), but the following items are already rendered while the consumer works on the
+        current one. items is consumed lazily, only max_pending items ahead of the consumer.
+        """
+        iterator: Iterator[T] = iter(items)
+        pending: Deque[Future] = deque()
+        try:
+            for item in iterator:
+                pending.append(self.__executor.submit(function, item))
+                if len(pending) >= self.__max_pending:
+                    yield pending.popleft().result()
+            while len(pending) != 0:
+                yield pending.popleft().result()
+        finally:
+            # the consumer stopped early or a render failed, don't render pages nobody will consume
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        self.__executor.shutdown(wait=True)
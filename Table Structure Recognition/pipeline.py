@@ -0,0 +1,116 @@
+"""
+Staged pipeline with bounded queues.
+
+Every stage runs its function with its own number of threads and hands the item over to the next stage through a
+bounded queue. A full queue blocks the previous stage (backpressure), such that e.g. the detection of the next page
+overlaps with the OCR of the current page without piling up decoded pages in memory.
+"""
+import threading
+from queue import Empty, Queue
+from typing import Any, Callable, List, Optional
+
+from loguru import logger
+
+QUEUE_SIZE_DEFAULT: int = 4
+
+# marks the end of the input for a single worker thread
+_STOP = object()
+
+
+class Stage:
+    """
+    A single step of the pipeline. The function processes an item in place.
+    """
+    name: str
+    function: Callable[[Any], None]
+    workers: int
+    queue_size: int
+
+    def __init__(self, name: str, function: Callable[[Any], None], workers: int = 1,
+                 queue_size: int = QUEUE_SIZE_DEFAULT):
+        """
+        Args:
+            name: name of the stage for logging
+            function: processes an item in place, raising an exception aborts the item
+            workers: number of threads which run the function concurrently
+            queue_size: number of items which may wait in front of this stage
+        """
+        if workers < 1:
+            raise ValueError("Stage [" + name + "] needs at least one worker, got " + str(workers) + ".")
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue_size = queue_size
+
+
+class StagedPipeline:
+    """
+    Runs the items through all stages in order.
+    Items which finished the last stage or failed in any stage are reported by completed().
+    """
+    __stages: List[Stage]
+    __queues: List[Queue]
+    __threads: List[List[threading.Thread]]
+    __done: Queue
+
+    def __init__(self, stages: List[Stage]):
+        self.__stages = stages
+        self.__queues = [Queue(maxsize=stage.queue_size) for stage in stages]
+        # the completed items are not bounded, otherwise a caller which blocks in submit could never drain them
+        self.__done = Queue()
+        self.__threads = []
+        for index, stage in enumerate(stages):
+            threads: List[threading.Thread] = [
+                threading.Thread(target=self.__run, args=(index,), name=stage.name + "-" + str(number), daemon=True)
+                for number in range(stage.workers)]
+            for thread in threads:
+                thread.start()
+            self.__threads.append(threads)
+
+    def submit(self, item):
+        """
+        Hands an item to the first stage. Blocks while the first stage is saturated.
+        """
+        self.__queues[0].put(item)
+
+    def completed(self, timeout: Optional[float] = None) -> List:
+        """
+        Args:
+            timeout: seconds to wait for the first completed item, None returns immediately
+        Returns: the items which left the pipeline (successfully or not) since the last call
+        """
+        items: List = []
+        try:
+            if timeout is not None:
+                items.append(self.__done.get(timeout=timeout))
+            while True:
+                items.append(self.__done.get_nowait())
+        except Empty:
+            pass
+        return items
+
+    def shutdown(self):
+        """
+        Lets all submitted items pass through the pipeline and stops the threads stage by stage.
+        """
+        for index, threads in enumerate(self.__threads):
+            for _ in threads:
+                self.__queues[index].put(_STOP)
+            for thread in threads:
+                thread.join()
+
+    def __run(self, index: int):
+        stage: Stage = self.__stages[index]
+        inbox: Queue = self.__queues[index]
+        outbox: Queue = self.__queues[index + 1] if index + 1 < len(self.__queues) else self.__done
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                break
+            try:
+                stage.function(item)
+            except Exception:
+                logger.exception("Stage [{}] failed for [{}]", stage.name, item)
+                self.__done.put(item)
+                continue
+            outbox.put(item)
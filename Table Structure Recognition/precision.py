@@ -0,0 +1,72 @@
+"""
+Inference precision profiles for CPU inference.
+
+fp32: the model as trained.
+int8: dynamic INT8 quantization. The weights are stored as int8 and the activations are quantized on the fly. In torch
+    1.4 dynamic quantization only covers nn.Linear, which are the shared fully connected layers of the three cascade
+    bbox heads. The convolutions of the HRNet backbone would need static quantization with calibration data.
+bf16: the backbone and neck run under bf16 autocast. The features are cast back to fp32 for the heads. Requires
+    torch.cpu.amp (torch >= 1.10) and a CPU with native bf16 support, otherwise the model keeps running in fp32.
+
+See Evaluations/Tablebank/compare_precision.py for the accuracy of every profile compared to fp32.
+"""
+from typing import Callable
+
+import torch
+from loguru import logger
+
+PRECISION_FP32: str = "fp32"
+PRECISION_INT8: str = "int8"
+PRECISION_BF16: str = "bf16"
+PRECISIONS = (PRECISION_FP32, PRECISION_INT8, PRECISION_BF16)
+
+# cpu flags which indicate native bf16 instructions, emulated bf16 is slower than fp32
+BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+def bf16_supported() -> bool:
+    """
+    Returns: True if torch offers bf16 autocast on the cpu and the cpu executes bf16 natively
+    """
+    if not hasattr(torch, "cpu") or not hasattr(torch.cpu, "amp"):
+        return False
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            flags: str = cpuinfo.read()
+    except OSError:
+        return False
+    return any(flag in flags for flag in BF16_CPU_FLAGS)
+
+
+def apply_precision(model, precision: str = PRECISION_FP32):
+    """
+    Converts a model built with init_detector on the cpu to the precision profile.
+    Args:
+        model: model built with init_detector
+        precision: one of PRECISIONS
+    Returns: the converted model, int8 converts the model in place
+    """
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision [" + precision + "], expected one of " + str(list(PRECISIONS)) + ".")
+    if precision == PRECISION_FP32:
+        return model
+    if next(model.parameters()).device.type != "cpu":
+        raise ValueError("The precision [" + precision + "] is only available for models on the cpu.")
+    if precision == PRECISION_INT8:
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if "extract_feat" in model.__dict__:
+        raise ValueError("The features of the model are already replaced, e.g. by the ONNX Runtime backend.")
+    if not bf16_supported():
+        logger.warning("bf16 isn't supported by this torch version or cpu, running in fp32.")
+        return model
+    model.extract_feat = _bf16_features(model.extract_feat)
+    return model
+
+
+def _bf16_features(extract_feat: Callable) -> Callable:
+    def extract_feat_bf16(img: torch.Tensor) -> tuple:
+        with torch.cpu.amp.autocast(dtype=torch.bfloat16):
+            features: tuple = extract_feat(img)
+        return tuple(level.float() for level in features)
+
+    return extract_feat_bf16
@@ -0,0 +1,741 @@
+"""
+Long-lived table recognizer for the shared_file_format extraction.
+
+The detector is built once per process and reused for every image, such that the steady-state latency of a page
+only consists of the inference and the table structure recognition. Multi-page files are streamed page by page into a
+single document.
+
+The text of the cells is taken from the text layer of born-digital PDFs, only pages without one are OCRed.
+In the two-pass mode the cells of borderless tables are detected again on the crop of every table, where they aren't
+shrunk by the resize of the whole page to the input size of the model.
+In the two-resolution mode the pages are only decoded at detection resolution. The detected tables are loaded at full
+resolution for the structure recognition and the OCR, the remaining page is never rendered at full resolution. Only
+PDFs and JPEGs take this path, other raster images can't be decoded reduced and are processed at full resolution.
+"""
+import math
+import os
+import threading
+from itertools import groupby, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from docrecjson.commontypes import Point
+from docrecjson.elements import Document
+from loguru import logger
+from mmdet.apis import inference_detector, init_detector
+
+from Functions.borderFunc import CELL_ENGINE_LEGACY
+from Functions.line_detection import PageLines
+from border import extract_bordered_table_layout
+from borderless import extract_borderless_table_layout
+from cascade_exit import EarlyExit
+from detection_result import CLASS_BORDERED, CLASS_BORDERLESS, CLASS_CELL, THRESHOLD_DEFAULT, DetectionResult
+from detector import BUCKET_WINDOW_BATCHES, ImageInput, apply_cfg_options, disable_masks, inference_detector_batch, \
+    inference_detector_early_exit, normalize_result
+from input_scale import InputScaler, native_scale
+from page_source import PDF_DPI_DEFAULT, RENDER_WORKERS_DEFAULT, RegionPage, RenderPool, has_region_pages, is_pdf, \
+    is_tiff, iter_pages, load_page, load_region_page, page_count
+from precision import PRECISION_FP32, apply_precision
+from table_layout import CellLayout, TableLayout, TableRegion, add_table_layout, recognize_region_text, \
+    recognize_text, translate_layout
+from text_layer import PageWords, TextLayer, assign_words
+
+THRESHOLD_VALUE_CELL: float = THRESHOLD_DEFAULT
+
+# full resolution pixels around a detected table which are loaded together with the table
+REGION_PADDING: int = 20
+
+Page = Union[np.ndarray, RegionPage]
+# the document of a file or the error which stopped its recognition
+FileResult = Union[Document, Exception]
+
+
+class TableRecognizer:
+    """
+    Holds the warm CascadeTabNet model together with its config and thresholds.
+    Build it once and call process_image for every incoming image.
+    """
+    __config_filepath: str
+    __checkpoint_filepath: str
+    __threshold: float
+    __class_thresholds: Dict[int, float]
+    __top_k: Dict[int, int]
+    __batch_size: int
+    __dpi: int
+    __detection_dpi: Optional[int]
+    __render_pool: RenderPool
+    __use_text_layer: bool
+    __early_exit: Optional[EarlyExit]
+    __cell_pass: bool
+    __input_scaler: Optional[InputScaler]
+    __cell_engine: str
+    __model_lock: threading.Lock
+
+    def __init__(self, config_filepath: str, checkpoint_filepath: str, threshold: float = THRESHOLD_VALUE_CELL,
+                 device: str = "cuda:0", batch_size: Optional[int] = None, dpi: int = PDF_DPI_DEFAULT,
+                 detection_dpi: Optional[int] = None, render_workers: int = RENDER_WORKERS_DEFAULT,
+                 use_text_layer: bool = True, class_thresholds: Optional[Dict[int, float]] = None,
+                 top_k: Optional[Dict[int, int]] = None, onnx_filepath: Optional[str] = None,
+                 precision: str = PRECISION_FP32, box_only: bool = True, early_exit: Optional[EarlyExit] = None,
+                 cell_pass: bool = False, cfg_options: Optional[Dict[str, Any]] = None,
+                 input_scaler: Optional[InputScaler] = None, cell_engine: str = CELL_ENGINE_LEGACY):
+        """
+        Args:
+            config_filepath: path to the mmdetection config, e.g. Config/cascade_mask_rcnn_hrnetv2p_w32_20e.py
+            checkpoint_filepath: path to the pretrained checkpoint, e.g. epoch_36.pth
+            threshold: minimum detection score for tables and cells
+            device: torch device the model is loaded onto
+            batch_size: pages per forward pass in process_files, defaults to imgs_per_gpu of the config
+            dpi: resolution pdf pages are rendered with
+            detection_dpi: enables the two-resolution mode, pdf pages are rendered with this resolution for the
+                detection and only the table regions with dpi. JPEGs are decoded reduced for the detection, all other
+                raster images (e.g. TIFFs) stay at full resolution.
+            render_workers: pages which are rendered concurrently in process_files
+            use_text_layer: take the cell text from the text layer of pdfs instead of OCR where available
+            class_thresholds: minimum detection score per class (see detection_result.CLASS_*), overrides threshold
+            top_k: maximum number of detections per class, e.g. to bound the cells of a noisy page
+            onnx_filepath: backbone and neck exported with export_onnx.py, they are run with ONNX Runtime instead of
+                PyTorch. Meant for device="cpu".
+            precision: inference precision profile on the cpu, see precision.PRECISIONS
+            box_only: skip the mask branch of the model, only the boxes of the detections are used
+            early_exit: skip the remaining cascade stages on confident pages, requires box_only
+            cell_pass: detect the cells of borderless tables again on the table crops, see detect_cells
+            cfg_options: overrides of the model config, e.g. a test_cfg from Evaluations/tune_test_cfg.py
+            input_scaler: picks the detector input scale of every page from its density instead of the scale of the
+                config. The crops of the cell pass are detected at their native resolution regardless.
+            cell_engine: cell formation of the tables, see Functions.borderFunc.CELL_ENGINES
+        """
+        self.__config_filepath = config_filepath
+        self.__checkpoint_filepath = checkpoint_filepath
+        self.__threshold = threshold
+        self.__class_thresholds = {label: threshold for label in (CLASS_BORDERED, CLASS_CELL, CLASS_BORDERLESS)}
+        self.__class_thresholds.update(class_thresholds or {})
+        self.__top_k = dict(top_k or {})
+        self.__dpi = dpi
+        self.__detection_dpi = detection_dpi
+        self.__render_pool = RenderPool(render_workers)
+        self.__use_text_layer = use_text_layer
+        if early_exit is not None and not box_only:
+            raise ValueError("The early exit of the cascade is only available in the box-only mode.")
+        self.__early_exit = early_exit
+        self.__cell_pass = cell_pass
+        self.__input_scaler = input_scaler
+        self.__cell_engine = cell_engine
+        # the model is used by the detection and, in the two-pass mode, by the structure recognition threads of the
+        # staged pipeline. Only one inference runs at a time, detector.precomputed_features replaces model attributes.
+        self.__model_lock = threading.Lock()
+        logger.info("Loading model [{}] with config [{}]", checkpoint_filepath, config_filepath)
+        self.model = init_detector(config_filepath, checkpoint_filepath, device=device)
+        if cfg_options:
+            logger.info("Overriding the model config with {}", cfg_options)
+            apply_cfg_options(self.model, cfg_options)
+        if box_only:
+            disable_masks(self.model)
+        if onnx_filepath:
+            # onnxruntime is only required for the ONNX backend
+            from onnx_backend import use_onnx_features
+            logger.info("Computing the features with ONNX Runtime from [{}]", onnx_filepath)
+            use_onnx_features(self.model, onnx_filepath)
+        if precision != PRECISION_FP32:
+            logger.info("Running the model with precision [{}]", precision)
+            self.model = apply_precision(self.model, precision)
+        self.__batch_size = batch_size or self.model.cfg.data.get('imgs_per_gpu', 1)
+
+    @property
+    def config_filepath(self) -> str:
+        return self.__config_filepath
+
+    @property
+    def checkpoint_filepath(self) -> str:
+        return self.__checkpoint_filepath
+
+    @property
+    def threshold(self) -> float:
+        return self.__threshold
+
+    @property
+    def class_thresholds(self) -> Dict[int, float]:
+        return dict(self.__class_thresholds)
+
+    @property
+    def top_k(self) -> Dict[int, int]:
+        return dict(self.__top_k)
+
+    @property
+    def batch_size(self) -> int:
+        return self.__batch_size
+
+    @property
+    def dpi(self) -> int:
+        return self.__dpi
+
+    @property
+    def detection_dpi(self) -> Optional[int]:
+        return self.__detection_dpi
+
+    def load_page(self, filepath: str, index: int) -> Page:
+        """
+        Returns: the page of the file, at detection resolution in the two-resolution mode if the format supports it
+            (see has_region_pages)
+        """
+        if self.__detection_dpi is None or not has_region_pages(filepath):
+            return load_page(filepath, index, self.__dpi)
+        return load_region_page(filepath, index, self.__dpi, self.__detection_dpi)
+
+    def iter_pages(self, filepaths: List[str]) -> Iterator[Tuple[int, int, Union[Page, Exception]]]:
+        """
+        Yields (file index, page index, page) for all pages of the files in order.
+        The following pages are rendered concurrently by the render pool while the current page is processed.
+        The frames of TIFF files are decoded one after another instead, seeking to a frame walks through all
+        previous frames.
+        A file which can't be read yields the error in place of the page, its remaining pages are skipped.
+        """
+        for tiff, files in groupby(enumerate(filepaths), key=lambda file: is_tiff(file[1])):
+            if tiff:
+                for file_index, filepath in files:
+                    yield from self.__iter_frames(file_index, filepath)
+                continue
+            yield from self.__render_pool.map(lambda key: self.__render(filepaths, *key), _page_keys(files))
+
+    def __render(self, filepaths: List[str], file_index: int, page_index: int,
+                 error: Optional[Exception]) -> Tuple[int, int, Union[Page, Exception]]:
+        if error is not None:
+            return file_index, page_index, error
+        try:
+            return file_index, page_index, self.load_page(filepaths[file_index], page_index)
+        except Exception as error:
+            logger.exception("Couldn't load page {} of [{}]", page_index + 1, filepaths[file_index])
+            return file_index, page_index, error
+
+    def __iter_frames(self, file_index: int, filepath: str) -> Iterator[Tuple[int, int, Union[Page, Exception]]]:
+        page_index: int = 0
+        try:
+            # TIFFs are decoded at full resolution in the two-resolution mode as well, see has_region_pages
+            for page_index, page in enumerate(iter_pages(filepath, self.__dpi)):
+                yield file_index, page_index, page
+        except Exception as error:
+            logger.exception("Couldn't load page {} of [{}]", page_index + 1, filepath)
+            yield file_index, page_index, error
+
+    def text_layer(self, filepath: str) -> Optional[TextLayer]:
+        """
+        Returns: the lazily read text layer of the file, None if the file can't have one
+        """
+        if self.__use_text_layer and is_pdf(filepath):
+            return TextLayer(filepath, self.__dpi)
+        return None
+
+    def recognize_page_text(self, regions: List[TableRegion], text_layer: Optional[TextLayer],
+                            page_index: int) -> List[TableLayout]:
+        """
+        Recognizes the text of the cells of a page. The words of the text layer are used if the page has a usable
+        one, otherwise the cells are OCRed.
+        Args:
+            regions: recognized tables of the page
+            text_layer: text layer of the file, None to OCR the page
+            page_index: zero based page index
+        Returns: the layouts with the text of every cell, in page coordinates
+        """
+        words: Optional[PageWords] = text_layer.page_words(page_index) if text_layer is not None else None
+        if words is None:
+            return [recognize_region_text(region) for region in regions]
+        return [assign_words(translate_layout(region.layout, *region.offset), words) for region in regions]
+
+    def close(self):
+        """
+        Stops the render threads.
+        """
+        self.__render_pool.close()
+
+    def __enter__(self) -> 'TableRecognizer':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def process_image(self, image: ImageInput, filename: Optional[str] = None) -> Document:
+        """
+        Args:
+            image: image file path or image which was already decoded with cv2.imread
+            filename: filename for the document, defaults to the basename of the image path
+        Returns: shared_file_format document with the recognized table structure
+        """
+        image_np, filename = _decode(image, filename)
+        result = self.detect(image_np)
+        return self.create_document(image_np, result, filename)
+
+    def detections(self, result) -> DetectionResult:
+        """
+        Returns: the inference_detector result with the thresholds and top-k of this recognizer
+        """
+        return DetectionResult.from_mmdet(result, self.__class_thresholds, self.__top_k)
+
+    def detect(self, image: Page):
+        """
+        Args:
+            image: decoded image, read with cv2.imread, or a page at detection resolution
+        Returns: the inference_detector result for the image
+        """
+        detection_image: np.ndarray = _detection_image(image)
+        if self.__input_scaler is not None:
+            img_scale: Tuple[int, int] = self.__input_scaler.img_scale(detection_image)
+            logger.debug("Detecting with img_scale {}", img_scale)
+            with self.__model_lock:
+                return inference_detector_batch(self.model, [detection_image], 1, self.__early_exit,
+                                                img_scales=[img_scale])[0]
+        with self.__model_lock:
+            if self.__early_exit is None:
+                return normalize_result(inference_detector(self.model, detection_image))
+            result, stage = inference_detector_early_exit(self.model, detection_image, self.__early_exit)
+        logger.debug("Exited the cascade after stage {}", stage)
+        return result
+
+    def detect_cells(self, crops: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Second pass of the two-pass mode. The crops of all tables of a page are detected in batches at their native
+        resolution instead of the img_scale of the config, only the cells of the results are used.
+        Args:
+            crops: table crops at full resolution
+        Returns: the cells of every crop in crop coordinates, like DetectionResult.cells
+        """
+        if len(crops) == 0:
+            return []
+        with self.__model_lock:
+            results: list = inference_detector_batch(self.model, crops, self.__batch_size, self.__early_exit,
+                                                     img_scales=[native_scale(crop) for crop in crops])
+        return [self.detections(result).cells() for result in results]
+
+    def process_file(self, filepath: str) -> Document:
+        """
+        Args:
+            filepath: pdf, (multi-page) tiff or any other image
+        Returns: a single document with the tables of all pages
+        """
+        result: FileResult = self.process_files([filepath])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def process_files(self, filepaths: List[str]) -> List[FileResult]:
+        """
+        Streams the pages of all files through the batched detection, the structure recognition and the text
+        recognition.
+        Pages are rendered lazily and concurrently. The detection receives windows of BUCKET_WINDOW_BATCHES batches,
+        such that it can bucket the pages by aspect ratio. At most one window plus the pages rendered ahead by the
+        render pool are held in memory regardless of the document lengths.
+        A file which fails doesn't stop the others: its error is returned in place of its document and its remaining
+        pages are skipped.
+        Args:
+            filepaths: pdfs, (multi-page) tiffs or any other images
+        Returns: one document (or error) per file with the tables of all its pages, in the order of filepaths
+        """
+        layouts: List[List[TableLayout]] = [[] for _ in filepaths]
+        page_shapes: List[Optional[Tuple[int, int]]] = [None] * len(filepaths)
+        errors: List[Optional[Exception]] = [None] * len(filepaths)
+        text_layers: List[Optional[TextLayer]] = []
+        for file_index, filepath in enumerate(filepaths):
+            try:
+                text_layers.append(self.text_layer(filepath))
+            except Exception as error:
+                logger.exception("Couldn't open the text layer of [{}]", filepath)
+                errors[file_index] = error
+                text_layers.append(None)
+        for window in _chunks(self.iter_pages(filepaths), self.__batch_size * BUCKET_WINDOW_BATCHES):
+            for file_index, _, page in window:
+                if isinstance(page, Exception) and errors[file_index] is None:
+                    errors[file_index] = page
+            window = [item for item in window if errors[item[0]] is None]
+            for (file_index, page_index, page), result in zip(window, self.__detect_window(window, filepaths, errors)):
+                if errors[file_index] is not None:
+                    continue
+                if page_shapes[file_index] is None:
+                    page_shapes[file_index] = page.shape[:2]
+                try:
+                    regions: List[TableRegion] = self.recognize_regions(page, result, page_index + 1)
+                    layouts[file_index].extend(self.recognize_page_text(regions, text_layers[file_index],
+                                                                        page_index))
+                except Exception as error:
+                    logger.exception("Couldn't recognize page {} of [{}]", page_index + 1, filepaths[file_index])
+                    errors[file_index] = error
+
+        results: List[FileResult] = []
+        for filepath, page_shape, file_layouts, error in zip(filepaths, page_shapes, layouts, errors):
+            if error is None and page_shape is None:
+                error = ValueError("[" + filepath + "] doesn't contain any page.")
+            if error is not None:
+                results.append(error)
+                continue
+            filename: str = os.path.basename(filepath)
+            results.append(finish_document(new_document(filename, page_shape), file_layouts, filename))
+        return results
+
+    def __detect_window(self, window: List[Tuple[int, int, Page]], filepaths: List[str],
+                        errors: List[Optional[Exception]]) -> list:
+        """
+        Detects the pages of the window in batches. If the batched detection fails, the pages are detected one by
+        one, such that only the files of the failing pages are marked in errors.
+        Returns: the inference_detector result of every page, None for failed pages
+        """
+        if len(window) == 0:
+            return []
+        exit_stages: List[int] = []
+        detection_images: List[np.ndarray] = [_detection_image(page) for _, _, page in window]
+        img_scales: Optional[List[Tuple[int, int]]] = None
+        if self.__input_scaler is not None:
+            img_scales = [self.__input_scaler.img_scale(image) for image in detection_images]
+            logger.debug("Detecting with img_scales {}", img_scales)
+        try:
+            with self.__model_lock:
+                results: list = inference_detector_batch(self.model, detection_images, self.__batch_size,
+                                                         self.__early_exit, exit_stages, img_scales)
+        except Exception as error:
+            if len(window) == 1:
+                logger.exception("Couldn't detect page {} of [{}]", window[0][1] + 1, filepaths[window[0][0]])
+                errors[window[0][0]] = error
+                return [None]
+            logger.exception("The batched detection failed, detecting the {} pages one by one.", len(window))
+            return [self.__detect_window([item], filepaths, errors)[0] for item in window]
+        if self.__early_exit is not None:
+            for (file_index, page_index, _), stage in zip(window, exit_stages):
+                logger.debug("Exited the cascade after stage {} on page {} of [{}]", stage, page_index + 1,
+                             filepaths[file_index])
+        return results
+
+    def create_document(self, image: np.ndarray, result, filename: str) -> Document:
+        """
+        Args:
+            image: decoded image the detection was executed on
+            result: inference_detector result of this image
+            filename: filename for the document
+        Returns: shared_file_format document with the recognized table structure
+        """
+        doc, layouts = self.recognize_structure(image, result, filename)
+        for layout in layouts:
+            recognize_text(layout, image)
+        return finish_document(doc, layouts, filename)
+
+    def recognize_structure(self, image: np.ndarray, result, filename: str) -> Tuple[Document, List[TableLayout]]:
+        """
+        Recognizes the table structure without the text of the cells.
+        Args:
+            image: decoded image the detection was executed on
+            result: inference_detector result of this image
+            filename: filename for the document
+        Returns: the created document together with the layouts of the detected tables.
+        The layouts are not part of the document yet, see finish_document.
+        """
+        return new_document(filename, image.shape[:2]), self.recognize_layouts(image, result)
+
+    def recognize_layouts(self, image: np.ndarray, result, page: int = 1) -> List[TableLayout]:
+        """
+        Recognizes the table structure of a single page without the text of the cells.
+        Args:
+            image: decoded page the detection was executed on
+            result: inference_detector result of this page
+            page: one based page number within the file
+        Returns: the layouts of the detected tables
+        """
+        tables, bordered, result_cells_detection = self.__select_tables(self.detections(result))
+
+        layouts: List[TableLayout]
+        if bordered is True:
+            layouts = _extract_bordered_layouts(image=image, bordered_tables=tables, engine=self.__cell_engine)
+        elif bordered is False and self.__cell_pass:
+            boxes: List[Tuple[int, int, int, int]] = [_region_box(table, image.shape[:2]) for table in tables]
+            table_cells: List[np.ndarray] = self.detect_cells([image[box[1]:box[3], box[0]:box[2]] for box in boxes])
+            layouts = [extract_borderless_table_layout(table, image, cells + [box[0], box[1], box[0], box[1], 0],
+                                                       self.__cell_engine)
+                       for table, box, cells in zip(tables, boxes, table_cells)]
+        elif bordered is False:
+            layouts = _extract_borderless_layouts(image=image, borderless_tables=tables,
+                                                  detected_cells=result_cells_detection, engine=self.__cell_engine)
+        else:
+            layouts = _extract_cells_without_table(detected_cells=result_cells_detection)
+
+        for layout in layouts:
+            layout.page = page
+        return layouts
+
+    def recognize_regions(self, page: Page, result, page_number: int = 1) -> List[TableRegion]:
+        """
+        Recognizes the table structure of a single page without the text of the cells.
+        For a page at detection resolution the detection result is scaled to full resolution and only the regions of
+        the detected tables are loaded at full resolution.
+        Args:
+            page: decoded page or page at detection resolution the detection was executed on
+            result: inference_detector result of this page
+            page_number: one based page number within the file
+        Returns: the layouts of the detected tables together with the image their text is recognized from
+        """
+        if not isinstance(page, RegionPage):
+            return [TableRegion(layout, page) for layout in self.recognize_layouts(page, result, page_number)]
+
+        tables, bordered, result_cells_detection = self.__select_tables(self.detections(result).scaled(page.scale))
+        if bordered is None:
+            layouts: List[TableLayout] = _extract_cells_without_table(detected_cells=result_cells_detection)
+            for layout in layouts:
+                layout.page = page_number
+            return [TableRegion(layout, None) for layout in layouts]
+
+        boxes: List[Tuple[int, int, int, int]] = [_region_box(table, page.shape) for table in tables]
+        # the scaled detection is only accurate up to the scale, the table box is widened by it
+        margin: int = int(math.ceil(page.scale))
+        crops: List[np.ndarray] = page.load_regions(boxes)
+        table_cells: List[Optional[np.ndarray]] = [None] * len(crops)
+        if not bordered and self.__cell_pass:
+            table_cells = self.detect_cells(crops)
+        regions: List[TableRegion] = []
+        for table, box, crop, cells in zip(tables, boxes, crops, table_cells):
+            offset: np.ndarray = np.array([box[0], box[1], box[0], box[1]])
+            local_table: np.ndarray = np.clip(table[:4] - offset + np.array([-margin, -margin, margin, margin]), 0,
+                                              [crop.shape[1], crop.shape[0], crop.shape[1], crop.shape[0]])
+            if bordered:
+                layout: TableLayout = extract_bordered_table_layout(local_table, crop, engine=self.__cell_engine)
+            elif cells is not None:
+                layout: TableLayout = extract_borderless_table_layout(local_table, crop, cells, self.__cell_engine)
+            else:
+                local_cells: np.ndarray = result_cells_detection[_centers_inside(result_cells_detection, box)] \
+                    - np.append(offset, 0)
+                layout: TableLayout = extract_borderless_table_layout(local_table, crop, local_cells,
+                                                                      self.__cell_engine)
+            layout.page = page_number
+            regions.append(TableRegion(layout, crop, (box[0], box[1])))
+        return regions
+
+    @staticmethod
+    def __select_tables(detections: DetectionResult) -> Tuple[np.ndarray, Optional[bool], np.ndarray]:
+        """
+        Returns: the detected tables, whether they are bordered (None if no table was detected) and the detected cells
+        """
+        # bordered_tables and borderless_tables contains the coordinates of each detected table in array form
+        # (0, 0) is at the top left
+        # [top-left-x, top-left-y, bottom-right-x, bottom-right-y]
+        bordered_tables: np.ndarray = detections.bordered_tables()
+        borderless_tables: np.ndarray = detections.borderless_tables()
+        result_cells_detection: np.ndarray = detections.cells()
+
+        if len(bordered_tables) != 0:
+            return bordered_tables, True, result_cells_detection
+        if len(borderless_tables) != 0:
+            return borderless_tables, False, result_cells_detection
+        # todo this handling is only advised if it can be ensured that there is definitely a table in the file
+        # ! and only a table, no text etc.
+        # This shall be either removed for other use cases or replaced by a previous table detection step
+        # e.g. another previous model detected a table on this file, but cascadetabnet did not
+        # -> handle this file as there was a table detected.
+        logger.warning("Executing table structure extraction without detected table.")
+        return bordered_tables, None, result_cells_detection
+
+
+def new_document(filename: str, page_shape: Tuple[int, int]) -> Document:
+    """
+    Args:
+        filename: filename for the document
+        page_shape: (height, width) of the (first) page
+    Returns: empty shared_file_format document for the CascadeTabNet revision
+    """
+    logger.info("Create json for [{}]", filename)
+    height, width = page_shape
+    doc: Document = Document.empty(filename=filename, original_image_size=(width, height))
+    doc.new_revision(independent_revision=True, name="CascadeTabNet")
+    doc.set_source_for_adding("prediction")
+    doc.add_creator("CascadeTabNet", "1.0")
+    return doc
+
+
+def _detection_image(page: Page) -> np.ndarray:
+    return page.image if isinstance(page, RegionPage) else page
+
+
+def _region_box(table, page_shape: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    height, width = page_shape
+    return (max(0, int(table[0]) - REGION_PADDING), max(0, int(table[1]) - REGION_PADDING),
+            min(width, int(table[2]) + REGION_PADDING), min(height, int(table[3]) + REGION_PADDING))
+
+
+def _centers_inside(cells: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+    """
+    Returns: boolean mask of the cells whose center lies within the box
+    """
+    centers_x: np.ndarray = (cells[:, 0] + cells[:, 2]) / 2
+    centers_y: np.ndarray = (cells[:, 1] + cells[:, 3]) / 2
+    return (box[0] <= centers_x) & (centers_x < box[2]) & (box[1] <= centers_y) & (centers_y < box[3])
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator: Iterator = iter(items)
+    chunk: list = list(islice(iterator, size))
+    while len(chunk) != 0:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _page_keys(files: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, int, Optional[Exception]]]:
+    """
+    Yields (file index, page index, None) for the pages of the files, (file index, 0, error) for a file whose pages
+    can't be counted.
+    """
+    for file_index, filepath in files:
+        try:
+            count: int = page_count(filepath)
+        except Exception as error:
+            logger.exception("Couldn't read the pages of [{}]", filepath)
+            yield file_index, 0, error
+            continue
+        for page_index in range(count):
+            yield file_index, page_index, None
+
+
+def _decode(image: ImageInput, filename: Optional[str] = None) -> Tuple[np.ndarray, str]:
+    """
+    Returns: the decoded image together with its filename
+    """
+    if isinstance(image, str):
+        image_np = cv2.imread(image)
+        if image_np is None:
+            raise ValueError("Couldn't decode image [" + image + "].")
+        return image_np, filename or os.path.basename(image)
+    if filename is None:
+        raise ValueError("A filename is required for an already decoded image.")
+    return image, filename
+
+
+def finish_document(document: Document, layouts: List[TableLayout], filename: str) -> Document:
+    """
+    Adds the table layouts, including their recognized text, to the document.
+    """
+    for layout in layouts:
+        add_table_layout(document, layout)
+
+    logger.debug("Created document from shared_file_format: \n{}", str(document.to_json()))
+    logger.info("Finished shared_file_format creation on: \n{}", filename)
+    return document
+
+
+def _extract_bordered_layouts(image: np.ndarray, bordered_tables: np.ndarray,
+                              engine: str = CELL_ENGINE_LEGACY) -> List[TableLayout]:
+    layouts: List[TableLayout] = []
+    if len(bordered_tables) == 0:
+        return layouts
+    # the page is binarized and its lines are detected once for all tables
+    page_lines: PageLines = PageLines(image, bordered_tables)
+    for table in bordered_tables:
+        layouts.append(extract_bordered_table_layout(table, image, page_lines=page_lines, engine=engine))
+
+    return layouts
+
+
+def _extract_borderless_layouts(image: np.ndarray, borderless_tables: np.ndarray,
+                                detected_cells: np.ndarray, engine: str = CELL_ENGINE_LEGACY) -> List[TableLayout]:
+    layouts: List[TableLayout] = []
+    for table in borderless_tables:
+        layouts.append(extract_borderless_table_layout(table, image, detected_cells, engine))
+
+    return layouts
+
+
+def _extract_cells_without_table(detected_cells: np.ndarray) -> List[TableLayout]:
+    result_cells_bounding_boxes: List[List[Point]] = create_bounding_boxes(detected_cells)
+
+    cells: List[CellLayout] = []
+    for cell in result_cells_bounding_boxes:
+        # the cell array has a weird format which produces conflicts with other applications in downstream tasks
+        # they produce a cross-like shape for detection
+        # this is the reason the cell list is reordered properly
+        cell_ordered: list = [cell[0], cell[2], cell[1], cell[3]]
+        # the cells are added without row and column span and without text
+        cells.append(CellLayout(cell_ordered, None, None, None, None, text_region=None))
+
+    if len(cells) == 0:
+        return []
+    return [TableLayout(get_table_coordinates_from_cells([cell.polygon for cell in cells]), bordered=None,
+                        cells=cells)]
+
+
+def get_table_coordinates_from_cells(cells: List[List[Point]]) -> list:
+    """
+    Computes the cell bounding box based on the already extracted cells.
+    It just needs to compute the lower left coordinate, as well as the upper right coordinate.
+    The remaining coordinates can be computed with _span_polygon
+    :param cells: polygons of all cells in the tables.
+                  The single coordinates are in the order as they are returned by _span_polygon.
+                  This is because _span_polygon was already used for the cell bounding box creation.
+    :return: all four rectangle coordinates of the table bounding box
+    """
+    all_x_values = []
+    all_y_values = []
+
+    for polygon in cells:
+        for point in polygon:
+            all_x_values.append(point[0])
+            all_y_values.append(point[1])
+
+    # lower left coordinate = min x coordinate + max y coordinate
+    # upper right coordinate = max x coordinate + min y coordinate
+    max_x = max(all_x_values)
+    min_x = min(all_x_values)
+    max_y = max(all_y_values)
+    min_y = min(all_y_values)
+
+    return _span_polygon((min_x, max_y), (max_x, min_y))
+
+
+def _span_polygon(point1: Tuple, point2: Tuple) -> list:
+    """
+    The sci tsr polygon bounding boxes do not have the necessary coordinate structure for the shared_file_format.
+    The coordinates are simply the lower left of the bbox and the upper right of the bbox.
+    But this is sufficient to construct the right square coordinates.
+    It's important that the coordinates are in the right order because the shared_file_format assumes that the last
+    coordinates are connected.
+    :param point1:  lower left coordinate
+    :param point2: upper right coordinate
+    :return: a list of four coordinates. with index:
+        0 = lower left
+        1 = lower right
+        2 = upper right
+        3 = upper left
+    """
+    # written not in a single statement for readability
+    # noinspection PyListCreation
+    polygon_points: list = []
+
+    polygon_points.append(point1)
+    # point2.x, point1.y = lower right
+    polygon_points.append((point2[0], point1[1]))
+    polygon_points.append(point2)
+    # point1.x, point2.y = upper left
+    polygon_points.append((point1[0], point2[1]))
+
+    return polygon_points
+
+
+def create_bounding_boxes(cells: list) -> List[List[Point]]:
+    bounding_box_cells: list = []
+    for cell in cells:
+        bounding_box_cells.append(handle_bounding_box_cell(cell))
+    return bounding_box_cells
+
+
+def handle_bounding_box_cell(cell: list) -> List[Point]:
+    if len(cell) != 5:
+        raise ValueError("The cell array didn't fulfill the expected length. Please check whether [" + str(
+            cell) + "] matches the expected requirements.")
+    return create_square((cell[0], cell[1]), (cell[2], cell[3]))
+
+
+def create_square(top_left: Point, bottom_right: Point) -> List[Point]:
+    """
+    Args:
+        top_left: top left Point
+        bottom_right: bottom right Point
+    Returns: a new Point list with top_right and bottom left computed such that a bounding box can be computed.
+    """
+    top_left_x, top_left_y = top_left
+    bottom_right_x, bottom_right_y = bottom_right
+    box_width = bottom_right_x - top_left_x
+    top_right = (top_left_x + box_width, top_left_y)
+    bottom_left = (bottom_right_x - box_width, bottom_right_y)
+    box_cornerstones: list = [top_left, bottom_right, top_right, bottom_left]
+    return box_cornerstones
+
@@ -1,31 +1,252 @@
 """
 This python file provides access methods to the mongoDB database.
 They are separated into two methods for each collection because these are the only used collections.
+
+The MongoClient is pooled per process: it is thread-safe and keeps its own connection pool, but must not be shared
+across a fork. Documents are written through a BufferedWriter, which collects them and inserts them in bulk.
 """
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
 from pymongo import MongoClient
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import BulkWriteError, ConnectionFailure
 
 # Connection defaults
 MONGO_CONNECTION_DEFAULT = "mongodb://localhost:17270/?readPreference=primary&ssl=false"
 COLLECTION_CASCADE_TABNET_DEFAULT = "cascadeTabNet"
 DATABASE_SHARED_FILE_FORMAT_DEFAULT = "shared_file_format"
 
+# BufferedWriter defaults
+FLUSH_SIZE_DEFAULT = 100
+FLUSH_INTERVAL_DEFAULT = 2.0
+MAX_RETRIES_DEFAULT = 5
+RETRY_BACKOFF_DEFAULT = 0.5
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+# called with True once the document is written, with False if it was dropped
+WriteCallback = Callable[[bool], None]
+
+__clients: Dict[str, MongoClient] = {}
+__clients_pid: Optional[int] = None
+__clients_lock = threading.Lock()
+
+
+def get_client(mongo_connection: str) -> MongoClient:
+    """
+    Args:
+        mongo_connection: mongodb connection string
+    Returns: the process wide client for this connection string
+    """
+    global __clients_pid
+    with __clients_lock:
+        if __clients_pid != os.getpid():
+            # inherited clients of the parent process are not usable after a fork
+            __clients.clear()
+            __clients_pid = os.getpid()
+        client: Optional[MongoClient] = __clients.get(mongo_connection)
+        if client is None:
+            client = MongoClient(mongo_connection)
+            __clients[mongo_connection] = client
+        return client
+
 
 class Connection:
     __mongo_connection: str
     __collection_cascade_tab_net: str
     __database_shared_file_format: str
+    __client: Optional[MongoClient]
 
     def __init__(self, connection_oplog: str = MONGO_CONNECTION_DEFAULT,
                  collection_diff: str = COLLECTION_CASCADE_TABNET_DEFAULT,
-                 database_local: str = DATABASE_SHARED_FILE_FORMAT_DEFAULT):
+                 database_local: str = DATABASE_SHARED_FILE_FORMAT_DEFAULT,
+                 client: Optional[MongoClient] = None):
+        """
+        Args:
+            client: client to use instead of the pooled client, e.g. a mongomock.MongoClient
+        """
         self.__mongo_connection = connection_oplog
         self.__collection_cascade_tab_net = collection_diff
         self.__database_shared_file_format = database_local
+        self.__client = client
 
     def get_db(self) -> Database:
-        return MongoClient(self.__mongo_connection).get_database(self.__database_shared_file_format)
+        client: MongoClient = self.__client if self.__client is not None else get_client(self.__mongo_connection)
+        return client.get_database(self.__database_shared_file_format)
 
     def get_collection(self) -> Collection:
         return self.get_db().get_collection(self.__collection_cascade_tab_net)
+
+    def get_writer(self, **kwargs) -> 'BufferedWriter':
+        """
+        Returns: a new BufferedWriter for the collection, kwargs are passed to BufferedWriter
+        """
+        return BufferedWriter(self.get_collection(), **kwargs)
+
+
+class BufferedWriter:
+    """
+    Write-behind buffer for a collection.
+    insert() only appends the document to the buffer. A background thread writes the buffer with
+    insert_many(ordered=False) as soon as flush_size documents are buffered or flush_interval seconds passed.
+    Transient errors (lost connections, timeouts) are retried with exponential backoff, documents which fail with any
+    other error are logged and dropped. The callback of a document reports whether it was written, such that the caller
+    can defer everything which assumes the document is stored.
+    """
+    __collection: Collection
+    __flush_size: int
+    __flush_interval: float
+    __max_retries: int
+    __retry_backoff: float
+    __max_buffered: int
+    __buffer: List[Tuple[dict, Optional[WriteCallback]]]
+    __closed: bool
+    # False as soon as the background thread ended, after close() or because it died
+    __running: bool
+
+    def __init__(self, collection: Collection, flush_size: int = FLUSH_SIZE_DEFAULT,
+                 flush_interval: float = FLUSH_INTERVAL_DEFAULT, max_retries: int = MAX_RETRIES_DEFAULT,
+                 retry_backoff: float = RETRY_BACKOFF_DEFAULT, max_buffered: Optional[int] = None):
+        """
+        Args:
+            collection: collection to insert the documents into
+            flush_size: number of buffered documents which triggers a write
+            flush_interval: maximum seconds a document stays in the buffer
+            max_retries: attempts for a write which fails with a transient error
+            retry_backoff: seconds to wait before the first retry, doubled for every further retry
+            max_buffered: insert() blocks while this many documents are buffered, defaults to 10 * flush_size
+        """
+        self.__collection = collection
+        self.__flush_size = flush_size
+        self.__flush_interval = flush_interval
+        self.__max_retries = max_retries
+        self.__retry_backoff = retry_backoff
+        self.__max_buffered = max_buffered or 10 * flush_size
+        self.__buffer = []
+        self.__closed = False
+        self.__running = True
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name="mongo-writer", daemon=True)
+        self.__thread.start()
+
+    def __enter__(self) -> 'BufferedWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def insert(self, document: dict, callback: Optional[WriteCallback] = None):
+        """
+        Buffers a document for insertion. Blocks while the buffer is full.
+        Args:
+            document: document to insert, the writer adds its _id
+            callback: called with True once the document is written and with False if it was dropped, by the thread
+                which writes the document (usually the background thread)
+        """
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("Can't insert into a closed BufferedWriter.")
+            self.__condition.wait_for(lambda: len(self.__buffer) < self.__max_buffered or not self.__running)
+            self.__check_running()
+            self.__buffer.append((document, callback))
+            if len(self.__buffer) >= self.__flush_size:
+                self.__condition.notify_all()
+
+    def flush(self):
+        """
+        Writes all buffered documents synchronously. The callbacks of the documents report the outcome.
+        """
+        with self.__condition:
+            self.__check_running()
+        self.__write_entries(self.__take())
+
+    def close(self):
+        """
+        Stops the background thread and writes the remaining documents.
+        """
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+        self.flush()
+
+    def __check_running(self):
+        # the buffer isn't written anymore if the background thread died, callers must not wait for it
+        if not self.__running and not self.__closed:
+            raise RuntimeError("The background thread of the BufferedWriter died, see the log for the error.")
+
+    def __take(self) -> List[Tuple[dict, Optional[WriteCallback]]]:
+        with self.__condition:
+            entries: List[Tuple[dict, Optional[WriteCallback]]] = self.__buffer
+            self.__buffer = []
+            self.__condition.notify_all()
+            return entries
+
+    def __run(self):
+        try:
+            while True:
+                with self.__condition:
+                    self.__condition.wait_for(lambda: self.__closed or len(self.__buffer) >= self.__flush_size,
+                                              timeout=self.__flush_interval)
+                    if self.__closed:
+                        return
+                self.__write_entries(self.__take())
+        except BaseException:
+            logger.exception("The background thread of the BufferedWriter died.")
+            raise
+        finally:
+            with self.__condition:
+                self.__running = False
+                self.__condition.notify_all()
+
+    def __write_entries(self, entries: List[Tuple[dict, Optional[WriteCallback]]]):
+        if len(entries) == 0:
+            return
+        documents: List[dict] = [document for document, _ in entries]
+        try:
+            failed: Set[int] = self.__write(documents)
+        except Exception:
+            logger.exception("Dropping {} documents which couldn't be inserted.", len(documents))
+            failed = set(range(len(documents)))
+        for index, (_, callback) in enumerate(entries):
+            if callback is None:
+                continue
+            try:
+                callback(index not in failed)
+            except Exception:
+                # the remaining callbacks and the writer thread must not depend on a single caller
+                logger.exception("The write callback of a document failed.")
+
+    def __write(self, documents: List[dict]) -> Set[int]:
+        """
+        Returns: indices of the documents which couldn't be inserted
+        """
+        for attempt in range(self.__max_retries + 1):
+            try:
+                self.__collection.insert_many(documents, ordered=False)
+                logger.debug("Inserted {} documents.", len(documents))
+                return set()
+            except BulkWriteError as error:
+                # with ordered=False all other documents were written. Duplicates stem from a retried write which
+                # reached the server before the connection was lost.
+                write_errors: List[dict] = [write_error for write_error in error.details.get("writeErrors", [])
+                                            if write_error.get("code") != DUPLICATE_KEY_ERROR_CODE]
+                for write_error in write_errors:
+                    logger.error("Couldn't insert document: {}", write_error.get("errmsg"))
+                return {write_error["index"] for write_error in write_errors}
+            except ConnectionFailure as error:
+                if attempt == self.__max_retries:
+                    logger.error("Giving up to insert {} documents after {} retries: {}", len(documents),
+                                 self.__max_retries, error)
+                    return set(range(len(documents)))
+                backoff: float = self.__retry_backoff * 2 ** attempt
+                logger.warning("Inserting {} documents failed ({}), retrying in {} seconds.", len(documents), error,
+                               backoff)
+                time.sleep(backoff)
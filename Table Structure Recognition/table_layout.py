@@ -0,0 +1,126 @@
+"""
+Intermediate representation of a recognized table.
+
+The structure recognition creates a TableLayout without touching the shared_file_format document. The text of the
+cells is recognized in a separate step and the layout is added to the document at last. This way structure recognition,
+OCR and persistence can run in separate pipeline stages.
+Every layout knows the page it was recognized on, such that the pages of a multi-page file are recognized one at a
+time and end up in a single document.
+A TableRegion holds a layout in the coordinates of an image region, e.g. a full resolution crop of the table, until its
+text is recognized. Afterwards the layout is translated into page coordinates.
+"""
+from dataclasses import dataclass, field, replace
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from pytesseract import pytesseract
+
+from docrecjson.elements import Document, Cell
+
+
+@dataclass
+class CellLayout:
+    # cell polygon as it is added to the document
+    polygon: List[Tuple[int, int]]
+    # the row and column span is None for detected cells without a recognized table structure
+    start_row: Optional[int]
+    end_row: Optional[int]
+    start_col: Optional[int]
+    end_col: Optional[int]
+    # [top_left_x, top_left_y, bottom_right_x, bottom_right_y] of the image region the text is recognized from,
+    # None skips the text recognition
+    text_region: Optional[Tuple[int, int, int, int]]
+    text: Optional[str] = None
+
+
+@dataclass
+class TableLayout:
+    # table polygon as it is added to the document
+    polygon: List[Tuple[int, int]]
+    # None if no table was detected and the layout only holds the detected cells
+    bordered: Optional[bool]
+    cells: List[CellLayout] = field(default_factory=list)
+    # one based page number within the file
+    page: int = 1
+
+
+@dataclass
+class TableRegion:
+    # layout in the coordinates of image
+    layout: TableLayout
+    # image the layout was recognized on, None for layouts without text recognition
+    image: Optional[np.ndarray]
+    # (x, y) of the top left corner of image in page coordinates
+    offset: Tuple[int, int] = (0, 0)
+
+
+def translate_layout(layout: TableLayout, offset_x: int, offset_y: int) -> TableLayout:
+    """
+    Returns: a copy of the layout with all coordinates moved by the offset
+    """
+    if offset_x == 0 and offset_y == 0:
+        return layout
+
+    def translate(polygon: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        return [(int(x) + offset_x, int(y) + offset_y) for x, y in polygon]
+
+    cells: List[CellLayout] = []
+    for cell in layout.cells:
+        text_region: Optional[Tuple[int, int, int, int]] = None
+        if cell.text_region is not None:
+            x1, y1, x2, y2 = cell.text_region
+            text_region = (x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y)
+        cells.append(replace(cell, polygon=translate(cell.polygon), text_region=text_region))
+    return replace(layout, polygon=translate(layout.polygon), cells=cells)
+
+
+def recognize_region_text(region: TableRegion, ocr: Callable = pytesseract.image_to_string) -> TableLayout:
+    """
+    Recognizes the text of the cells on the region image.
+    Returns: the layout with the text of every cell, in page coordinates
+    """
+    if region.image is not None:
+        recognize_text(region.layout, region.image, ocr)
+    return translate_layout(region.layout, *region.offset)
+
+
+def recognize_text(layout: TableLayout, image, ocr: Callable = pytesseract.image_to_string) -> TableLayout:
+    """
+    Args:
+        layout: table layout of the image
+        image: image the layout was recognized on, read with cv2.imread
+        ocr: text recognition for a single cell image
+    Returns: the layout with the text of every cell
+    """
+    for cell in layout.cells:
+        if cell.text_region is None:
+            continue
+        # todo add pytesseract preprocessing?
+        # https://github.com/NanoNets/ocr-with-tesseract/blob/master/tesseract-tutorial.ipynb
+        top_left_x, top_left_y, bottom_right_x, bottom_right_y = cell.text_region
+        # [y1:y2, x1:x2]
+        cell.text = ocr(image[top_left_y:bottom_right_y, top_left_x:bottom_right_x])
+    return layout
+
+
+def add_table_layout(document: Document, layout: TableLayout) -> Document:
+    """
+    Args:
+        document: shared-file-document to add the table to
+        layout: recognized table layout
+    Returns: document with added Table
+    """
+    cells: List[Cell] = []
+    for cell in layout.cells:
+        if cell.start_row is None:
+            cells.append(document.add_cell(cell.polygon, source='prediction'))
+        else:
+            cells.append(document.add_cell(cell.polygon, cell.start_row, cell.end_row, cell.start_col, cell.end_col,
+                                           source='prediction', text=cell.text))
+
+    table = document.add_table(layout.polygon, cells, source='prediction')
+    casctabnet_metadata: dict = {
+        "CascadeTabNet Border": {"bordered": str(layout.bordered is True), "borderless": str(layout.bordered is False)},
+        "CascadeTabNet Page": {"page": str(layout.page)}}
+    document.add_content_metadata(casctabnet_metadata, group_ref=table, parent_ref=table.oid)
+    return document
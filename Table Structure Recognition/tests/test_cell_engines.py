@@ -0,0 +1,103 @@
+"""
+Cell formation engines of extract_table on grids given by their lines, like line_detection returns them.
+Run from Table Structure Recognition with: python -m pytest tests
+"""
+import os
+import sys
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from Functions.borderFunc import form_cells_lattice, form_cells_legacy, form_cells_raster, \
+    intersection_points  # noqa: E402
+
+CELL_WIDTH: int = 80
+CELL_HEIGHT: int = 30
+# pixels around the table box in the line mask of the raster engine
+MARGIN: int = 20
+
+
+def grid(rows: int = 3, columns: int = 3) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    Returns: horizontal and vertical lines of a regular grid
+    """
+    hor: List[List[int]] = [[0, row * CELL_HEIGHT, columns * CELL_WIDTH, row * CELL_HEIGHT] for row in range(rows + 1)]
+    ver: List[List[int]] = [[column * CELL_WIDTH, 0, column * CELL_WIDTH, rows * CELL_HEIGHT]
+                            for column in range(columns + 1)]
+    return hor, ver
+
+
+def cells(engine, hor: List[List[int]], ver: List[List[int]]) -> List[List]:
+    return engine(intersection_points(ver, hor))
+
+
+def assert_equivalent(hor: List[List[int]], ver: List[List[int]], expected_cells: int):
+    lattice: List[List] = cells(form_cells_lattice, hor, ver)
+    assert lattice == cells(form_cells_legacy, hor, ver)
+    assert len(lattice) == expected_cells
+
+
+def test_regular_grid():
+    hor, ver = grid()
+    assert_equivalent(hor, ver, 9)
+    hor, ver = grid(50, 20)
+    assert_equivalent(hor, ver, 1000)
+
+
+def test_row_span():
+    hor, ver = grid()
+    # the first column spans the first two rows, the line between them starts at the second column
+    hor[1] = [CELL_WIDTH, CELL_HEIGHT, 3 * CELL_WIDTH, CELL_HEIGHT]
+    assert_equivalent(hor, ver, 8)
+    assert [0, 0, 0, 60, 80, 0, 80, 60] in cells(form_cells_lattice, hor, ver)
+
+
+def test_missing_border():
+    hor, ver = grid()
+    # without the left border, the first column isn't closed
+    assert_equivalent(hor, ver[1:], 6)
+    # without the top border
+    assert_equivalent(hor[1:], ver, 6)
+    # only row rules and inner column lines, the outer columns are open
+    assert_equivalent(hor, ver[1:-1], 3)
+
+
+def test_column_span():
+    hor, ver = grid()
+    # the first two columns of the second row are one cell, the inner line stops at the row rules
+    ver = [ver[0], [CELL_WIDTH, 0, CELL_WIDTH, CELL_HEIGHT], [CELL_WIDTH, 2 * CELL_HEIGHT, CELL_WIDTH, 3 * CELL_HEIGHT],
+           ver[2], ver[3]]
+    lattice: List[List] = cells(form_cells_lattice, hor, ver)
+    legacy: List[List] = cells(form_cells_legacy, hor, ver)
+    spanning_cell: List[int] = [0, 30, 0, 60, 160, 30, 160, 60]
+    cell_below: List[int] = [0, 60, 0, 90, 80, 60, 80, 90]
+    # the lattice keeps the spanning cell, legacy drops it together with the cell below it
+    assert spanning_cell in lattice and cell_below in lattice
+    assert spanning_cell not in legacy and cell_below not in legacy
+    assert sorted(cell for cell in lattice if cell not in (spanning_cell, cell_below)) == sorted(legacy)
+
+
+def line_mask(hor: List[List[int]], ver: List[List[int]], rows: int = 3, columns: int = 3) -> np.ndarray:
+    """
+    Returns: line mask of the lines with MARGIN pixels around the table box, like line_mask returns it
+    """
+    mask: np.ndarray = np.zeros((rows * CELL_HEIGHT + 2 * MARGIN + 1, columns * CELL_WIDTH + 2 * MARGIN + 1),
+                                dtype=np.uint8)
+    for x1, y1, x2, y2 in hor + ver:
+        cv2.line(mask, (x1 + MARGIN, y1 + MARGIN), (x2 + MARGIN, y2 + MARGIN), 255, 1)
+    return mask
+
+
+def test_raster_frame():
+    hor, ver = grid()
+    expected: List[List] = sorted(cells(form_cells_lattice, hor, ver))
+    table_box: Tuple[int, int, int, int] = (MARGIN, MARGIN, MARGIN + 3 * CELL_WIDTH, MARGIN + 3 * CELL_HEIGHT)
+    # the ring between the border of the mask and the outer frame isn't a cell
+    assert form_cells_raster(line_mask(hor, ver), (-MARGIN, -MARGIN)) == expected
+    # without the outer columns the mask is closed with the table box, the edge cells are kept
+    assert form_cells_raster(line_mask(hor, ver[1:-1]), (-MARGIN, -MARGIN), table_box) == expected
+    # without any outer border
+    assert form_cells_raster(line_mask(hor[1:-1], ver[1:-1]), (-MARGIN, -MARGIN), table_box) == expected
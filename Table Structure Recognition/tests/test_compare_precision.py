@@ -0,0 +1,38 @@
+"""
+Scoring of the accuracy gate Evaluations/Tablebank/compare_precision.py.
+Run from Table Structure Recognition with: python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Evaluations", "Tablebank"))
+
+from compare_precision import score_tables  # noqa: E402
+
+GROUND_TRUTH = [[0, 0, 99, 99], [200, 200, 299, 299]]
+
+
+def test_all_tables_detected():
+    precisions, recalls = score_tables(np.array(GROUND_TRUTH), GROUND_TRUTH)
+    assert precisions == [1.0, 1.0]
+    assert recalls == [1.0, 1.0]
+
+
+def test_missed_table_lowers_recall():
+    precisions, recalls = score_tables(np.array(GROUND_TRUTH[:1]), GROUND_TRUTH)
+    assert precisions == [1.0]
+    assert sorted(recalls) == [0.0, 1.0]
+
+
+def test_no_table_detected():
+    precisions, recalls = score_tables(np.zeros((0, 4)), GROUND_TRUTH)
+    assert precisions == []
+    assert recalls == [0.0, 0.0]
+
+
+def test_no_ground_truth():
+    precisions, recalls = score_tables(np.array(GROUND_TRUTH[:1]), [])
+    assert precisions == [0.0]
+    assert recalls == [0.0]
@@ -0,0 +1,127 @@
+"""
+BufferedWriter of the shared_file_format database against mongomock.
+Run from Table Structure Recognition with: python -m pytest tests
+"""
+import os
+import sys
+import threading
+from typing import List
+
+import mongomock
+import pytest
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from shared_file_format.database.db import BufferedWriter, Connection  # noqa: E402
+
+# seconds to wait for the background thread of the writer
+TIMEOUT: float = 5.0
+
+
+class Outcomes:
+    """
+    Collects the results of the write callbacks.
+    """
+
+    def __init__(self, expected: int):
+        self.results: List[bool] = []
+        self.__expected = expected
+        self.__done = threading.Event()
+
+    def callback(self, written: bool):
+        self.results.append(written)
+        if len(self.results) == self.__expected:
+            self.__done.set()
+
+    def wait(self) -> bool:
+        return self.__done.wait(TIMEOUT)
+
+
+class FlakyCollection:
+    """
+    Inserts the first batch but reports a lost connection, like a write which reached the server before the
+    connection was lost.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = 0
+
+    def insert_many(self, documents: List[dict], ordered: bool = True):
+        self.calls += 1
+        self.collection.insert_many(documents, ordered=ordered)
+        if self.calls == 1:
+            raise ConnectionFailure("connection lost")
+
+
+class RejectingCollection:
+    """
+    Rejects the second document of every batch with a validation error.
+    """
+
+    def insert_many(self, documents: List[dict], ordered: bool = True):
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "errmsg": "Document failed validation"}]})
+
+
+def connection() -> Connection:
+    return Connection(client=mongomock.MongoClient())
+
+
+def test_flush_by_size():
+    database: Connection = connection()
+    outcomes: Outcomes = Outcomes(2)
+    with database.get_writer(flush_size=2, flush_interval=60) as writer:
+        writer.insert({"page": 1}, outcomes.callback)
+        writer.insert({"page": 2}, outcomes.callback)
+        assert outcomes.wait()
+        assert database.get_collection().count_documents({}) == 2
+    assert outcomes.results == [True, True]
+
+
+def test_flush_by_interval():
+    database: Connection = connection()
+    outcomes: Outcomes = Outcomes(1)
+    with database.get_writer(flush_size=100, flush_interval=0.05) as writer:
+        writer.insert({"page": 1}, outcomes.callback)
+        assert outcomes.wait()
+        assert database.get_collection().count_documents({}) == 1
+    assert outcomes.results == [True]
+
+
+def test_duplicate_key_retry():
+    database: Connection = connection()
+    collection: FlakyCollection = FlakyCollection(database.get_collection())
+    outcomes: Outcomes = Outcomes(3)
+    with BufferedWriter(collection, flush_size=3, flush_interval=60, retry_backoff=0) as writer:
+        for page in range(3):
+            writer.insert({"page": page}, outcomes.callback)
+        assert outcomes.wait()
+    # the retry only hit duplicate keys, the documents are written once and reported as written
+    assert collection.calls == 2
+    assert database.get_collection().count_documents({}) == 3
+    assert outcomes.results == [True, True, True]
+
+
+def test_rejected_document():
+    outcomes: Outcomes = Outcomes(2)
+    with BufferedWriter(RejectingCollection(), flush_size=2, flush_interval=60) as writer:
+        writer.insert({"page": 0}, outcomes.callback)
+        writer.insert({"page": 1}, outcomes.callback)
+        assert outcomes.wait()
+    # the callbacks are called in the order of the inserts, only the rejected document failed
+    assert outcomes.results == [True, False]
+
+
+def test_close():
+    database: Connection = connection()
+    outcomes: Outcomes = Outcomes(3)
+    writer: BufferedWriter = database.get_writer(flush_size=100, flush_interval=60)
+    for page in range(3):
+        writer.insert({"page": page}, outcomes.callback)
+    writer.close()
+    # close writes the remaining documents before it returns
+    assert outcomes.results == [True, True, True]
+    assert database.get_collection().count_documents({}) == 3
+    with pytest.raises(RuntimeError):
+        writer.insert({"page": 3})
@@ -0,0 +1,145 @@
+"""
+Text layer of born-digital PDFs.
+
+The word boxes of all pages are read once with pdftotext -bbox and scaled from PDF points to the pixel coordinates of
+the rendered page. The words are assigned to the cells of a recognized table by their center, such that the cell text
+doesn't have to be recognized with Tesseract. Pages without a usable text layer (e.g. scans) are still OCRed.
+"""
+import subprocess
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from loguru import logger
+from lxml import etree
+
+from table_layout import TableLayout
+
+# pages with less words are treated as pages without text layer, e.g. a scan with a stamped page number
+MIN_WORDS_PER_PAGE: int = 5
+
+POINTS_PER_INCH: int = 72
+
+XHTML_NAMESPACE: str = "{http://www.w3.org/1999/xhtml}"
+
+
+@dataclass
+class Word:
+    # bounding box in pixel coordinates of the rendered page
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+    text: str
+
+    @property
+    def center_x(self) -> float:
+        return (self.x1 + self.x2) / 2
+
+    @property
+    def center_y(self) -> float:
+        return (self.y1 + self.y2) / 2
+
+
+class PageWords:
+    """
+    Words of a single page, indexed by their vertical center.
+    """
+    __words: List[Word]
+    __centers_y: List[float]
+    # position of every word in reading order
+    __order: Dict[int, int]
+
+    def __init__(self, words: List[Word]):
+        self.__order = {id(word): position for position, word in enumerate(words)}
+        self.__words = sorted(words, key=lambda word: word.center_y)
+        self.__centers_y = [word.center_y for word in self.__words]
+
+    def __len__(self) -> int:
+        return len(self.__words)
+
+    def text_in(self, top_left_x: int, top_left_y: int, bottom_right_x: int, bottom_right_y: int) -> str:
+        """
+        Returns: the words whose center lies within the region, in reading order. Lines are separated by newlines.
+        """
+        start: int = bisect_left(self.__centers_y, top_left_y)
+        end: int = bisect_left(self.__centers_y, bottom_right_y)
+        words: List[Word] = sorted((word for word in self.__words[start:end]
+                                    if top_left_x <= word.center_x < bottom_right_x),
+                                   key=lambda word: self.__order[id(word)])
+        text: str = ""
+        previous: Optional[Word] = None
+        for word in words:
+            if previous is not None:
+                text += "\n" if word.center_y > previous.y2 else " "
+            text += word.text
+            previous = word
+        return text
+
+
+class TextLayer:
+    """
+    Word boxes of all pages of a pdf. The pdf is read once, on the first access.
+    """
+    __filepath: str
+    __dpi: int
+    __pages: Optional[List[Optional[PageWords]]]
+
+    def __init__(self, filepath: str, dpi: int):
+        """
+        Args:
+            filepath: pdf file
+            dpi: resolution the pages are rendered with, the words are scaled to it
+        """
+        self.__filepath = filepath
+        self.__dpi = dpi
+        self.__pages = None
+        self.__lock = threading.Lock()
+
+    def page_words(self, index: int) -> Optional[PageWords]:
+        """
+        Args:
+            index: zero based page index
+        Returns: the words of the page, None if the page has no usable text layer
+        """
+        with self.__lock:
+            if self.__pages is None:
+                self.__pages = self.__read()
+        return self.__pages[index] if index < len(self.__pages) else None
+
+    def __read(self) -> List[Optional[PageWords]]:
+        try:
+            output: bytes = subprocess.run(["pdftotext", "-bbox", self.__filepath, "-"], stdout=subprocess.PIPE,
+                                           stderr=subprocess.PIPE, check=True).stdout
+        except (OSError, subprocess.CalledProcessError) as error:
+            logger.warning("Couldn't read the text layer of [{}], falling back to OCR: {}", self.__filepath, error)
+            return []
+        root = etree.fromstring(output, parser=etree.XMLParser(recover=True, huge_tree=True))
+        if root is None:
+            return []
+        scale: float = self.__dpi / POINTS_PER_INCH
+        pages: List[Optional[PageWords]] = []
+        for page in root.iter(XHTML_NAMESPACE + "page"):
+            words: List[Word] = [Word(float(word.get("xMin")) * scale, float(word.get("yMin")) * scale,
+                                      float(word.get("xMax")) * scale, float(word.get("yMax")) * scale, word.text)
+                                 for word in page.iter(XHTML_NAMESPACE + "word") if word.text]
+            pages.append(PageWords(words) if len(words) >= MIN_WORDS_PER_PAGE else None)
+        logger.debug("Read the text layer of [{}]: {} of {} pages have text.", self.__filepath,
+                     sum(page is not None for page in pages), len(pages))
+        return pages
+
+
+def assign_words(layout: TableLayout, words: PageWords) -> TableLayout:
+    """
+    Sets the text of every cell to the words of its text region.
+    Args:
+        layout: table layout in page coordinates
+        words: words of the page the table is on
+    Returns: the layout with the text of every cell
+    """
+    for cell in layout.cells:
+        if cell.text_region is None:
+            continue
+        cell.text = words.text_in(*cell.text_region)
+    return layout
@@ -0,0 +1,248 @@
+"""
+Multi-process worker pool for the extraction daemon.
+
+Every worker process builds its own state once (e.g. a TableRecognizer with the warm model) and then handles the
+submitted items one after another. The number of worker processes follows the backlog depth between a minimum and a
+maximum, and the intra-op threads of torch and OpenCV are limited per worker such that the pool does not oversubscribe
+the available cores.
+"""
+import math
+import multiprocessing
+import os
+from contextlib import contextmanager
+from queue import Empty
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from loguru import logger
+
+FILES_PER_WORKER_DEFAULT: int = 2
+
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+@contextmanager
+def _thread_environment(num_threads: int) -> Iterator[None]:
+    """
+    Sets the thread limits of the OpenMP and BLAS runtimes for the processes spawned inside of the block.
+    The runtimes read them once when torch and cv2 are imported, which the spawned worker does while it unpickles its
+    target, before limit_threads runs.
+    """
+    previous: Dict[str, Optional[str]] = {variable: os.environ.get(variable) for variable in THREAD_VARIABLES}
+    os.environ.update({variable: str(num_threads) for variable in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for variable, value in previous.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+
+def limit_threads(num_threads: int):
+    """
+    Limits the intra-op threads of torch and OpenCV in the current process.
+    Has to be called before the model is built. The OpenMP and BLAS runtimes are limited by the environment the pool
+    spawns the worker with, see _thread_environment.
+    """
+    import cv2
+    import torch
+    cv2.setNumThreads(num_threads)
+    torch.set_num_threads(num_threads)
+
+
+def _worker_main(task_queue, done_queue, started_queue, initializer: Callable[..., Any], initargs: Sequence,
+                 task: Callable[[Any, Any], None], num_threads: int, finalizer: Optional[Callable[[Any], None]]):
+    limit_threads(num_threads)
+    state = initializer(*initargs)
+    logger.info("Worker [{}] ready with {} threads.", os.getpid(), num_threads)
+    try:
+        while True:
+            item = task_queue.get()
+            if item is None:
+                break
+            # written synchronously, such that the pool knows the item even if the worker crashes while processing it
+            started_queue.put((os.getpid(), item))
+            try:
+                task(state, item)
+            except Exception:
+                logger.exception("Worker [{}] failed to process [{}]", os.getpid(), item)
+            finally:
+                done_queue.put((os.getpid(), item))
+    finally:
+        # multiprocessing exits the worker with os._exit, atexit handlers would not run
+        if finalizer is not None:
+            finalizer(state)
+    logger.info("Worker [{}] stopped.", os.getpid())
+
+
+class WorkerPool:
+    """
+    Fans submitted items out to worker processes.
+    initializer(*initargs) is executed once per worker, task(state, item) for every item and finalizer(state) when the
+    worker stops. All of them have to be importable module level functions because the workers are spawned.
+    The item a worker was processing when it crashed is completed as failed.
+    """
+    __min_workers: int
+    __max_workers: int
+    __threads_per_worker: int
+    __files_per_worker: int
+    __workers: List[multiprocessing.Process]
+    __pending_stops: int
+    __backlog: int
+    # items which were started but not completed per worker pid
+    __in_flight: Dict[int, List]
+    # completed items which were not handed out by completed yet
+    __completed: List
+
+    def __init__(self, initializer: Callable[..., Any], task: Callable[[Any, Any], None], initargs: Sequence = (),
+                 max_workers: int = 1, min_workers: int = 1, threads_per_worker: Optional[int] = None,
+                 files_per_worker: int = FILES_PER_WORKER_DEFAULT,
+                 finalizer: Optional[Callable[[Any], None]] = None):
+        """
+        Args:
+            initializer: builds the state of a worker, e.g. loads the model
+            task: handles a single item with the state of the worker
+            initargs: arguments for the initializer
+            max_workers: upper limit of worker processes
+            min_workers: worker processes which are kept alive even without backlog
+            threads_per_worker: intra-op threads per worker, defaults to an equal share of the cores
+            files_per_worker: backlog per worker before another worker is started
+            finalizer: releases the state of a worker when it stops, e.g. flushes buffered writes
+        """
+        if not 1 <= min_workers <= max_workers:
+            raise ValueError("Expected 1 <= min_workers <= max_workers, got min_workers=" + str(
+                min_workers) + " and max_workers=" + str(max_workers) + ".")
+        self.__context = multiprocessing.get_context("spawn")
+        self.__task_queue = self.__context.Queue()
+        self.__done_queue = self.__context.Queue()
+        self.__started_queue = self.__context.SimpleQueue()
+        self.__initializer = initializer
+        self.__task = task
+        self.__initargs = tuple(initargs)
+        self.__finalizer = finalizer
+        self.__min_workers = min_workers
+        self.__max_workers = max_workers
+        self.__threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // max_workers)
+        self.__files_per_worker = files_per_worker
+        self.__workers = []
+        self.__pending_stops = 0
+        self.__backlog = 0
+        self.__in_flight = {}
+        self.__completed = []
+        self.autoscale()
+
+    @property
+    def backlog(self) -> int:
+        """
+        Returns: number of submitted items which are not completed yet
+        """
+        return self.__backlog
+
+    @property
+    def size(self) -> int:
+        """
+        Returns: number of worker processes which keep on taking items
+        """
+        return len(self.__workers) - self.__pending_stops
+
+    def submit(self, item):
+        self.__task_queue.put(item)
+        self.__backlog += 1
+
+    def completed(self, timeout: Optional[float] = None) -> List:
+        """
+        Args:
+            timeout: seconds to wait for the first completed item, None returns immediately
+        Returns: the items which were completed (successfully or not) since the last call
+        """
+        self.__collect(timeout if len(self.__completed) == 0 else None)
+        items: List = self.__completed
+        self.__completed = []
+        self.__backlog -= len(items)
+        return items
+
+    def autoscale(self):
+        """
+        Starts or stops workers according to the current backlog.
+        Stopped workers finish the items which were submitted before.
+        """
+        self.__reap()
+        desired: int = math.ceil(self.__backlog / self.__files_per_worker)
+        desired = min(self.__max_workers, max(self.__min_workers, desired))
+        if desired > self.size:
+            for _ in range(desired - self.size):
+                self.__start_worker()
+            logger.info("Scaled worker pool up to {} workers (backlog: {}).", self.size, self.__backlog)
+        elif desired < self.size and self.__backlog < self.size:
+            # only shrink if there are idle workers, starting a worker costs a full model load
+            for _ in range(self.size - desired):
+                self.__task_queue.put(None)
+                self.__pending_stops += 1
+            logger.info("Scaled worker pool down to {} workers (backlog: {}).", self.size, self.__backlog)
+
+    def shutdown(self):
+        for _ in range(self.size):
+            self.__task_queue.put(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__workers = []
+        self.__pending_stops = 0
+
+    def __start_worker(self):
+        worker = self.__context.Process(target=_worker_main,
+                                        args=(self.__task_queue, self.__done_queue, self.__started_queue,
+                                              self.__initializer, self.__initargs, self.__task,
+                                              self.__threads_per_worker, self.__finalizer),
+                                        daemon=True)
+        with _thread_environment(self.__threads_per_worker):
+            worker.start()
+        self.__workers.append(worker)
+
+    def __collect(self, timeout: Optional[float]):
+        """
+        Moves the items which are done into the completed items.
+        Args:
+            timeout: seconds to wait for the first done item, None doesn't wait
+        """
+        try:
+            if timeout is not None:
+                self.__complete(*self.__done_queue.get(timeout=timeout))
+            while True:
+                self.__complete(*self.__done_queue.get_nowait())
+        except Empty:
+            pass
+
+    def __collect_started(self):
+        while not self.__started_queue.empty():
+            pid, item = self.__started_queue.get()
+            self.__in_flight.setdefault(pid, []).append(item)
+
+    def __complete(self, pid: int, item):
+        # the worker reported the start before it put the item into the done queue
+        self.__collect_started()
+        in_flight: List = self.__in_flight.get(pid, [])
+        if item in in_flight:
+            in_flight.remove(item)
+        self.__completed.append(item)
+
+    def __reap(self):
+        # the items the dead workers finished before they died are not failed
+        self.__collect(None)
+        self.__collect_started()
+        alive: List[multiprocessing.Process] = []
+        for worker in self.__workers:
+            if worker.is_alive():
+                alive.append(worker)
+                continue
+            in_flight: List = self.__in_flight.pop(worker.pid, [])
+            if worker.exitcode != 0:
+                logger.error("Worker [{}] died with exit code {}.", worker.pid, worker.exitcode)
+                # the done queue of a crashed worker may lose its last items, they are failed as well
+                for item in in_flight:
+                    logger.error("Worker [{}] died before it reported [{}] as done, completing it as failed.",
+                                 worker.pid, item)
+                self.__completed += in_flight
+            else:
+                self.__pending_stops = max(0, self.__pending_stops - 1)
+        self.__workers = alive